@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Voltic User Guide DOCX generator: synthetic documents built
+from the script's emitters at growing scales, plus the full guide build,
+written through the same package writer as the real builds (optionally
+streaming, deterministic or patching). Reports wall time, peak RSS and
+output size, and gates against a baseline.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import create_formatted_docx as guide
+
+DEFAULT_SCALES = (100, 1000, 10000)
+DEFAULT_THRESHOLD = 0.15
+# Per-scale size of each unit of work, so every case finishes in similar time
+TABLE_ROWS = 5
+TABLE_COLS = 4
+LINK_HOSTS = 50
+
+# ==================== SYNTHETIC GENERATORS ====================
+
+# Each generator takes the StreamingDocxWriter of a --stream case (else None)
+# and flushes through it the way the real --stream builds do
+
+def each(items, writer):
+    """Iterate `items`, flushing a streaming writer's finished blocks in batches"""
+    return writer.flushing(items) if writer else items
+
+def bench_headings(doc, n, writer=None):
+    """n headings cycling through levels 1-3"""
+    for i in each(range(n), writer):
+        guide.add_heading(doc, f"Section {i}: Campaign Insights", level=i % 3 + 1)
+
+def bench_runs(doc, n, writer=None):
+    """n paragraphs of plain, bold, italic and code runs"""
+    for i in each(range(n), writer):
+        p = guide.add_paragraph(doc)
+        guide.add_run(p, f"Step {i}: ", 'label-bold')
+        guide.add_run(p, "open the campaign and review ")
+        guide.add_run(p, "spend pacing", 'emphasis')
+        guide.add_run(p, " via ")
+        guide.add_run(p, f"/campaigns/{i}", 'code')
+
+def bench_lists(doc, n, writer=None):
+    """n bullet and numbered list paragraphs"""
+    for i in each(range(n), writer):
+        style = 'List Number' if i % 2 else 'List Bullet'
+        guide.add_paragraph(doc, f"Check ad set {i} for audience overlap", style=style)
+
+def bench_hyperlinks(doc, n, writer=None):
+    """n hyperlinks, two per paragraph, over LINK_HOSTS distinct URLs"""
+    for i in each(range(0, n, 2), writer):
+        p = guide.add_paragraph(doc)
+        links = [(f"https://help{j % LINK_HOSTS}.voltic.app/docs/{j % LINK_HOSTS}", f"Article {j}")
+                 for j in range(i, min(i + 2, n))]
+        guide.add_hyperlinks(p, links, " | ")
+
+def bench_table_rows(doc, n, writer=None):
+    """One add_bulk_table() of n rows (a single block, so nothing to flush before the end)"""
+    header = tuple(f"Column {c}" for c in range(TABLE_COLS))
+    rows = ((f"Campaign {r}", "active", f"{r * 1.5:.2f}", str(r)) for r in range(n))
+    guide.add_bulk_table(doc, header, rows)
+
+def bench_add_row(doc, n, writer=None):
+    """One python-docx add_table() filled through add_row(), n rows (a single block)"""
+    table = doc.add_table(rows=1, cols=TABLE_COLS)
+    table.style = 'Light Grid Accent 1'
+    for c, cell in enumerate(table.rows[0].cells):
+        cell.text = f"Column {c}"
+    for r in range(n):
+        cells = table.add_row().cells
+        for c, value in enumerate((f"Campaign {r}", "active", f"{r * 1.5:.2f}", str(r))):
+            cells[c].text = value
+
+def bench_tables(doc, n, writer=None):
+    """n small tables of TABLE_ROWS rows, each with a heading"""
+    header = tuple(f"Column {c}" for c in range(TABLE_COLS))
+    for t in each(range(n), writer):
+        guide.add_heading(doc, f"Table {t}", level=3)
+        guide.add_bulk_table(doc, header, [(f"Row {r}", "a", "b", "c") for r in range(TABLE_ROWS)])
+
+def bench_guide(doc, n, writer=None):
+    """The full create_voltic_user_guide() section set, n copies"""
+    for _ in range(n):
+        for name, add_section in guide.guide_sections():
+            add_section(doc)
+            if writer:
+                writer.flush()
+    # A streaming writer fills in the table of contents itself when it closes
+    if writer is None:
+        guide.add_toc_entries(doc)
+
+# name -> (generator, default scales)
+BENCHMARKS = {
+    'headings': (bench_headings, DEFAULT_SCALES),
+    'runs': (bench_runs, DEFAULT_SCALES),
+    'lists': (bench_lists, DEFAULT_SCALES),
+    'hyperlinks': (bench_hyperlinks, DEFAULT_SCALES),
+    'table-rows': (bench_table_rows, DEFAULT_SCALES + (100000,)),
+    'add-row': (bench_add_row, (100, 1000)),
+    'tables': (bench_tables, (10, 100, 1000)),
+    'guide': (bench_guide, (1, 10)),
+}
+
+# ==================== MEASUREMENT ====================
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+# Package writer options, as create_formatted_docx.py's flags of the same names
+DEFAULT_OPTIONS = {'stream': False, 'deterministic': False, 'patch': False, 'compress_level': None}
+
+def build_package(name, scale, file, options, base=None):
+    """Generate one synthetic document and write it with the guide's package writer"""
+    generate, _ = BENCHMARKS[name]
+    doc = guide.new_guide_document()
+    if options['stream']:
+        # Built inside an open StreamingDocxWriter and flushed as it grows, as the --stream builds are
+        with guide.StreamingDocxWriter(file, doc, options['compress_level'], options['deterministic'],
+                                       base) as writer:
+            generate(doc, scale, writer)
+    else:
+        generate(doc, scale)
+        guide.write_package(doc, file, options['compress_level'], options['deterministic'], base)
+
+def run_case(name, scale, options=DEFAULT_OPTIONS):
+    """Build and write one synthetic document in this process and return its metrics
+
+    With options['patch'], an identical build is written first (untimed) and
+    the measured build patches against it, as a --patch rebuild does.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        base = None
+        if options['patch']:
+            base = os.path.join(scratch, 'base.docx')
+            build_package(name, scale, base, options)
+        started = time.perf_counter()
+        buffer = io.BytesIO()
+        build_package(name, scale, buffer, options, base)
+        wall = time.perf_counter() - started
+    return {'wall': wall, 'rss_mb': peak_rss_mb(), 'size': buffer.tell()}
+
+def measure(name, scale, repeat, options=DEFAULT_OPTIONS):
+    """Best wall time, peak RSS and size of `repeat` runs, each in a fresh interpreter"""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', name, str(scale),
+                              json.dumps(options)],
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.splitlines()[-1]))
+    return {
+        'wall': min(run['wall'] for run in runs),
+        'rss_mb': min(run['rss_mb'] for run in runs),
+        'size': runs[-1]['size'],
+    }
+
+def environment():
+    """Versions the numbers depend on, stored with each baseline"""
+    import docx
+    from lxml import etree
+    return {
+        'python': platform.python_version(),
+        'python-docx': getattr(docx, '__version__', ''),
+        'lxml': etree.__version__,
+        'platform': platform.platform(),
+    }
+
+# ==================== REPORTING & REGRESSION GATE ====================
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024 or unit == 'MB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def print_report(results, baseline=None):
+    print(f"{'benchmark':<22}{'wall':>10}{'peak RSS':>12}{'size':>12}{'vs baseline':>16}")
+    for case, result in results.items():
+        change = ''
+        if baseline and case in baseline:
+            change = f"{result['wall'] / baseline[case]['wall'] - 1:+.0%}"
+        print(f"{case:<22}{result['wall'] * 1000:>8.1f}ms{result['rss_mb']:>9.1f} MB"
+              f"{format_size(result['size']):>12}{change:>16}")
+
+def find_regressions(results, baseline, threshold):
+    """Return a message for each metric that grew more than `threshold` over the baseline"""
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        for metric in ('wall', 'rss_mb', 'size'):
+            if base[metric] and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{case} {metric}: {base[metric]:.4g} -> {result[metric]:.4g} "
+                                   f"({result[metric] / base[metric] - 1:+.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Voltic User Guide DOCX generator")
+    parser.add_argument('-k', '--case', action='append', choices=sorted(BENCHMARKS), metavar='NAME',
+                        help="only run this benchmark (repeatable; default: all)")
+    parser.add_argument('--scales', metavar='N,N,...',
+                        help="override every benchmark's scales, e.g. 100,1000")
+    parser.add_argument('--repeat', type=int, default=3, metavar='N',
+                        help="runs per measurement; the best wall time and RSS are kept (default: 3)")
+    parser.add_argument('--save', metavar='BASELINE',
+                        help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="compare against a JSON baseline and exit 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed growth per metric before failing (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--stream', action='store_true',
+                        help="build each document inside an open StreamingDocxWriter, flushing finished "
+                             "blocks as the --stream builds do")
+    parser.add_argument('--deterministic', action='store_true',
+                        help="write deterministic packages (pinned timestamps, sorted parts, sha256)")
+    parser.add_argument('--patch', action='store_true',
+                        help="time a rebuild that patches an identical earlier build")
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help="zip deflate level (default: zlib's default)")
+    parser.add_argument('--run-case', nargs=3, metavar=('NAME', 'SCALE', 'OPTIONS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        name, scale, options = args.run_case
+        print(json.dumps(run_case(name, int(scale), json.loads(options))))
+        return 0
+    options = {'stream': args.stream, 'deterministic': args.deterministic, 'patch': args.patch,
+               'compress_level': args.compress_level}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            saved = json.load(f)
+        # Baselines from before write options were recorded timed doc.save()
+        if saved.get('options') != options:
+            parser.error(f"{args.compare} was recorded with write options {saved.get('options', 'doc.save()')}, "
+                         f"not {options}")
+        baseline = saved['results']
+
+    # Warm the base template cache so the first case doesn't pay for building it
+    guide.new_guide_document()
+
+    scales = tuple(int(s) for s in args.scales.split(',')) if args.scales else None
+    results = {}
+    for name in args.case or BENCHMARKS:
+        for scale in scales or BENCHMARKS[name][1]:
+            results[f"{name}@{scale}"] = measure(name, scale, args.repeat, options)
+            print(f"⏱️  {name}@{scale}: {results[f'{name}@{scale}']['wall'] * 1000:.1f}ms", file=sys.stderr)
+
+    print_report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'options': options, 'results': results}, f, indent=2)
+        print(f"💾 Baseline saved: {args.save}")
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print(f"✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
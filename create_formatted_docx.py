@@ -4,931 +4,4242 @@ Create a beautifully formatted DOCX file for Voltic User Guide
 with proper headings, tables, styling, and structure.
 """
 
+import contextlib
+import copy
+import datetime
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+import zipfile
+import zlib
+
+import docx
 from docx import Document
-from docx.shared import Inches, Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.package import Package
+from docx.shared import Emu, Inches, Pt, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
 from docx.enum.style import WD_STYLE_TYPE
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.package import Unmarshaller
+from docx.opc.part import PartFactory
+from docx.opc.pkgreader import (PackageReader, _SerializedPart, _SerializedRelationship,
+                                _SerializedRelationships)
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI, PackURI
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.numbering import CT_Num
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+
+DEFAULT_OUTPUT_PATH = "/Users/varuntyagi/Downloads/Claude Research/RayTracker/VOLTIC_USER_GUIDE_FORMATTED.docx"
+DIVIDER_TEXT = "─────────────────────"
+GUIDE_MARKDOWN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voltic", "VOLTIC_USER_GUIDE.md")
+_R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+def xml_escape(text):
+    """Escape &, < and > for XML character data"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
 def add_page_break(doc):
     """Add a page break"""
-    doc.add_page_break()
-
-def add_hyperlink(paragraph, url, text):
-    """Add a hyperlink to a paragraph"""
-    # This gets access to the document.xml.rels file and gets a new relation id value
-    part = paragraph.part
-    r_id = part.relate_to(url, "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink", is_external=True)
-
-    # Create the w:hyperlink tag and add needed values
-    hyperlink = OxmlElement('w:hyperlink')
-    hyperlink.set(qn('r:id'), r_id)
-
-    # Create a new run object (a wrapper over a 'w:r' element)
+    add_paragraph(doc).add_run().add_break(WD_BREAK.PAGE)
+
+class _HyperlinkIndex:
+    """URL -> rId index over a part's external hyperlink relationships"""
+
+    def __init__(self, part):
+        self.rels = part.rels
+        self.rids = {
+            rel.target_ref: rId for rId, rel in self.rels.items()
+            if rel.is_external and rel.reltype == RT.HYPERLINK
+        }
+        self._next = 1
+
+    def relate(self, url):
+        r_id = self.rids.get(url)
+        if r_id is None:
+            # Same numbering as python-docx (lowest free rIdN), without its
+            # scan over every relationship on each call
+            while f"rId{self._next}" in self.rels:
+                self._next += 1
+            r_id = self.rids[url] = f"rId{self._next}"
+            self.rels.add_relationship(RT.HYPERLINK, url, r_id, is_external=True)
+        return r_id
+
+_hyperlink_indexes = weakref.WeakKeyDictionary()
+
+def relate_hyperlink(part, url):
+    """Return the rId of the part's hyperlink relationship to `url`, adding it once"""
+    index = _hyperlink_indexes.get(part)
+    if index is None:
+        index = _hyperlink_indexes[part] = _HyperlinkIndex(part)
+    return index.relate(url)
+
+def _new_run(text, fmt):
+    # A w:r with its properties cloned from the `fmt` format
     new_run = OxmlElement('w:r')
-
-    # Set the run's text
-    rPr = OxmlElement('w:rPr')
-
-    # Add color
-    c = OxmlElement('w:color')
-    c.set(qn('w:val'), '0563C1')
-    rPr.append(c)
-
-    # Add underline
-    u = OxmlElement('w:u')
-    u.set(qn('w:val'), 'single')
-    rPr.append(u)
-
-    new_run.append(rPr)
+    new_run.append(copy.deepcopy(run_format(fmt)))
     new_run.text = text
-    hyperlink.append(new_run)
+    return new_run
+
+def _new_hyperlink(r_id, text, anchor=None, fmt='hyperlink'):
+    # Create the w:hyperlink tag around a run cloned from the `fmt` format;
+    # internal links target a bookmark `anchor` instead of a relationship
+    hyperlink = OxmlElement('w:hyperlink')
+    if r_id is not None:
+        hyperlink.set(qn('r:id'), r_id)
+    if anchor is not None:
+        hyperlink.set(qn('w:anchor'), anchor)
+    hyperlink.append(_new_run(text, fmt))
+    return hyperlink
 
+def add_hyperlink(paragraph, url, text, fmt='hyperlink'):
+    """Add a hyperlink to a paragraph"""
+    # Repeated URLs share one relationship in the document.xml.rels file
+    hyperlink = _new_hyperlink(relate_hyperlink(paragraph.part, url), text, fmt=fmt)
     paragraph._p.append(hyperlink)
+    return hyperlink
 
+def add_hyperlinks(paragraph, links, separator=None):
+    """Add (url, text) hyperlinks to a paragraph, optionally separated by plain text"""
+    part = paragraph.part
+    p = paragraph._p
+    hyperlinks = []
+    for url, text in links:
+        if separator and hyperlinks:
+            add_run(paragraph, separator)
+        hyperlink = _new_hyperlink(relate_hyperlink(part, url), text)
+        p.append(hyperlink)
+        hyperlinks.append(hyperlink)
+    return hyperlinks
+
+def add_internal_link(paragraph, bookmark, text, fmt='hyperlink'):
+    """Add a hyperlink to a bookmark in the same document"""
+    hyperlink = _new_hyperlink(None, text, anchor=bookmark, fmt=fmt)
+    paragraph._p.append(hyperlink)
     return hyperlink
 
-def create_voltic_user_guide():
-    """Create the formatted DOCX document"""
+# ==================== HEADING INDEX & TABLE OF CONTENTS ====================
+
+TOC_LEVELS = (1,)
+TOC_BOOKMARK = '_TocEntries'
+# Word truncates longer bookmark names
+BOOKMARK_NAME_MAX = 40
+_SLUG_STRIP = re.compile(r'[^\w\- ]')
+_BOOKMARK_UNSAFE = re.compile(r'[^0-9A-Za-z_]')
+
+def heading_slug(text):
+    """GitHub-style anchor slug for a heading ("Support & Contact" -> "support--contact")"""
+    return _SLUG_STRIP.sub('', text.strip().lower()).replace(' ', '-')
+
+def bookmark_name(slug):
+    """Bookmark name for a heading slug; the leading underscore hides it in Word"""
+    return ('_' + _BOOKMARK_UNSAFE.sub('_', slug))[:BOOKMARK_NAME_MAX]
+
+class HeadingIndex:
+    """Headings emitted into one document, in order, with their bookmarks
+
+    `entries` holds (level, text, slug, bookmark_id, bookmark) tuples and
+    `by_slug` maps each slug to its entry, so "#slug" cross-references resolve
+    in O(1). Repeated headings get GitHub's "-1", "-2" slug suffixes. `toc` is
+    the paragraph the table of contents entries go before, `toc_start` the
+    first entry listed there, and `descriptions` maps heading text to the
+    description shown under its entry.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.by_slug = {}
+        self.toc = None
+        self.toc_start = 0
+        self.descriptions = {}
+        self._repeats = {}
+        self._names = {TOC_BOOKMARK}
+        self._next_id = 0
+
+    def new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def add(self, level, text):
+        base = slug = heading_slug(text)
+        while slug in self.by_slug:
+            self._repeats[base] = n = self._repeats.get(base, 0) + 1
+            slug = f"{base}-{n}"
+        bookmark_id = self.new_id()
+        name = bookmark_name(slug)
+        if name in self._names:
+            suffix = f"_{bookmark_id}"
+            name = name[:BOOKMARK_NAME_MAX - len(suffix)] + suffix
+        self._names.add(name)
+        entry = self.by_slug[slug] = (level, text, slug, bookmark_id, name)
+        self.entries.append(entry)
+        return entry
+
+    def anchor(self, slug):
+        """Bookmark for a "#slug" link; headings not emitted yet get the name they will have"""
+        entry = self.by_slug.get(slug)
+        return entry[4] if entry is not None else bookmark_name(slug)
+
+    def mark_toc(self, p):
+        self.toc = p
+        self.toc_start = len(self.entries)
+
+    def toc_entries(self):
+        """Entries listed in the table of contents: TOC_LEVELS headings after its anchor"""
+        return [entry for entry in self.entries[self.toc_start:] if entry[0] in TOC_LEVELS]
+
+_heading_indexes = weakref.WeakKeyDictionary()
+
+def heading_index(part):
+    """Return the part's heading index, creating it on first use"""
+    index = _heading_indexes.get(part)
+    if index is None:
+        index = _heading_indexes[part] = HeadingIndex()
+    return index
+
+def _add_bookmark(p, bookmark_id, name):
+    # Wrap the paragraph's content (after its properties) in a bookmark
+    start = OxmlElement('w:bookmarkStart', {qn('w:id'): str(bookmark_id), qn('w:name'): name})
+    pPr = p.pPr
+    if pPr is not None:
+        pPr.addnext(start)
+    else:
+        p.insert(0, start)
+    p.append(OxmlElement('w:bookmarkEnd', {qn('w:id'): str(bookmark_id)}))
+
+def bookmark_heading(paragraph, level, text):
+    """Index a heading paragraph and bookmark it so links and the TOC can target it"""
+    entry = heading_index(paragraph.part).add(level, text)
+    _add_bookmark(paragraph._p, entry[3], entry[4])
+    return entry
+
+def add_toc_anchor(doc):
+    """Add the paragraph the generated table of contents entries are placed before"""
+    p = add_paragraph(doc)
+    index = heading_index(doc.part)
+    _add_bookmark(p._p, index.new_id(), TOC_BOOKMARK)
+    index.mark_toc(p._p)
+    return p
+
+def toc_paragraphs(index):
+    """Yield a w:p linking to each heading after the TOC anchor, in document order"""
+    for level, text, slug, bookmark_id, bookmark in index.toc_entries():
+        paragraph = Paragraph(OxmlElement('w:p'), None)
+        if level > TOC_LEVELS[0]:
+            paragraph.paragraph_format.left_indent = Inches(0.25 * (level - TOC_LEVELS[0]))
+        paragraph._p.append(_new_hyperlink(None, text, anchor=bookmark, fmt='label-bold'))
+        description = index.descriptions.get(text)
+        if description:
+            add_run(paragraph, f"\n   {description}", 'toc-description')
+        yield paragraph._p
+
+def add_toc_entries(doc):
+    """Fill in the table of contents from the heading index, in O(headings)"""
+    index = _heading_indexes.get(doc.part)
+    if index is None or index.toc is None:
+        return 0
+    count = 0
+    for p in toc_paragraphs(index):
+        index.toc.addprevious(p)
+        count += 1
+    # The entries are in place; writers have nothing left to fill in
+    index.toc = None
+    return count
+
+def _body_anchor(doc):
+    """Return the body's trailing w:sectPr, before which new blocks are inserted"""
+    body = doc.element.body
+    try:
+        last = body[-1]
+    except IndexError:
+        last = None
+    if last is not None and last.tag == qn('w:sectPr'):
+        return last
+    return body.get_or_add_sectPr()
+
+# ==================== STYLE & RUN FORMAT REGISTRY ====================
+
+# Named run formats: font, bold, italic, colour (RGB), size (pt) and single
+# underline. Each is
+# compiled once into a w:rPr template that add_run() clones onto new runs.
+RUN_FORMATS = {
+    'cover-title': {'bold': True, 'color': (0, 51, 102), 'size': 44},
+    'cover-subtitle': {'color': (68, 68, 68), 'size': 24},
+    'cover-tagline': {'italic': True, 'color': (100, 100, 100), 'size': 14},
+    'cover-version': {'size': 11},
+    'toc-description': {'size': 10},
+    'label-bold': {'bold': True},
+    'emphasis': {'italic': True},
+    'code': {'font': 'Consolas'},
+    'code-block': {'font': 'Consolas', 'size': 9},
+    'divider': {'color': (200, 200, 200)},
+    'muted-note': {'italic': True, 'color': (100, 100, 100), 'size': 10},
+    'muted-footer': {'color': (150, 150, 150), 'size': 9},
+    'hyperlink': {'color': (5, 99, 193), 'underline': True},
+    'hyperlink-bold': {'bold': True, 'color': (5, 99, 193), 'underline': True},
+    'hyperlink-emphasis': {'italic': True, 'color': (5, 99, 193), 'underline': True},
+    'hyperlink-code': {'font': 'Consolas', 'color': (5, 99, 193), 'underline': True},
+}
+
+_run_templates = {}
+_style_ids = weakref.WeakKeyDictionary()
+
+def run_format(name):
+    """Return the compiled w:rPr template for a named run format"""
+    template = _run_templates.get(name)
+    if template is None:
+        spec = RUN_FORMATS[name]
+        template = OxmlElement('w:rPr')
+        if 'font' in spec:
+            rFonts = etree.SubElement(template, qn('w:rFonts'))
+            rFonts.set(qn('w:ascii'), spec['font'])
+            rFonts.set(qn('w:hAnsi'), spec['font'])
+        if spec.get('bold'):
+            etree.SubElement(template, qn('w:b'))
+        if spec.get('italic'):
+            etree.SubElement(template, qn('w:i'))
+        if 'color' in spec:
+            etree.SubElement(template, qn('w:color')).set(qn('w:val'), '%02X%02X%02X' % spec['color'])
+        if 'size' in spec:
+            etree.SubElement(template, qn('w:sz')).set(qn('w:val'), str(int(spec['size'] * 2)))
+        if spec.get('underline'):
+            etree.SubElement(template, qn('w:u')).set(qn('w:val'), 'single')
+        _run_templates[name] = template
+    return template
+
+def style_id(doc, name):
+    """Return the style ID for a style name, resolved once per document"""
+    ids = _style_ids.get(doc.part)
+    if ids is None:
+        ids = _style_ids[doc.part] = {}
+    sid = ids.get(name)
+    if sid is None:
+        sid = ids[name] = doc.styles[name].style_id
+    return sid
+
+def add_paragraph(doc, text='', style=None):
+    """Add a paragraph to the end of the document with an optional style"""
+    p = OxmlElement('w:p')
+    if style is not None:
+        p.get_or_add_pPr().style = style_id(doc, style)
+    _body_anchor(doc).addprevious(p)
+    paragraph = Paragraph(p, doc._body)
+    if text:
+        add_run(paragraph, text)
+    return paragraph
+
+def add_heading(doc, text='', level=1):
+    """Add a heading paragraph ("Title" for level 0), bookmarked when `text` is given"""
+    paragraph = add_paragraph(doc, text, 'Title' if level == 0 else f'Heading {level}')
+    if text:
+        bookmark_heading(paragraph, level, text)
+    return paragraph
+
+def add_run(paragraph, text='', fmt=None):
+    """Add a run to `paragraph`, cloning the named run format `fmt` if given"""
+    r = paragraph._p.add_r()
+    if fmt is not None:
+        r.append(copy.deepcopy(run_format(fmt)))
+    run = Run(r, paragraph)
+    if '\n' in text or '\t' in text:
+        run.text = text
+    elif text:
+        r.add_t(text)
+    return run
+
+BULK_TABLE_CHUNK_ROWS = 1000
+
+def _bulk_row_xml(values, cols, plain=True, trPr=''):
+    """Serialize one table row; cells get plain text runs unless `plain` is False"""
+    cells = []
+    for i in range(cols):
+        value = values[i] if i < len(values) else None
+        text = '' if value is None or not plain else str(value)
+        if not text:
+            cells.append('<w:tc><w:p/></w:tc>')
+        elif text != text.strip():
+            cells.append(f'<w:tc><w:p><w:r><w:t xml:space="preserve">{xml_escape(text)}</w:t></w:r></w:p></w:tc>')
+        else:
+            cells.append(f'<w:tc><w:p><w:r><w:t>{xml_escape(text)}</w:t></w:r></w:p></w:tc>')
+    return f'<w:tr>{trPr}{"".join(cells)}</w:tr>'
+
+def add_bulk_table(doc, header, rows, style='Light Grid Accent 1', write_cell=None):
+    """Add a table built directly from a header tuple and an iterable of row tuples
+
+    The w:tbl tree is written from XML text in chunks of rows instead of
+    through add_row(), which deep-copies the previous row and rebuilds the cell
+    grid on every call. Rows are consumed lazily, so generators (e.g. a
+    csv.reader) are never materialized. The header is formatted by the table
+    style's first-row settings (tblLook firstRow) and repeats on every page.
+    If given, `write_cell(p, value)` fills each body cell's empty w:p instead
+    of the default plain-text run.
+    """
+    cols = len(header)
+    sectPr = _body_anchor(doc)
+    block_width = sectPr.page_width - sectPr.left_margin - sectPr.right_margin
+    grid = f'<w:gridCol w:w="{Emu(block_width).twips // cols}"/>' * cols
+    plain = write_cell is None
+
+    tbl = parse_xml(
+        f'<w:tbl {nsdecls("w")}>'
+        f'<w:tblPr><w:tblStyle w:val="{doc.styles[style].style_id}"/><w:tblW w:type="auto" w:w="0"/>'
+        f'<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        f'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>'
+        f'<w:tblGrid>{grid}</w:tblGrid>'
+        f'{_bulk_row_xml(tuple(header), cols, trPr="<w:trPr><w:tblHeader/></w:trPr>")}'
+        f'</w:tbl>'
+    )
+    sectPr.addprevious(tbl)
+
+    def flush(chunk, values):
+        wrapper = parse_xml(f'<w:tbl {nsdecls("w")}>{"".join(chunk)}</w:tbl>')
+        trs = list(wrapper)
+        if not plain:
+            for tr, row in zip(trs, values):
+                for tc, value in zip(tr, row):
+                    write_cell(tc[0], value)
+        tbl.extend(trs)
+
+    chunk, values = [], []
+    for row in rows:
+        row = tuple(row)
+        chunk.append(_bulk_row_xml(row, cols, plain))
+        if not plain:
+            values.append(row)
+        if len(chunk) == BULK_TABLE_CHUNK_ROWS:
+            flush(chunk, values)
+            chunk, values = [], []
+    if chunk:
+        flush(chunk, values)
+
+    return Table(tbl, doc._body)
+
+# Title and heading overrides: style name -> (point size, RGB colour)
+GUIDE_STYLES = {
+    'Title': (28, (0, 51, 102)),
+    'Heading 1': (20, (0, 112, 192)),
+    'Heading 2': (16, (0, 112, 192)),
+    'Heading 3': (14, (68, 68, 68)),
+}
+
+# Document properties stamped on every guide
+GUIDE_PROPERTIES = {
+    'title': "Voltic User Guide",
+    'subject': "Complete Documentation for Meta Advertising Intelligence Platform",
+    'keywords': "Voltic, Meta Ads, Facebook Ads, Advertising, AI, Documentation",
+    'comments': "Comprehensive user guide for the Voltic platform",
+}
+
+# Prebuilt base template cache; set VOLTIC_TEMPLATE_CACHE to '' to disable
+TEMPLATE_CACHE_VERSION = 2
+TEMPLATE_CACHE_DIR = os.environ.get('VOLTIC_TEMPLATE_CACHE', os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'voltic_user_guide'))
+
+def make_cache_dir(path):
+    """Create a cache directory private to the user, along with the cache root
+
+    Every on-disk cache creates its directory through here, so the root is
+    0o700 whichever cache writes first, and directories left with wider
+    permissions by older versions are tightened.
+    """
+    dirs = [path]
+    if TEMPLATE_CACHE_DIR:
+        root = os.path.abspath(TEMPLATE_CACHE_DIR)
+        if os.path.commonpath([root, os.path.abspath(path)]) == root:
+            dirs.insert(0, root)
+    for d in dirs:
+        os.makedirs(d, mode=0o700, exist_ok=True)
+        os.chmod(d, 0o700)
+    return path
+
+def _build_base_document():
+    """Style python-docx's default template with the guide's properties and headings"""
     doc = Document()
 
     # Set document properties
-    doc.core_properties.title = "Voltic User Guide"
-    doc.core_properties.subject = "Complete Documentation for Meta Advertising Intelligence Platform"
-    doc.core_properties.keywords = "Voltic, Meta Ads, Facebook Ads, Advertising, AI, Documentation"
-    doc.core_properties.comments = "Comprehensive user guide for the Voltic platform"
+    for name, value in GUIDE_PROPERTIES.items():
+        setattr(doc.core_properties, name, value)
 
     # Define custom styles
-    styles = doc.styles
-
-    # Title style
-    title_style = styles['Title']
-    title_font = title_style.font
-    title_font.name = 'Calibri'
-    title_font.size = Pt(28)
-    title_font.bold = True
-    title_font.color.rgb = RGBColor(0, 51, 102)
-
-    # Heading 1 style
-    h1_style = styles['Heading 1']
-    h1_font = h1_style.font
-    h1_font.name = 'Calibri'
-    h1_font.size = Pt(20)
-    h1_font.bold = True
-    h1_font.color.rgb = RGBColor(0, 112, 192)
-
-    # Heading 2 style
-    h2_style = styles['Heading 2']
-    h2_font = h2_style.font
-    h2_font.name = 'Calibri'
-    h2_font.size = Pt(16)
-    h2_font.bold = True
-    h2_font.color.rgb = RGBColor(0, 112, 192)
-
-    # Heading 3 style
-    h3_style = styles['Heading 3']
-    h3_font = h3_style.font
-    h3_font.name = 'Calibri'
-    h3_font.size = Pt(14)
-    h3_font.bold = True
-    h3_font.color.rgb = RGBColor(68, 68, 68)
-
-    # ==================== COVER PAGE ====================
-
-    # Title
-    title = doc.add_paragraph()
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    title_run = title.add_run("VOLTIC")
-    title_run.font.size = Pt(44)
-    title_run.font.bold = True
-    title_run.font.color.rgb = RGBColor(0, 51, 102)
-
-    # Subtitle
-    subtitle = doc.add_paragraph()
-    subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    subtitle_run = subtitle.add_run("User Guide & Documentation")
-    subtitle_run.font.size = Pt(24)
-    subtitle_run.font.color.rgb = RGBColor(68, 68, 68)
-
-    doc.add_paragraph()
-
-    # Tagline
-    tagline = doc.add_paragraph()
-    tagline.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    tagline_run = tagline.add_run("Meta Advertising Intelligence & Creative Generation Platform")
-    tagline_run.font.size = Pt(14)
-    tagline_run.font.italic = True
-    tagline_run.font.color.rgb = RGBColor(100, 100, 100)
-
-    doc.add_paragraph("\n" * 8)
-
-    # Version info
-    version = doc.add_paragraph()
-    version.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    version.add_run("Version 1.0 | February 2026").font.size = Pt(11)
+    for style_name, (size, rgb) in GUIDE_STYLES.items():
+        font = doc.styles[style_name].font
+        font.name = 'Calibri'
+        font.size = Pt(size)
+        font.bold = True
+        font.color.rgb = RGBColor(*rgb)
+
+    return doc
+
+def _dump_template(reader, f):
+    """Write a PackageReader as a JSON header line followed by the part blobs
+
+    Only strings, sizes and bytes are stored, so loading a tampered cache
+    file can at worst fail; nothing in it is ever executed.
+    """
+    import json
+    rels = {}
+    for source, srel in reader.iter_srels():
+        rels.setdefault(str(source), []).append([srel.rId, srel.reltype, srel.target_mode, srel.target_ref])
+    parts, blobs = [], []
+    for partname, content_type, reltype, blob in reader.iter_sparts():
+        parts.append([str(partname), content_type, reltype, len(blob)])
+        blobs.append(blob)
+    f.write(json.dumps({'parts': parts, 'rels': rels}).encode('utf-8') + b'\n')
+    f.writelines(blobs)
+
+def _load_template(f):
+    """Rebuild a PackageReader from _dump_template() output; raises ValueError if malformed"""
+    import json
+    from types import SimpleNamespace
+    try:
+        header = json.loads(f.readline())
+        rels = header['rels']
+
+        def srels(source):
+            collection = _SerializedRelationships()
+            for r_id, reltype, target_mode, target_ref in rels.get(source, ()):
+                rel = SimpleNamespace(rId=r_id, reltype=reltype, target_mode=target_mode, target_ref=target_ref)
+                collection._srels.append(_SerializedRelationship(PackURI(source).baseURI, rel))
+            return collection
+
+        data = f.read()
+        sparts, offset = [], 0
+        for partname, content_type, reltype, size in header['parts']:
+            sparts.append(_SerializedPart(PackURI(partname), content_type, reltype,
+                                          data[offset:offset + size], srels(partname)))
+            offset += size
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed template cache: {e}") from e
+    if offset != len(data):
+        raise ValueError("Malformed template cache: part sizes don't match the data")
+    return PackageReader(None, srels(PACKAGE_URI), sparts)
+
+@functools.lru_cache(maxsize=None)
+def _base_template():
+    """Return the styled base template as a PackageReader, cached on disk
+
+    The reader holds every part's serialized XML, so a new document only has
+    to unmarshal it: no zip inflating, no walking the package and no style
+    overrides. The cache file (see _dump_template()) is keyed by the
+    python-docx, lxml and Python versions plus the guide's property and
+    style settings, and its directory is created by make_cache_dir().
+    """
+    settings = repr((GUIDE_PROPERTIES, GUIDE_STYLES)).encode('utf-8')
+    key = (f"{TEMPLATE_CACHE_VERSION}-docx{getattr(docx, '__version__', '')}-lxml{etree.__version__}"
+           f"-py{sys.version_info[0]}.{sys.version_info[1]}-{zlib.crc32(settings):08x}")
+    path = os.path.join(TEMPLATE_CACHE_DIR, f"base-{key}.template") if TEMPLATE_CACHE_DIR else None
+    if path:
+        try:
+            with open(path, 'rb') as f:
+                return _load_template(f)
+        except (OSError, ValueError):
+            pass
+
+    buffer = io.BytesIO()
+    _build_base_document().save(buffer)
+    reader = PackageReader.from_file(buffer)
+    if path:
+        try:
+            make_cache_dir(TEMPLATE_CACHE_DIR)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                _dump_template(reader, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+    return reader
+
+def new_guide_document():
+    """Create a document with the guide's properties and heading styles applied"""
+    package = Package()
+    Unmarshaller.unmarshal(_base_template(), package, PartFactory)
+    return package.main_document_part.document
+
+# ==================== YOUR WORKSPACE (MAIL MERGE) ====================
+
+# Per-workspace values substituted into mail-merged copies of the guide
+MERGE_FIELDS = ("workspace_name", "ad_account_count", "credit_balance", "plan")
+
+def merge_field(name):
+    """Return the placeholder text that marks merge field `name` in the template"""
+    return f"«{name}»"
+
+def add_workspace_section(doc):
+    """Add the per-workspace summary page used by mail-merged guides"""
+    add_heading(doc, "Your Workspace", level=1)
+
+    p = add_paragraph(doc)
+    add_run(p, "This copy of the guide was prepared for ")
+    add_run(p, merge_field("workspace_name"), 'label-bold')
+    add_run(p, ".")
+
+    add_bulk_table(doc, ("Workspace", "Details"), [
+        ("Workspace", merge_field("workspace_name")),
+        ("Plan", merge_field("plan")),
+        ("Connected Ad Accounts", merge_field("ad_account_count")),
+        ("Credit Balance", merge_field("credit_balance")),
+    ])
 
     add_page_break(doc)
 
-    # ==================== TABLE OF CONTENTS ====================
-
-    doc.add_heading("Table of Contents", level=1)
-    doc.add_paragraph("This guide covers all features and capabilities of the Voltic platform.")
-    doc.add_paragraph()
-
-    toc_items = [
-        ("1. Introduction", "Overview of Voltic platform and key capabilities"),
-        ("2. Getting Started", "Account setup, workspace creation, and navigation"),
-        ("3. Workspace Dashboard", "Home dashboard and activity monitoring"),
-        ("4. Ad Discovery & Competitor Intelligence", "Search, filter, and analyze competitor ads"),
-        ("5. Boards & Swipe Files", "Organize and manage saved ad collections"),
-        ("6. AI-Powered Variations", "Generate ad variations from competitors or products"),
-        ("7. Ad Generator", "Batch text overlay composition tool"),
-        ("8. Assets & Product Catalog", "Manage product images and backgrounds"),
-        ("9. Brand Guidelines", "Define brand voice, colors, and identity"),
-        ("10. Automations", "Schedule automated reports and alerts"),
-        ("11. Reports & Analytics", "Six report types for performance analysis"),
-        ("12. Campaign Analysis", "Deep-dive Meta ad account analytics"),
-        ("13. Creative Studio", "AI creative assistant and brainstorming"),
-        ("14. Decomposition Tool", "Extract product details from ads with AI"),
-        ("15. Competitors Tracking", "Monitor and track competitor brands"),
-        ("16. Credits & Billing", "Manage credit balance and purchases"),
-        ("17. Settings & Configuration", "Workspace and integration settings"),
-        ("18. Best Practices", "Tips for maximizing Voltic features"),
-        ("19. Troubleshooting", "Common issues and solutions"),
-        ("20. API & Integrations", "Developer documentation and webhooks"),
-    ]
-
-    for item, desc in toc_items:
-        p = doc.add_paragraph(style='List Number')
-        p.add_run(item).bold = True
-        p.add_run(f"\n   {desc}").font.size = Pt(10)
-
-    add_page_break(doc)
-
-    # ==================== 1. INTRODUCTION ====================
-
-    doc.add_heading("1. Introduction", level=1)
-
-    doc.add_heading("What is Voltic?", level=2)
-    p = doc.add_paragraph(
-        "Voltic is an all-in-one SaaS platform that unifies Meta (Facebook/Instagram) advertising analytics, "
-        "competitor intelligence, automated reporting, social comment monitoring, and AI-powered creative generation "
-        "into a single workspace."
-    )
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Think of Voltic as: ").bold = True
-    p.add_run("Supermetrics + AdSpy + Jasper combined into one platform.")
-
-    doc.add_heading("Key Capabilities", level=2)
-
-    capabilities = [
-        ("Competitor Intelligence", "Discover and analyze competitor ads across Meta's Ad Library"),
-        ("Creative Generation", "AI-powered ad variations and text overlay composition"),
-        ("Automated Reporting", "Schedule performance, competitor, and comment reports to Slack"),
-        ("Product Decomposition", "Extract product information from competitor ads using AI"),
-        ("Swipe File Management", "Organize and categorize saved ads in boards"),
-        ("Multi-Account Analytics", "Connect up to 91+ Meta ad accounts per workspace"),
-        ("AI Creative Tools", "Generate variations, compose text on images, edit product photos"),
-    ]
-
-    for title, desc in capabilities:
-        p = doc.add_paragraph(style='List Bullet')
-        p.add_run(f"{title}: ").bold = True
-        p.add_run(desc)
-
-    doc.add_heading("Who is Voltic For?", level=2)
-
-    audiences = [
-        ("Performance Marketers", "Track competitor strategies and automate reporting"),
-        ("Creative Teams", "Generate ad variations at scale and build swipe files"),
-        ("E-commerce Brands", "Analyze competitor product positioning and create product-based ads"),
-        ("Agencies", "Manage multiple client workspaces with centralized intelligence"),
-        ("Social Media Managers", "Monitor ad performance and generate platform-specific copy"),
-    ]
-
-    for role, use_case in audiences:
-        p = doc.add_paragraph(style='List Bullet')
-        p.add_run(f"{role}: ").bold = True
-        p.add_run(use_case)
-
-    add_page_break(doc)
-
-    # ==================== 2. GETTING STARTED ====================
-
-    doc.add_heading("2. Getting Started", level=1)
-
-    doc.add_heading("Account Setup", level=2)
-
-    doc.add_heading("1. Sign Up", level=3)
-    signup_steps = [
-        "Visit your Voltic instance URL",
-        "Click 'Sign Up' on the login page",
-        "Enter your email and password (minimum 6 characters)",
-        "Verify your email address"
-    ]
-    for step in signup_steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_heading("2. Create Your Workspace", level=3)
-    workspace_steps = [
-        "Upon first login, you'll be prompted to create a workspace",
-        "Enter workspace name (e.g., 'Acme Marketing Team')",
-        "Invite team members via email (optional)"
-    ]
-    for step in workspace_steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_heading("3. Connect Meta Ad Accounts", level=3)
-    meta_steps = [
-        "Navigate to Settings → Ad Accounts",
-        "Click 'Connect Meta Account'",
-        "Authenticate with Facebook/Meta",
-        "Select ad accounts to sync (up to 91+ accounts)"
-    ]
-    for step in meta_steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_heading("Navigation Overview", level=2)
-    doc.add_paragraph("Main Navigation (Left Sidebar):")
-
-    nav_items = [
-        ("Home", "Workspace overview dashboard"),
-        ("Automations", "Scheduled reports and alerts"),
-        ("Discover", "Ad library search and competitor intelligence"),
-        ("Boards", "Saved ad collections (swipe files)"),
-        ("Variations", "AI-powered ad variation generator"),
-        ("Ad Generator", "Text overlay composition tool (NEW)"),
-        ("Assets", "Product catalog and background images"),
-        ("Reports", "6 report types (Top Ads, Campaigns, Creatives, etc.)"),
-        ("Campaign Analysis", "Deep-dive ad account analytics"),
-        ("Creative Studio", "AI creative assistant"),
-        ("Brand Guidelines", "Brand voice and visual identity"),
-        ("Decomposition", "Product extraction from competitor ads"),
-        ("Competitors", "Tracked competitor brands"),
-        ("Credits", "AI feature credit balance"),
-        ("Settings", "Workspace configuration"),
-    ]
-
-    for nav, desc in nav_items:
-        p = doc.add_paragraph(style='List Bullet')
-        p.add_run(f"{nav} — ").bold = True
-        p.add_run(desc)
-
-    add_page_break(doc)
-
-    # ==================== 3. CORE FEATURES ====================
-
-    doc.add_heading("3. Core Features", level=1)
-
-    doc.add_heading("Credit System", level=2)
-    doc.add_paragraph("Voltic uses credits for AI-powered features:")
-
-    # Create credit cost table
-    table = doc.add_table(rows=1, cols=2)
-    table.style = 'Light Grid Accent 1'
-
-    hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = 'Feature'
-    hdr_cells[1].text = 'Cost'
-
-    # Make header bold
-    for cell in hdr_cells:
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-
-    credit_costs = [
-        ('AI Variation (per strategy)', '10 credits'),
-        ('Product Decomposition', '5 credits'),
-        ('AI Image Generation (DALL-E)', '15 credits'),
-        ('AI Image Editing (Gemini)', '12 credits'),
-        ('Creative Studio Chat Message', '3 credits'),
-        ('Background Generation', '15 credits'),
-    ]
-
-    for feature, cost in credit_costs:
-        row_cells = table.add_row().cells
-        row_cells[0].text = feature
-        row_cells[1].text = cost
-
-    doc.add_paragraph()
-    doc.add_paragraph("How to Get Credits:")
-    doc.add_paragraph("• Purchase credit packs in Settings → Billing", style='List Bullet')
-    doc.add_paragraph("• Credits are workspace-scoped (shared by all members)", style='List Bullet')
-    doc.add_paragraph("• Credits never expire", style='List Bullet')
-
+def merge_guide_sections():
+    """Mail-merge template sections: the guide with the workspace summary after the cover"""
+    sections = guide_sections()
+    return sections[:1] + [("Your Workspace", add_workspace_section)] + sections[1:]
+
+def create_voltic_user_guide(output_path=DEFAULT_OUTPUT_PATH, cache_dir=None, jobs=1, stream=False,
+                             compresslevel=None, deterministic=False, patch=None, minimize=False):
+    """Create the formatted DOCX document
+
+    `output_path` may also be a writable binary stream (BytesIO, a socket
+    file, sys.stdout.buffer). `compresslevel` is the zip deflate level, with 0
+    storing members uncompressed for the fastest write. With `deterministic`,
+    identical content gives a byte-identical package and an unchanged
+    rebuild leaves the output untouched. `patch` names an earlier build to
+    copy unchanged parts from as stored, and `minimize` runs the
+    XmlMinimizer pass over the body (see StreamingDocxWriter). The content
+    comes from the guide spec, GUIDE_SPEC_PATH.
+    """
+    doc = new_plan_document(guide_plan())
+    cache = SectionCache(cache_dir) if cache_dir else None
+
+    if stream:
+        # Each finished section is written to the package and dropped from memory
+        with StreamingDocxWriter(output_path, doc, compresslevel, deterministic, patch, minimize) as writer:
+            rendered, reused = build_sections(doc, iter_guide_sections(cache is not None), cache,
+                                              jobs=jobs, after_section=writer.flush)
+    else:
+        rendered, reused = build_sections(doc, iter_guide_sections(cache is not None), cache, jobs=jobs)
+        add_toc_entries(doc)
+        # Save document
+        writer = write_package(doc, output_path, compresslevel, deterministic, patch, minimize)
+    report_written(writer, output_path)
+    print(f"📄 Total sections: 20+")
+    print(f"📊 Includes: Tables, styled headings, bullet points, numbered lists")
+    print(f"🎨 Professional formatting with colors and emphasis")
+    if cache is not None:
+        print(f"♻️  Sections re-rendered: {rendered}, reused from cache: {reused}")
+
+# ==================== MARKDOWN FRONT END ====================
+
+_MD_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_MD_RULE = re.compile(r'^ {0,3}([-*_])( *\1){2,} *$')
+_MD_LIST_ITEM = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+_MD_TABLE_DIVIDER = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+# Link destinations may hold one level of balanced parentheses, as in wiki URLs
+_MD_DESTINATION = r'(?:[^()\s]|\([^()\s]*\))+'
+_MD_IMAGE = re.compile(r'^!\[(?P<alt>[^\]]*)\]\((?P<src>' + _MD_DESTINATION + r')(?:\s+"[^"]*")?\)$')
+_MD_INLINE = re.compile(
+    r'\*\*(?P<bold>.+?)\*\*'
+    r'|`(?P<code>[^`]+)`'
+    r'|\[(?P<link>[^\]]+)\]\((?P<url>' + _MD_DESTINATION + r')\)'
+    r'|(?<![\w*])\*(?P<em>[^*\s][^*]*?)\*(?!\w)'
+    r'|(?<!\w)_(?P<em_alt>[^_\s][^_]*?)_(?!\w)'
+)
+
+# Markdown heading depth -> document heading level ("#" is the guide title)
+MD_HEADING_LEVELS = {1: 0, 2: 1, 3: 2}
+MD_LIST_STYLES = {
+    False: ('List Bullet', 'List Bullet 2', 'List Bullet 3'),
+    True: ('List Number', 'List Number 2', 'List Number 3'),
+}
+# Inline Markdown marks -> named run formats, in plain text and in link text
+MD_RUN_FORMATS = {'': None, 'b': 'label-bold', 'i': 'emphasis', 'c': 'code'}
+MD_LINK_FORMATS = {'': 'hyperlink', 'b': 'hyperlink-bold', 'i': 'hyperlink-emphasis', 'c': 'hyperlink-code'}
+
+def parse_inline(text):
+    """Split Markdown inline markup into (text, marks, url) spans
+
+    Link text is parsed for markup too, giving consecutive spans that share
+    the link's url.
+    """
+    spans = []
+    pos = 0
+    for m in _MD_INLINE.finditer(text):
+        if m.start() > pos:
+            spans.append((text[pos:m.start()], '', None))
+        if m.group('bold') is not None:
+            spans.append((m.group('bold'), 'b', None))
+        elif m.group('code') is not None:
+            spans.append((m.group('code'), 'c', None))
+        elif m.group('link') is not None:
+            url = m.group('url')
+            spans.extend((text, marks, url) for text, marks, _ in parse_inline(m.group('link')))
+        else:
+            spans.append((m.group('em') or m.group('em_alt'), 'i', None))
+        pos = m.end()
+    if pos < len(text):
+        spans.append((text[pos:], '', None))
+    return spans
+
+def _plain_text(text):
+    """Return Markdown inline text with its markup removed"""
+    return ''.join(span[0] for span in parse_inline(text))
+
+def _split_table_row(line):
+    """Split a Markdown table row into stripped cell strings"""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+def iter_markdown_blocks(lines):
+    """Parse Markdown lines into block tuples in a single streaming pass
+
+    Yields ('heading', depth, text), ('paragraph', spans), ('list', ordered,
+    depth, spans), ('table', header, rows), ('quote', spans), ('code', text),
+    ('image', alt, src) and ('rule',). Only the block being assembled is held
+    in memory.
+    """
+    paragraph = []
+    table = None
+    header_line = None
+    code = None
+
+    def flush_paragraph():
+        if paragraph:
+            yield ('paragraph', parse_inline('\n'.join(paragraph)))
+            del paragraph[:]
+
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+
+        if code is not None:
+            if line.strip().startswith('```'):
+                yield ('code', '\n'.join(code))
+                code = None
+            else:
+                code.append(line)
+            continue
+
+        stripped = line.strip()
+
+        if table is not None:
+            if stripped.startswith('|'):
+                table[1].append(_split_table_row(stripped))
+                continue
+            yield ('table', table[0], table[1])
+            table = None
+
+        if header_line is not None:
+            if _MD_TABLE_DIVIDER.match(stripped):
+                table = (_split_table_row(header_line), [])
+                header_line = None
+                continue
+            paragraph.append(header_line)
+            header_line = None
+
+        if not stripped:
+            yield from flush_paragraph()
+            continue
+
+        if stripped.startswith('```'):
+            yield from flush_paragraph()
+            code = []
+            continue
+
+        if stripped.startswith('|') and not paragraph:
+            header_line = stripped
+            continue
+
+        m = _MD_HEADING.match(stripped)
+        if m:
+            yield from flush_paragraph()
+            yield ('heading', len(m.group(1)), m.group(2))
+            continue
+
+        if _MD_RULE.match(line):
+            yield from flush_paragraph()
+            yield ('rule',)
+            continue
+
+        if stripped.startswith('>'):
+            yield from flush_paragraph()
+            yield ('quote', parse_inline(stripped.lstrip('>').strip()))
+            continue
+
+        m = _MD_IMAGE.match(stripped)
+        if m:
+            yield from flush_paragraph()
+            yield ('image', m.group('alt'), m.group('src'))
+            continue
+
+        m = _MD_LIST_ITEM.match(line)
+        if m:
+            yield from flush_paragraph()
+            indent = len(m.group(1).expandtabs(4))
+            ordered = m.group(2)[0].isdigit()
+            yield ('list', ordered, min((indent + 1) // 3, 2), parse_inline(m.group(3)))
+            continue
+
+        paragraph.append(stripped)
+
+    if code is not None:
+        yield ('code', '\n'.join(code))
+    if table is not None:
+        yield ('table', table[0], table[1])
+    if header_line is not None:
+        paragraph.append(header_line)
+    yield from flush_paragraph()
+
+class ListNumbering:
+    """Allocate list numbering instances in a document's numbering part"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.element = doc.part.numbering_part.element
+        self._style_nums = {num.numId: num.abstractNumId.val for num in self.element.num_lst}
+        self._abstract_ids = {}
+        self.next_id = max(self._style_nums, default=0) + 1
+        self.added = []
+
+    def add(self, num):
+        """Insert `num` under the next free numId and return that id"""
+        num_id = num.numId = self.next_id
+        self.next_id += 1
+        self.element._insert_num(num)
+        self.added.append(num)
+        return num_id
+
+    def restart(self, style):
+        """Add a numbering instance for `style` that starts again at 1"""
+        abstract_id = self._abstract_ids.get(style)
+        if abstract_id is None:
+            style_num_id = self.doc.styles[style].element.pPr.numPr.numId.val
+            abstract_id = self._abstract_ids[style] = self._style_nums[style_num_id]
+        num = CT_Num.new(self.next_id, abstract_id)
+        num.add_lvlOverride(ilvl=0).add_startOverride(1)
+        return self.add(num)
+
+class MarkdownRenderer:
+    """Send parsed Markdown blocks to the guide's styled emitters
+
+    Blocks go through add_paragraph()/add_run(), which insert directly before
+    the body's final w:sectPr, so each append is O(1) instead of
+    python-docx's scan for the section properties.
+    """
+
+    def __init__(self, doc, numbering=None, images=None):
+        self.doc = doc
+        self.numbering = numbering or ListNumbering(doc)
+        self.images = images or ImageIngestor()
+        self._body = doc._body
+        self._pending_rule = False
+        self._list_nums = {}
+        self._handlers = {
+            'heading': self.heading,
+            'paragraph': self.paragraph,
+            'list': self.list_item,
+            'table': self.table,
+            'quote': self.quote,
+            'code': self.code,
+            'image': self.image,
+            'rule': self.rule,
+        }
+
+    def render(self, blocks):
+        """Render every block from an iterable of parsed blocks"""
+        for block in blocks:
+            kind = block[0]
+            if kind != 'list':
+                self._list_nums.clear()
+            if self._pending_rule and kind != 'rule':
+                self._flush_rule(kind == 'heading' and MD_HEADING_LEVELS.get(block[1]) == 1)
+            self._handlers[kind](*block[1:])
+        if self._pending_rule:
+            self._flush_rule(False)
+
+    def _add_spans(self, paragraph, spans):
+        # Consecutive spans with one url are the runs of one link
+        for url, group in itertools.groupby(spans, key=lambda span: span[2]):
+            if url is None:
+                for text, marks, _ in group:
+                    add_run(paragraph, text, MD_RUN_FORMATS[marks])
+                continue
+            (text, marks, _), *rest = group
+            if url.startswith('#'):
+                hyperlink = add_internal_link(paragraph, heading_index(paragraph.part).anchor(url[1:]), text,
+                                              MD_LINK_FORMATS[marks])
+            else:
+                hyperlink = add_hyperlink(paragraph, url, text, MD_LINK_FORMATS[marks])
+            for text, marks, _ in rest:
+                hyperlink.append(_new_run(text, MD_LINK_FORMATS[marks]))
+
+    def _flush_rule(self, before_section):
+        # A rule right before a top-level section becomes its page break
+        self._pending_rule = False
+        if before_section:
+            add_page_break(self.doc)
+        else:
+            p = add_paragraph(self.doc)
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            add_run(p, DIVIDER_TEXT, 'divider')
+
+    def heading(self, depth, text):
+        level = MD_HEADING_LEVELS.get(depth, 3)
+        p = add_heading(self.doc, level=level)
+        spans = parse_inline(text)
+        self._add_spans(p, spans)
+        bookmark_heading(p, level, ''.join(span[0] for span in spans))
+
+    def paragraph(self, spans):
+        self._add_spans(add_paragraph(self.doc), spans)
+
+    def list_item(self, ordered, depth, spans):
+        p = add_paragraph(self.doc, style=MD_LIST_STYLES[ordered][depth])
+        for deeper in [d for d in self._list_nums if d > depth]:
+            del self._list_nums[deeper]
+        if ordered:
+            num_id = self._list_nums.get(depth)
+            if num_id is None:
+                num_id = self._list_nums[depth] = self.numbering.restart(MD_LIST_STYLES[True][depth])
+            numPr = p._p.get_or_add_pPr().get_or_add_numPr()
+            numPr.get_or_add_ilvl().val = 0
+            numPr.get_or_add_numId().val = num_id
+        else:
+            self._list_nums[depth] = None
+        self._add_spans(p, spans)
+
+    def table(self, header, rows):
+        add_bulk_table(self.doc, [_plain_text(cell) for cell in header], rows,
+                       write_cell=self._write_cell)
+
+    def _write_cell(self, p, text):
+        self._add_spans(Paragraph(p, self._body), parse_inline(text))
+
+    def quote(self, spans):
+        self._add_spans(add_paragraph(self.doc, style='Intense Quote'), spans)
+
+    def code(self, text):
+        add_run(add_paragraph(self.doc, style='No Spacing'), text, 'code-block')
+
+    def image(self, alt, src):
+        if '://' in src:
+            # Remote images are not fetched; keep the reference as a link
+            self.paragraph([(alt or src, '', src)])
+            return
+        add_image(self.doc, self.images, src, alt)
+
+    def rule(self):
+        self._pending_rule = True
+
+def render_markdown(doc, lines, images=None):
+    """Render Markdown source lines into `doc`"""
+    MarkdownRenderer(doc, images=images).render(iter_markdown_blocks(lines))
+    return doc
+
+def iter_markdown_sections(lines):
+    """Group Markdown lines into top-level sections, one per H1 (or "#") heading
+
+    A rule or blank lines just before a heading travel with the section they
+    introduce, so each section renders the same on its own as in sequence.
+    """
+    section = []
+    fenced = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            fenced = not fenced
+        m = None if fenced else _MD_HEADING.match(stripped)
+        if m and MD_HEADING_LEVELS.get(len(m.group(1)), 3) <= 1 and section:
+            carry = []
+            while section and (not section[-1].strip() or _MD_RULE.match(section[-1].rstrip('\r\n'))):
+                carry.append(section.pop())
+            if section:
+                yield section
+            section = carry[::-1]
+        section.append(line)
+    if section:
+        yield section
+
+def convert_markdown_guide(markdown_path=GUIDE_MARKDOWN_PATH, output_path=DEFAULT_OUTPUT_PATH,
+                           cache_dir=None, jobs=1, stream=False, compresslevel=None, deterministic=False,
+                           patch=None, minimize=False):
+    """Compile a Markdown guide straight to a formatted DOCX document
+
+    `output_path`, `compresslevel`, `deterministic`, `patch` and `minimize`
+    are as for create_voltic_user_guide().
+    """
+    doc = new_guide_document()
+    cache = SectionCache(cache_dir) if cache_dir else None
+    images = ImageIngestor(os.path.dirname(os.path.abspath(markdown_path)), jobs=jobs)
+    if jobs > 1:
+        with open(markdown_path, encoding='utf-8') as source:
+            images.prefetch(m.group('src') for m in map(_MD_IMAGE.match, map(str.strip, source))
+                            if m and '://' not in m.group('src'))
+    writer = StreamingDocxWriter(output_path, doc, compresslevel, deterministic, patch, minimize) \
+        if stream else None
+    with open(markdown_path, encoding='utf-8') as source, writer or contextlib.nullcontext():
+        if cache is None and jobs <= 1:
+            blocks = iter_markdown_blocks(source)
+            MarkdownRenderer(doc, images=images).render(writer.flushing(blocks) if writer else blocks)
+        else:
+            renderer = MarkdownRenderer(doc, images=images)
+            rendered, reused = build_sections(
+                doc, iter_markdown_guide_sections(source, renderer), cache, renderer.numbering, jobs,
+                after_section=writer.flush if writer else None)
+    if writer is None:
+        writer = write_package(doc, output_path, compresslevel, deterministic, patch, minimize)
+    report_written(writer, output_path)
+    print(f"📝 Source: {markdown_path}")
+    if images.prepared:
+        print(f"🖼️  Images: {images.summary()}")
+    if cache is not None:
+        print(f"♻️  Sections re-rendered: {rendered}, reused from cache: {reused}")
+
+# ==================== DOCUMENT SPEC & RENDER PLAN ====================
+
+GUIDE_SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voltic", "user_guide_spec.json")
+PLAN_CACHE_VERSION = 2
+PLAN_CACHE_DIR = os.path.join(TEMPLATE_CACHE_DIR, "plans") if TEMPLATE_CACHE_DIR else None
+
+# Render plan opcodes; each op is a flat tuple (opcode, *operands)
+OP_HEADING, OP_PARAGRAPH, OP_TABLE, OP_PAGE_BREAK, OP_TOC = range(5)
+SPEC_ALIGNMENTS = {
+    'left': WD_ALIGN_PARAGRAPH.LEFT,
+    'center': WD_ALIGN_PARAGRAPH.CENTER,
+    'right': WD_ALIGN_PARAGRAPH.RIGHT,
+    'justify': WD_ALIGN_PARAGRAPH.JUSTIFY,
+}
+# Block kind -> the option keys it accepts besides its own
+SPEC_BLOCK_OPTIONS = {
+    'heading': {'level'},
+    'paragraph': {'style', 'align'},
+    'table': set(),
+    'page_break': set(),
+    'toc': set(),
+}
+
+class RenderPlan:
+    """A validated document spec, compiled to tuples for a tight emit loop
+
+    `sections` is a tuple of (name, ops) pairs, where ops is a tuple of
+    opcode tuples: (OP_HEADING, text, level), (OP_PARAGRAPH, style, align,
+    runs) with runs as (text, format, url) triples, (OP_TABLE, header, rows,
+    style), (OP_PAGE_BREAK,) and (OP_TOC,). Only strings, numbers, None and
+    tuples appear, so the plan is cached as plain JSON.
+    """
+
+    __slots__ = ('sections', 'toc_descriptions', 'key')
+
+    def __init__(self, sections, toc_descriptions, key):
+        self.sections = sections
+        self.toc_descriptions = toc_descriptions
+        self.key = key
+
+@functools.lru_cache(maxsize=None)
+def _spec_style_names():
+    return frozenset(style.name for style in new_guide_document().styles)
+
+def _compile_runs(value, where):
+    if isinstance(value, str):
+        return ((value, None, None),) if value else ()
+    if not isinstance(value, list):
+        raise ValueError(f"{where}: expected text or a list of runs")
+    runs = []
+    for i, run in enumerate(value):
+        if isinstance(run, str):
+            runs.append((run, None, None))
+            continue
+        if not isinstance(run, dict) or not isinstance(run.get('text'), str):
+            raise ValueError(f"{where}[{i}]: a run is text or an object with \"text\"")
+        unknown = set(run).difference(('text', 'format', 'link'))
+        if unknown:
+            raise ValueError(f"{where}[{i}]: unknown run keys {', '.join(sorted(unknown))}")
+        fmt, url = run.get('format'), run.get('link')
+        if fmt is not None and fmt not in RUN_FORMATS:
+            raise ValueError(f"{where}[{i}]: unknown format {fmt!r}")
+        if url is not None and (fmt is not None or not isinstance(url, str)):
+            raise ValueError(f"{where}[{i}]: \"link\" is a URL string and takes no format")
+        runs.append((run['text'], fmt, url))
+    return tuple(runs)
+
+def _compile_block(block, where):
+    kinds = set(block).intersection(SPEC_BLOCK_OPTIONS) if isinstance(block, dict) else ()
+    if len(kinds) != 1:
+        raise ValueError(f"{where}: a block has exactly one of {', '.join(SPEC_BLOCK_OPTIONS)}")
+    kind = kinds.pop()
+    unknown = set(block).difference(SPEC_BLOCK_OPTIONS[kind], (kind,))
+    if unknown:
+        raise ValueError(f"{where}: unknown {kind} keys {', '.join(sorted(unknown))}")
+    value = block[kind]
+
+    if kind == 'heading':
+        level = block.get('level', 1)
+        if not isinstance(value, str) or not value:
+            raise ValueError(f"{where}: heading text must be a non-empty string")
+        if not isinstance(level, int) or not 0 <= level <= 9:
+            raise ValueError(f"{where}: heading level must be 0-9")
+        return (OP_HEADING, value, level)
+    if kind == 'paragraph':
+        style, align = block.get('style'), block.get('align')
+        if style is not None and style not in _spec_style_names():
+            raise ValueError(f"{where}: unknown paragraph style {style!r}")
+        if align is not None and align not in SPEC_ALIGNMENTS:
+            raise ValueError(f"{where}: align must be one of {', '.join(SPEC_ALIGNMENTS)}")
+        return (OP_PARAGRAPH, style, align, _compile_runs(value, f"{where}.paragraph"))
+    if kind == 'table':
+        if not isinstance(value, dict) or set(value).difference(('header', 'rows', 'style')):
+            raise ValueError(f"{where}: a table is an object with header, rows and an optional style")
+        header, rows = value.get('header'), value.get('rows', [])
+        style = value.get('style', 'Light Grid Accent 1')
+        if not isinstance(header, list) or not header or not all(isinstance(c, str) for c in header):
+            raise ValueError(f"{where}: table header must be a non-empty list of strings")
+        if style not in _spec_style_names():
+            raise ValueError(f"{where}: unknown table style {style!r}")
+        if not isinstance(rows, list):
+            raise ValueError(f"{where}: table rows must be a list")
+        for i, row in enumerate(rows):
+            if not isinstance(row, list) or len(row) > len(header) or \
+                    not all(isinstance(c, (str, int, float)) or c is None for c in row):
+                raise ValueError(f"{where}.rows[{i}]: expected at most {len(header)} text cells")
+        return (OP_TABLE, tuple(header), tuple(tuple(row) for row in rows), style)
+    if value is not True:
+        raise ValueError(f"{where}: {kind} takes true")
+    return (OP_PAGE_BREAK,) if kind == 'page_break' else (OP_TOC,)
+
+def compile_spec(spec):
+    """Validate a parsed document spec and compile it to (sections, toc_descriptions)
+
+    A spec is {"sections": [{"name": ..., "blocks": [...]}, ...]} with an
+    optional "toc_descriptions" {heading text: description} map. Blocks are
+    {"heading": text, "level": n}, {"paragraph": text or runs, "style": ...,
+    "align": ...}, {"table": {"header": [...], "rows": [[...]], "style": ...}},
+    {"page_break": true} and {"toc": true}. A run is plain text, {"text": ...,
+    "format": run format} or {"text": ..., "link": url}. Raises ValueError
+    naming the offending block.
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get('sections'), list):
+        raise ValueError("spec: expected an object with a \"sections\" list")
+    unknown = set(spec).difference(('sections', 'toc_descriptions'))
+    if unknown:
+        raise ValueError(f"spec: unknown keys {', '.join(sorted(unknown))}")
+    descriptions = spec.get('toc_descriptions', {})
+    if not isinstance(descriptions, dict) or not all(isinstance(v, str) for v in descriptions.values()):
+        raise ValueError("spec.toc_descriptions: expected an object of strings")
+
+    sections = []
+    for i, section in enumerate(spec['sections']):
+        where = f"sections[{i}]"
+        if not isinstance(section, dict) or not isinstance(section.get('blocks'), list) or \
+                set(section).difference(('name', 'blocks')):
+            raise ValueError(f"{where}: expected an object with \"name\" and a \"blocks\" list")
+        name = str(section.get('name', i))
+        ops = tuple(_compile_block(block, f"{where}.blocks[{j}]") for j, block in enumerate(section['blocks']))
+        sections.append((name, ops))
+    return tuple(sections), tuple(descriptions.items())
+
+def _restore_op(op):
+    # A cached op back to its tuple form, if it is one compile_spec() could produce
+    opcode, *operands = op
+    if opcode == OP_HEADING:
+        text, level = operands
+        if isinstance(text, str) and text and isinstance(level, int) and 0 <= level <= 9:
+            return (OP_HEADING, text, level)
+    elif opcode == OP_PARAGRAPH:
+        style, align, runs = operands
+        runs = tuple((text, fmt, url) for text, fmt, url in runs)
+        if (style is None or style in _spec_style_names()) and (align is None or align in SPEC_ALIGNMENTS) and \
+                all(isinstance(text, str) and (fmt is None or fmt in RUN_FORMATS) and
+                    (url is None or isinstance(url, str) and fmt is None) for text, fmt, url in runs):
+            return (OP_PARAGRAPH, style, align, runs)
+    elif opcode == OP_TABLE:
+        header, rows, style = operands
+        rows = tuple(map(tuple, rows))
+        if header and all(isinstance(c, str) for c in header) and style in _spec_style_names() and \
+                all(len(row) <= len(header) and all(isinstance(c, (str, int, float)) or c is None for c in row)
+                    for row in rows):
+            return (OP_TABLE, tuple(header), rows, style)
+    elif opcode in (OP_PAGE_BREAK, OP_TOC) and not operands:
+        return (opcode,)
+    raise ValueError(f"unexpected op {op!r:.60}")
+
+def _restore_plan(cached):
+    """Rebuild (sections, toc_descriptions) from a cached plan; raises ValueError if malformed
+
+    The cache is plain JSON, and every op is checked against the shapes
+    compile_spec() produces, so a tampered file is recompiled instead of
+    reaching the emitters.
+    """
+    try:
+        sections, descriptions = cached
+        sections = tuple((name, tuple(map(_restore_op, ops))) for name, ops in sections)
+        descriptions = tuple((heading, text) for heading, text in descriptions)
+        if not all(isinstance(name, str) for name, _ in sections) or \
+                not all(isinstance(heading, str) and isinstance(text, str) for heading, text in descriptions):
+            raise ValueError("names and descriptions must be strings")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Malformed plan cache: {e}") from e
+    return sections, descriptions
+
+def _parse_spec(data, path):
+    if path.endswith(('.yaml', '.yml')):
+        import yaml
+        return yaml.safe_load(data)
+    import json
+    return json.loads(data)
+
+def load_render_plan(path, cache_dir=PLAN_CACHE_DIR):
+    """Return the RenderPlan for a JSON or YAML spec file
+
+    Compiled plans are kept in `cache_dir` as JSON files keyed by a hash of
+    the spec bytes, so a repeat render of an unchanged spec skips spec
+    parsing and the full validation; see _restore_plan().
+    """
+    import json
+    with open(path, 'rb') as f:
+        data = f.read()
+    key = hashlib.sha256(data)
+    key.update(f"|{PLAN_CACHE_VERSION}|{sys.version_info[:2]}|{os.path.splitext(path)[1]}".encode())
+    key = key.hexdigest()
+    cache_path = os.path.join(cache_dir, f"plan-{key}.json") if cache_dir else None
+    if cache_path:
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                return RenderPlan(*_restore_plan(json.load(f)), key)
+        except (OSError, ValueError):
+            pass
+
+    sections, descriptions = compile_spec(_parse_spec(data, path))
+    if cache_path:
+        try:
+            make_cache_dir(cache_dir)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([sections, descriptions], f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return RenderPlan(sections, descriptions, key)
+
+@functools.lru_cache(maxsize=None)
+def guide_plan():
+    """The built-in guide's RenderPlan; GUIDE_SPEC_PATH is the single source of its content"""
+    return load_render_plan(GUIDE_SPEC_PATH)
+
+def guide_sections():
+    """(name, emitter) for each built-in guide section, in document order"""
+    return [(name, functools.partial(emit_plan, ops=ops)) for name, ops in guide_plan().sections]
+
+def new_plan_document(plan):
+    """A new guide document whose table of contents uses the plan's descriptions"""
+    doc = new_guide_document()
+    heading_index(doc.part).descriptions = dict(plan.toc_descriptions)
+    return doc
+
+def _emit_heading(doc, text, level):
+    add_heading(doc, text, level)
+
+def _emit_paragraph(doc, style, align, runs):
+    p = add_paragraph(doc, style=style)
+    if align is not None:
+        p.alignment = SPEC_ALIGNMENTS[align]
+    for text, fmt, url in runs:
+        if url is None:
+            add_run(p, text, fmt)
+        else:
+            add_hyperlink(p, url, text)
+
+def _emit_table(doc, header, rows, style):
+    add_bulk_table(doc, header, rows, style=style)
+
+def _emit_page_break(doc):
     add_page_break(doc)
 
-    # ==================== 6. AI-POWERED VARIATIONS ====================
-
-    doc.add_heading("6. AI-Powered Variations", level=1)
-    doc.add_paragraph("Location: /variations", style='Intense Quote')
-
-    doc.add_heading("Overview", level=2)
-    p = doc.add_paragraph(
-        "The Variations page is a dedicated workspace for generating AI-powered ad variations at scale. "
-        "It supports two sources:"
-    )
-
-    doc.add_paragraph("1. Competitor Ads — Generate variations inspired by competitor creatives", style='List Number')
-    doc.add_paragraph("2. Your Products — Generate variations starting from your product images (NEW)", style='List Number')
-
-    doc.add_heading("Asset-Based Variations (NEW FEATURE)", level=2)
-
-    # Highlight box for new feature
-    p = doc.add_paragraph()
-    p.add_run("✨ NEW FEATURE").bold = True
-    p.add_run(" — Upload your product images and generate variations with AI-powered editing while preserving product labels exactly.")
-
-    doc.add_paragraph()
-    doc.add_heading("How It Works:", level=3)
-
-    asset_steps = [
-        "Upload your product image OR select from asset library",
-        "Choose brand guideline (optional, for color palette)",
-        "Set creative options (angle, lighting, background)",
-        "Select strategies (Hero Product, Curiosity, Pain Point, etc.)",
-        "AI edits your product image using Gemini while preserving product labels exactly"
-    ]
-
-    for step in asset_steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_heading("Use Case:", level=3)
-    p = doc.add_paragraph()
-    p.add_run("Example: ").bold = True
-    p.add_run("\"Here's my vitamin bottle — create 6 variations with different backgrounds and lighting styles.\"")
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Perfect for: ").bold = True
-    p.add_run("E-commerce product photography transformation")
-
-    doc.add_heading("Channel Selection (NEW FEATURE)", level=2)
-    doc.add_paragraph("Choose the advertising platform to optimize copy for:")
-
-    # Create channel table
-    table = doc.add_table(rows=1, cols=2)
-    table.style = 'Light List Accent 1'
-
-    hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = 'Channel'
-    hdr_cells[1].text = 'Copy Style'
-
-    for cell in hdr_cells:
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-
-    channels = [
-        ('Facebook', 'Conversational, emoji-friendly, engagement-focused, longer storytelling'),
-        ('Instagram', 'Visual-first, hashtag-ready, shorter punchy copy, aspirational tone'),
-        ('TikTok', 'Gen-Z tone, trend-aware, ultra-short, casual and authentic'),
-        ('LinkedIn', 'Professional, thought-leadership tone, B2B-friendly, data-driven'),
-        ('Google Ads', 'Keyword-focused, direct response, respect character limits, action-oriented'),
+def _emit_toc(doc):
+    add_toc_anchor(doc)
+
+# Indexed by opcode
+_DOCX_EMITTERS = (_emit_heading, _emit_paragraph, _emit_table, _emit_page_break, _emit_toc)
+
+def emit_plan(doc, ops):
+    """Emit compiled plan ops into `doc` with the guide's emitters"""
+    emitters = _DOCX_EMITTERS
+    for op in ops:
+        emitters[op[0]](doc, *op[1:])
+
+def iter_plan_sections(plan, keyed=True):
+    """Yield (name, key, render, task) for each section of a RenderPlan
+
+    Hashing the emitters' source is the slowest part of a small build, so
+    with keyed=False (no cache to look sections up in) the key is just the
+    section name.
+    """
+    for name, ops in plan.sections:
+        key = section_key(repr(ops)) if keyed else name
+        yield name, key, functools.partial(emit_plan, ops=ops), ('plan', ops)
+
+def render_spec(spec_path=GUIDE_SPEC_PATH, output_path=DEFAULT_OUTPUT_PATH, cache_dir=None, jobs=1,
+                stream=False, compresslevel=None, deterministic=False, patch=None, minimize=False):
+    """Render a declarative document spec to DOCX
+
+    Arguments after `spec_path` are as for create_voltic_user_guide().
+    """
+    started = time.perf_counter()
+    plan = load_render_plan(spec_path)
+    loaded = time.perf_counter()
+    doc = new_plan_document(plan)
+    cache = SectionCache(cache_dir) if cache_dir else None
+
+    if stream:
+        with StreamingDocxWriter(output_path, doc, compresslevel, deterministic, patch, minimize) as writer:
+            rendered, reused = build_sections(doc, iter_plan_sections(plan), cache, jobs=jobs,
+                                              after_section=writer.flush)
+    else:
+        rendered, reused = build_sections(doc, iter_plan_sections(plan), cache, jobs=jobs)
+        add_toc_entries(doc)
+        writer = write_package(doc, output_path, compresslevel, deterministic, patch, minimize)
+    report_written(writer, output_path)
+    print(f"📐 Spec: {spec_path} ({len(plan.sections)} sections, plan loaded in {loaded - started:.3f}s)")
+    if cache is not None:
+        print(f"♻️  Sections re-rendered: {rendered}, reused from cache: {reused}")
+
+# ==================== MULTI-FORMAT OUTPUT: HTML & MARKDOWN EMITTERS ====================
+
+OUTPUT_FORMATS = ('docx', 'html', 'md')
+# Paragraph style -> (list kind, nesting depth) for the text emitters
+TEXT_LIST_STYLES = {
+    style: (ordered, depth)
+    for ordered, styles in MD_LIST_STYLES.items()
+    for depth, style in enumerate(styles)
+}
+# Guide paragraphs often carry a literal bullet, which lists add themselves
+_LEADING_BULLET = re.compile(r'^[•·]\s*')
+
+def _css_declarations(spec):
+    rules = []
+    if 'font' in spec:
+        rules.append(f"font-family: '{spec['font']}', monospace")
+    if spec.get('bold'):
+        rules.append("font-weight: bold")
+    if spec.get('italic'):
+        rules.append("font-style: italic")
+    if 'color' in spec:
+        rules.append("color: #%02x%02x%02x" % spec['color'])
+    if 'size' in spec:
+        rules.append(f"font-size: {spec['size']}pt")
+    if spec.get('underline'):
+        rules.append("text-decoration: underline")
+    return '; '.join(rules)
+
+@functools.lru_cache(maxsize=None)
+def html_stylesheet():
+    """CSS matching the guide's heading styles and named run formats"""
+    rules = [
+        "body { font-family: Calibri, Arial, sans-serif; font-size: 11pt; line-height: 1.45; "
+        "max-width: 48em; margin: 2em auto; padding: 0 1em; }",
+        "table { border-collapse: collapse; margin: 0.8em 0; }",
+        "th, td { border: 1px solid #c0c0c0; padding: 0.3em 0.6em; text-align: left; }",
+        "th { background: #dbe5f1; }",
+        "hr.page-break { border: 0; break-after: page; margin: 2em 0; }",
+        ".intense-quote { border-left: 3px solid #0070c0; color: #0070c0; font-style: italic; "
+        "padding-left: 1em; }",
+        ".toc li { margin-bottom: 0.4em; }",
     ]
-
-    for channel, style in channels:
-        row_cells = table.add_row().cells
-        row_cells[0].text = channel
-        row_cells[1].text = style
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Default: ").bold = True
-    p.add_run("Facebook (most versatile)")
-
-    doc.add_heading("Strategy Descriptions", level=2)
-
-    strategies = [
-        ("Hero Product",
-         "Text: Product name in headline, feature-benefit structure\n"
-         "Image: Product centered, clean professional look, prominent focal point\n"
-         "Best For: E-commerce, product launches, clear value props"),
-
-        ("Curiosity",
-         "Text: Pattern-interrupt headline, 'What if...' or 'The secret to...' hooks\n"
-         "Image: Dramatic lighting, unexpected angle, visually intriguing composition\n"
-         "Best For: Engagement campaigns, top-of-funnel awareness"),
-
-        ("Pain Point",
-         "Text: Calls out specific problem, positions product as solution\n"
-         "Image: Visual contrast or metaphor, product appears as clear solution\n"
-         "Best For: Problem-aware audiences, consideration stage"),
-
-        ("Proof Point",
-         "Text: Stats, testimonials, social proof, 'Join 10,000+ customers'\n"
-         "Image: Premium, trustworthy, aspirational quality, credibility cues\n"
-         "Best For: Conversion campaigns, overcoming objections"),
-
-        ("Image Only",
-         "Text: Minimal or no text, product name only\n"
-         "Image: Stunning, eye-catching product photo, high production value\n"
-         "Best For: Visual platforms (Instagram), brand awareness"),
-
-        ("Text Only",
-         "Text: Long-form copy, storytelling, detailed explanation\n"
-         "Image: Simple background with product, text is the hero\n"
-         "Best For: Complex products, educational content"),
-    ]
-
-    for strategy, details in strategies:
-        doc.add_heading(f"{strategy}", level=3)
-        for line in details.split('\n'):
-            if line.strip():
-                if ':' in line:
-                    parts = line.split(':', 1)
-                    p = doc.add_paragraph()
-                    p.add_run(parts[0] + ': ').bold = True
-                    p.add_run(parts[1].strip())
+    for name, (size, color) in GUIDE_STYLES.items():
+        selector = 'h1' if name == 'Title' else f"h{int(name.split()[-1]) + 1}, .{heading_slug(name)}"
+        rules.append(f"{selector} {{ {_css_declarations({'size': size, 'color': color})}; }}")
+    for name, spec in RUN_FORMATS.items():
+        rules.append(f".{name} {{ {_css_declarations(spec)}; }}")
+    return '\n'.join(rules)
+
+class _TextEmitter:
+    """Shared state for the HTML and Markdown emitters: output parts, lists and TOC
+
+    Each emitter keeps its own HeadingIndex, so heading ids and "#slug"
+    anchors match the DOCX bookmarks. Output is collected as strings and the
+    TOC, whose entries are only known at the end, is spliced in by write().
+    """
+
+    def __init__(self, descriptions=()):
+        self.index = HeadingIndex()
+        self.index.descriptions = dict(descriptions)
+        self.parts = []
+        self.toc_at = None
+        self._list = None  # (ordered, depth) of the open list
+        self.handlers = (self.heading, self.paragraph, self.table, self.page_break, self.toc)
+
+    def toc(self):
+        self.close_list()
+        self.toc_at = len(self.parts)
+        self.index.mark_toc(None)
+
+    def write(self, path):
+        self.close_list()
+        if self.toc_at is not None:
+            self.parts.insert(self.toc_at, self.render_toc(self.index.toc_entries()))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.header())
+            f.writelines(self.parts)
+            f.write(self.footer())
+
+    def header(self):
+        return ''
+
+    def footer(self):
+        return ''
+
+class HtmlEmitter(_TextEmitter):
+    """Render plan ops as one standalone HTML page with an embedded stylesheet"""
+
+    def __init__(self, descriptions=(), title=GUIDE_PROPERTIES['title']):
+        super().__init__(descriptions)
+        self.title = title
+
+    def close_list(self):
+        if self._list is not None:
+            self.parts.append('</ol>\n' if self._list[0] else '</ul>\n')
+            self._list = None
+
+    def _inline(self, runs, strip_bullet=False):
+        html = []
+        for text, fmt, url in runs:
+            if strip_bullet and not html:
+                text = _LEADING_BULLET.sub('', text)
+            text = xml_escape(text).replace('\n', '<br>\n')
+            if url is not None:
+                html.append(f'<a href="{xml_escape(url).replace(chr(34), "&quot;")}">{text}</a>')
+            elif fmt is not None:
+                html.append(f'<span class="{fmt}">{text}</span>')
+            else:
+                html.append(text)
+        return ''.join(html)
+
+    def heading(self, text, level):
+        self.close_list()
+        slug = self.index.add(level, text)[2]
+        tag = f"h{min(level + 1, 6)}"
+        self.parts.append(f'<{tag} id="{xml_escape(slug)}">{xml_escape(text)}</{tag}>\n')
+
+    def paragraph(self, style, align, runs):
+        kind = TEXT_LIST_STYLES.get(style)
+        html = self._inline(runs, kind is not None)
+        if kind is not None:
+            if self._list != kind:
+                self.close_list()
+                self._list = kind
+                depth = f' class="depth-{kind[1] + 1}"' if kind[1] else ''
+                self.parts.append(f"<ol{depth}>\n" if kind[0] else f"<ul{depth}>\n")
+            self.parts.append(f"<li>{html}</li>\n")
+            return
+        self.close_list()
+        if not html.strip():
+            return
+        attrs = f' class="{heading_slug(style)}"' if style else ''
+        if align is not None:
+            attrs += f' style="text-align: {align}"'
+        self.parts.append(f"<p{attrs}>{html}</p>\n")
+
+    def table(self, header, rows, style):
+        self.close_list()
+        cell = lambda value: xml_escape('' if value is None else str(value))
+        html = [f'<table class="{heading_slug(style)}">\n<thead><tr>',
+                ''.join(f"<th>{cell(value)}</th>" for value in header), '</tr></thead>\n<tbody>\n']
+        for row in rows:
+            html.append(f"<tr>{''.join(f'<td>{cell(value)}</td>' for value in row)}</tr>\n")
+        html.append('</tbody>\n</table>\n')
+        self.parts.append(''.join(html))
+
+    def page_break(self):
+        self.close_list()
+        self.parts.append('<hr class="page-break">\n')
+
+    def render_toc(self, entries):
+        items = []
+        for level, text, slug, bookmark_id, bookmark in entries:
+            description = self.index.descriptions.get(text)
+            note = f'<br>\n<span class="toc-description">{xml_escape(description)}</span>' if description else ''
+            items.append(f'<li><a class="label-bold" href="#{xml_escape(slug)}">{xml_escape(text)}</a>{note}</li>\n')
+        return f'<ul class="toc">\n{"".join(items)}</ul>\n'
+
+    def header(self):
+        return (f'<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+                f'<title>{xml_escape(self.title)}</title>\n<style>\n{html_stylesheet()}\n</style>\n'
+                f'</head>\n<body>\n')
+
+    def footer(self):
+        return '</body>\n</html>\n'
+
+class MarkdownEmitter(_TextEmitter):
+    """Render plan ops as normalized Markdown that the Markdown front end reads back
+
+    Headings follow MD_HEADING_LEVELS, page breaks become "---" rules (which
+    the front end turns back into breaks before sections) and run formats map
+    to **bold**, *italic* and `code` by their bold/italic/font settings.
+    """
+
+    def close_list(self):
+        if self._list is not None:
+            self.parts.append('\n')
+            self._list = None
+
+    def _block(self, text):
+        self.close_list()
+        self.parts.append(f"{text}\n\n")
+
+    @staticmethod
+    def _inline(runs, strip_bullet=False):
+        md = []
+        for text, fmt, url in runs:
+            if strip_bullet and not md:
+                text = _LEADING_BULLET.sub('', text)
+            text = text.replace('\n', ' ')
+            spec = RUN_FORMATS.get(fmt, {}) if url is None else {}
+            core = text.strip()
+            if url is not None:
+                md.append(f"[{text}]({url})")
+            elif core and (spec.get('font') or spec.get('bold') or spec.get('italic')):
+                mark = '`' if spec.get('font') else '**' if spec.get('bold') else '*'
+                # Markers hug the text; surrounding spaces stay outside them
+                md.append(text[:len(text) - len(text.lstrip())] + f"{mark}{core}{mark}"
+                          + text[len(text.rstrip()):])
+            else:
+                md.append(text)
+        return ''.join(md)
+
+    def heading(self, text, level):
+        self.index.add(level, text)
+        depth = next((d for d, lvl in MD_HEADING_LEVELS.items() if lvl == level), len(MD_HEADING_LEVELS) + 1)
+        self._block(f"{'#' * min(depth, 6)} {text}")
+
+    def paragraph(self, style, align, runs):
+        kind = TEXT_LIST_STYLES.get(style)
+        text = self._inline(runs, kind is not None).strip()
+        if kind is not None:
+            if self._list is not None and self._list[0] != kind[0] and self._list[1] == kind[1]:
+                self.close_list()
+            self._list = kind
+            marker = '1.' if kind[0] else '-'
+            self.parts.append(f"{'   ' * kind[1]}{marker} {text}\n")
+        elif text:
+            self._block(f"> {text}" if style == 'Intense Quote' else text)
+        else:
+            self.close_list()
+
+    def table(self, header, rows, style):
+        cell = lambda value: '' if value is None else str(value).replace('\n', ' ').replace('|', '\\|')
+        lines = [f"| {' | '.join(map(cell, header))} |", f"|{'---|' * len(header)}"]
+        lines.extend(f"| {' | '.join(cell(value) for value in row)} |" for row in rows)
+        self._block('\n'.join(lines))
+
+    def page_break(self):
+        self._block('---')
+
+    def render_toc(self, entries):
+        lines = []
+        for level, text, slug, bookmark_id, bookmark in entries:
+            description = self.index.descriptions.get(text)
+            lines.append(f"- [{text}](#{slug})" + (f" — {description}" if description else ''))
+        return '\n'.join(lines) + '\n\n'
+
+def render_spec_formats(spec_path=GUIDE_SPEC_PATH, output_path=DEFAULT_OUTPUT_PATH, formats=OUTPUT_FORMATS,
+                        compresslevel=None, deterministic=False, patch=None, minimize=False):
+    """Render a spec to DOCX, HTML and/or Markdown from one walk over its plan
+
+    Every op is handed to each requested emitter in turn, so the plan is
+    traversed once whatever the number of formats. The DOCX is written to
+    `output_path`; the HTML and Markdown go next to it as .html and .md.
+    """
+    started = time.perf_counter()
+    plan = load_render_plan(spec_path)
+    stem = os.path.splitext(output_path)[0]
+    handlers, outputs = [], []
+    if 'docx' in formats:
+        doc = new_plan_document(plan)
+        handlers.append(tuple(functools.partial(emit, doc) for emit in _DOCX_EMITTERS))
+    for fmt, emitter_class in (('html', HtmlEmitter), ('md', MarkdownEmitter)):
+        if fmt in formats:
+            emitter = emitter_class(plan.toc_descriptions)
+            handlers.append(emitter.handlers)
+            outputs.append((f"{stem}.{fmt}", emitter))
+
+    with profile_span('walk'):
+        for name, ops in plan.sections:
+            for op in ops:
+                code, args = op[0], op[1:]
+                for handler in handlers:
+                    handler[code](*args)
+    walked = time.perf_counter()
+
+    timings = []
+    if 'docx' in formats:
+        add_toc_entries(doc)
+        writer = write_package(doc, output_path, compresslevel, deterministic, patch, minimize)
+        name = output_name(output_path) + (" (unchanged, not rewritten)" if writer.skipped else '')
+        timings.append(('docx', name, time.perf_counter()))
+    for path, emitter in outputs:
+        with profile_span(f"save:{os.path.splitext(path)[1][1:]}"):
+            emitter.write(path)
+        timings.append((os.path.splitext(path)[1][1:], path, time.perf_counter()))
+
+    print(f"✅ Rendered {', '.join(fmt for fmt, _, _ in timings)} from one pass over {spec_path}")
+    print(f"⏱️  walk {walked - started:.3f}s" + ''.join(
+        f", {fmt} {done - previous:.3f}s" for (fmt, _, done), previous in
+        zip(timings, [walked] + [done for _, _, done in timings])))
+    for fmt, path, _ in timings:
+        print(f"📄 {path}")
+
+# ==================== SECTION BUILD: FRAGMENT CACHE & PROCESS POOL ====================
+
+FRAGMENT_CACHE_VERSION = 2
+
+class SectionCache:
+    """On-disk store of rendered w:body fragments keyed by section content hash"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        make_cache_dir(cache_dir)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        import json
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, fragment):
+        import json
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(fragment, f)
+        os.replace(tmp_path, path)
+
+@functools.lru_cache(maxsize=None)
+def _renderer_fingerprint():
+    """Hash of everything besides section content that shapes rendered XML"""
+    import inspect
+    h = hashlib.sha256()
+    h.update(f"{FRAGMENT_CACHE_VERSION}|{getattr(docx, '__version__', '')}".encode())
+    h.update(repr((GUIDE_STYLES, RUN_FORMATS, MD_HEADING_LEVELS, MD_LIST_STYLES,
+                   MD_RUN_FORMATS, MD_LINK_FORMATS, DIVIDER_TEXT)).encode())
+    for obj in (add_page_break, _new_run, _new_hyperlink, add_hyperlink, add_internal_link, new_guide_document,
+                run_format, add_paragraph, add_run, add_bulk_table, _bulk_row_xml, parse_inline, iter_markdown_blocks,
+                ListNumbering, MarkdownRenderer, add_heading, _add_bookmark, HeadingIndex, emit_plan,
+                _emit_paragraph):
+        h.update(inspect.getsource(obj).encode())
+    return h.hexdigest()
+
+def section_key(*parts):
+    """Cache key for a section: its content plus the renderer fingerprint"""
+    h = hashlib.sha256(_renderer_fingerprint().encode())
+    for part in parts:
+        h.update(b'\0')
+        h.update(part.encode())
+    return h.hexdigest()
+
+def iter_guide_sections(keyed=True):
+    """Yield (name, key, render, task) for each built-in guide section"""
+    return iter_plan_sections(guide_plan(), keyed)
+
+def iter_markdown_guide_sections(lines, renderer):
+    """Yield (name, key, render, task) for each top-level section of a Markdown guide"""
+    for section in iter_markdown_sections(lines):
+        name = next((line.strip().lstrip('#').strip() for line in section if line.startswith('#')), '')
+        key = section_key(''.join(section))
+        render = lambda doc, section=section: renderer.render(iter_markdown_blocks(section))
+        yield name, key, render, ('markdown', section)
+
+def _capture_fragment(doc, elements, nums, headings):
+    """Serialize rendered body elements plus the links, lists and headings they reference
+
+    Returns None when the section relates to anything other than external
+    hyperlinks (e.g. images), since those parts cannot be spliced back.
+    """
+    rels = doc.part.rels
+    links = {}
+    for element in elements:
+        for node in element.iter():
+            for attr, value in node.attrib.items():
+                if not attr.startswith(_R_NS):
+                    continue
+                rel = rels.get(value)
+                if rel is None or not rel.is_external or rel.reltype != RT.HYPERLINK:
+                    return None
+                links[value] = rel.target_ref
+    return {
+        'xml': ''.join(etree.tostring(el, encoding='unicode') for el in elements),
+        'links': links,
+        'nums': [etree.tostring(num, encoding='unicode') for num in nums],
+        'headings': [[level, text] for level, text, *_ in headings],
+    }
+
+def _splice_fragment(doc, fragment, numbering):
+    """Append a cached fragment, remapping its relationship, numbering and bookmark ids
+
+    The fragment's headings are added to the document's heading index in
+    order, so they get the slugs and bookmarks a direct render would give.
+    """
+    wrapper = parse_xml(f"<w:body {nsdecls('w', 'r')}>{fragment['xml']}</w:body>")
+    num_ids = {}
+    for num_xml in fragment['nums']:
+        num = parse_xml(num_xml)
+        old_id = num.get(qn('w:numId'))
+        num_ids[old_id] = str(numbering.add(num))
+
+    part = doc.part
+    index = heading_index(part)
+    headings = iter(fragment['headings'])
+    rel_ids, bookmark_ids = {}, {}
+    r_id, num_id_tag, val = qn('r:id'), qn('w:numId'), qn('w:val')
+    start_tag, end_tag, w_id, w_name = qn('w:bookmarkStart'), qn('w:bookmarkEnd'), qn('w:id'), qn('w:name')
+    for node in wrapper.iter():
+        old_rid = node.get(r_id)
+        if old_rid is not None:
+            new_rid = rel_ids.get(old_rid)
+            if new_rid is None:
+                new_rid = rel_ids[old_rid] = relate_hyperlink(part, fragment['links'][old_rid])
+            node.set(r_id, new_rid)
+        elif num_ids and node.tag == num_id_tag and node.get(val) in num_ids:
+            node.set(val, num_ids[node.get(val)])
+        elif node.tag == start_tag:
+            if node.get(w_name) == TOC_BOOKMARK:
+                new_id = index.new_id()
+                index.mark_toc(node.getparent())
+            else:
+                level, text = next(headings)
+                _, _, _, new_id, name = index.add(level, text)
+                node.set(w_name, name)
+            bookmark_ids[node.get(w_id)] = str(new_id)
+            node.set(w_id, str(new_id))
+        elif node.tag == end_tag:
+            node.set(w_id, bookmark_ids[node.get(w_id)])
+
+    anchor = doc.element.body.get_or_add_sectPr()
+    for element in list(wrapper):
+        anchor.addprevious(element)
+
+_scratch = None
+
+def _scratch_document():
+    """Return this process's scratch document, reset to a freshly styled state"""
+    global _scratch
+    if _scratch is None:
+        doc = new_guide_document()
+        _scratch = (doc, set(doc.part.rels), len(doc.part.numbering_part.element.num_lst))
+    doc, base_rels, base_nums = _scratch
+
+    body = doc.element.body
+    sectPr = body.get_or_add_sectPr()
+    for element in list(body):
+        if element is not sectPr:
+            body.remove(element)
+    numbering = doc.part.numbering_part.element
+    for num in numbering.num_lst[base_nums:]:
+        numbering.remove(num)
+    for rId in [rId for rId in doc.part.rels if rId not in base_rels]:
+        del doc.part.rels[rId]
+    _hyperlink_indexes.pop(doc.part, None)
+    _heading_indexes.pop(doc.part, None)
+    return doc
+
+def render_section_fragment(task):
+    """Render one section into a standalone document and return its fragment
+
+    `task` is a picklable ('markdown', lines) or ('plan', ops) pair, so this runs in worker processes. Returns None if the
+    section cannot be captured as a fragment.
+    """
+    kind, payload = task
+    if kind == 'markdown' and any(_MD_IMAGE.match(line.strip()) for line in payload):
+        # Image parts don't travel in fragments; the parent renders these sections
+        return None
+    doc = _scratch_document()
+    numbering = ListNumbering(doc)
+    if kind == 'plan':
+        emit_plan(doc, payload)
+    else:
+        MarkdownRenderer(doc, numbering).render(iter_markdown_blocks(payload))
+    sectPr = doc.element.body.get_or_add_sectPr()
+    elements = [element for element in doc.element.body if element is not sectPr]
+    index = _heading_indexes.get(doc.part)
+    return _capture_fragment(doc, elements, numbering.added, index.entries if index else ())
+
+def build_sections(doc, sections, cache=None, numbering=None, jobs=1, after_section=None):
+    """Render sections into `doc`, splicing cached fragments for unchanged ones
+
+    `sections` yields (name, key, render, task) tuples, where render(doc)
+    appends the section in place and `task` describes it for
+    render_section_fragment(). With jobs > 1, sections missing from the cache
+    render on a process pool and are spliced in document order, which gives
+    the same package parts as a serial build. `after_section()` is called once
+    each section is in the body (e.g. StreamingDocxWriter.flush). Returns the
+    number of sections rendered and reused.
+    """
+    numbering = numbering or ListNumbering(doc)
+    index = heading_index(doc.part)
+    anchor = doc.element.body.get_or_add_sectPr()
+    rendered = reused = 0
+
+    pool = futures = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        sections = list(sections)
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        futures = {
+            key: pool.submit(render_section_fragment, task)
+            for name, key, render, task in sections
+            if cache is None or cache.get(key) is None
+        }
+
+    try:
+        for name, key, render, task in sections:
+            if after_section is not None and rendered + reused:
+                after_section()
+            with profile_span(f"section:{name}", doc):
+                future = futures.get(key) if futures else None
+                fragment = cache.get(key) if cache is not None and future is None else None
+                if fragment is not None:
+                    _splice_fragment(doc, fragment, numbering)
+                    reused += 1
+                    continue
+
+                rendered += 1
+                if future is not None:
+                    fragment = future.result()
+                    if fragment is not None:
+                        _splice_fragment(doc, fragment, numbering)
+                        if cache is not None:
+                            cache.put(key, fragment)
+                        continue
+
+                before = anchor.getprevious()
+                nums_before = len(numbering.added)
+                headings_before = len(index.entries)
+                render(doc)
+                if cache is None or future is not None:
+                    continue
+
+                elements = []
+                element = before.getnext() if before is not None else doc.element.body[0]
+                while element is not anchor:
+                    elements.append(element)
+                    element = element.getnext()
+                fragment = _capture_fragment(doc, elements, numbering.added[nums_before:],
+                                             index.entries[headings_before:])
+                if fragment is not None:
+                    cache.put(key, fragment)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return rendered, reused
+
+# ==================== XML MINIMIZATION ====================
+
+# Line height relative to font size (Calibri's ascent plus descent), for folding spacer paragraphs
+SPACER_LINE_FACTOR = 1.22
+# Largest spacing Word accepts, in twips
+SPACING_MAX = 31680
+_W_P, _W_R, _W_T, _W_BR = qn('w:p'), qn('w:r'), qn('w:t'), qn('w:br')
+_W_PPR, _W_RPR, _W_SPACING = qn('w:pPr'), qn('w:rPr'), qn('w:spacing')
+_XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+_RUN_CONTENT = {_W_T, _W_BR, qn('w:tab')}
+# Paragraph properties kept even when the style gives the same value
+_PPR_KEEP = {qn('w:pStyle'), qn('w:numPr'), _W_RPR, qn('w:sectPr'), qn('w:pPrChange')}
+# The only paragraph properties a spacer paragraph may carry
+_SPACER_PPR = {qn('w:pStyle'), _W_SPACING, qn('w:jc')}
+
+def _xml_size(element):
+    # UTF-8 bytes of an element as it appears in the body, without the xmlns tostring() adds
+    return len(_XMLNS_DECL.sub('', etree.tostring(element, encoding='unicode')).encode('utf-8'))
+
+def _same_xml(a, b):
+    """Whether two property elements are equal in tag, attributes and children"""
+    return (a.tag == b.tag and dict(a.attrib) == dict(b.attrib) and len(a) == len(b)
+            and all(_same_xml(x, y) for x, y in zip(a, b)))
+
+class XmlMinimizer:
+    """Shrink body blocks before they are serialized, without changing how they render
+
+    Direct run and paragraph properties that the paragraph's style already
+    gives are dropped, adjacent runs with equal w:rPr are merged into one,
+    and empty spacer paragraphs (bare add_paragraph() calls, "\n" * 8) are
+    folded into the spacing before the next paragraph, or after the previous
+    one, by the height they took up, but only where that leaves less XML
+    than the spacers themselves: a bare <w:p/> is smaller than a new
+    w:spacing. `stats` accumulates what changed and the element counts and
+    bytes before and after.
+    """
+
+    def __init__(self, doc):
+        styles = doc.styles.element
+        self._styles = {style.get(qn('w:styleId')): style for style in styles.iterchildren(qn('w:style'))}
+        self._default_style = next(
+            (style_id for style_id, style in self._styles.items()
+             if style.get(qn('w:type')) == 'paragraph' and style.get(qn('w:default')) in ('1', 'true')), None)
+        self._defaults = styles.find(qn('w:docDefaults'))
+        self._resolved = {}
+        self.stats = dict.fromkeys(('elements_before', 'elements_after', 'bytes_before', 'bytes_after',
+                                    'properties', 'runs', 'spacers'), 0)
+
+    def _resolve(self, style_id):
+        # (pPr, rPr) of a paragraph style as {tag: element}, derived styles overriding basedOn
+        resolved = self._resolved.get(style_id)
+        if resolved is None:
+            key = style_id
+            chain, seen = [], set()
+            while style_id in self._styles and style_id not in seen:
+                seen.add(style_id)
+                style = self._styles[style_id]
+                chain.append(style)
+                based_on = style.find(qn('w:basedOn'))
+                style_id = based_on.get(qn('w:val')) if based_on is not None else None
+            ppr, rpr = {}, {}
+            for style in reversed(chain):
+                for props, tag in ((ppr, _W_PPR), (rpr, _W_RPR)):
+                    element = style.find(tag)
+                    if element is not None:
+                        props.update((child.tag, child) for child in element)
+            resolved = self._resolved[key] = (ppr, rpr)
+        return resolved
+
+    def _style_of(self, p):
+        pPr = p.find(_W_PPR)
+        pStyle = pPr.find(qn('w:pStyle')) if pPr is not None else None
+        return pStyle.get(qn('w:val')) if pStyle is not None else self._default_style
+
+    def _default(self, kind, tag):
+        # Property `tag` from docDefaults' pPrDefault or rPrDefault
+        element = self._defaults.find(f"{qn(f'w:{kind}Default')}/{qn(f'w:{kind}')}/{tag}") \
+            if self._defaults is not None else None
+        return element
+
+    def _spacing(self, p, attr):
+        """Effective w:spacing attribute of a paragraph in twips: direct, style, then defaults"""
+        name = qn(f'w:{attr}')
+        pPr = p.find(_W_PPR)
+        for spacing in (pPr.find(_W_SPACING) if pPr is not None else None,
+                        self._resolve(self._style_of(p))[0].get(_W_SPACING),
+                        self._default('pPr', _W_SPACING)):
+            if spacing is not None and spacing.get(name) is not None:
+                return spacing
+        return None
+
+    def _spacing_value(self, p, attr, default=0):
+        spacing = self._spacing(p, attr)
+        return int(spacing.get(qn(f'w:{attr}'))) if spacing is not None else default
+
+    def _contextual(self, p):
+        pPr = p.find(_W_PPR)
+        return (pPr is not None and pPr.find(qn('w:contextualSpacing')) is not None) or \
+            qn('w:contextualSpacing') in self._resolve(self._style_of(p))[0]
+
+    def _drop_style_properties(self, p):
+        ppr, rpr = self._resolve(self._style_of(p))
+        dropped = 0
+        if not ppr and not rpr:
+            return dropped
+        pPr = p.find(_W_PPR)
+        if pPr is not None:
+            for child in list(pPr):
+                given = ppr.get(child.tag)
+                if child.tag not in _PPR_KEEP and given is not None and _same_xml(child, given):
+                    pPr.remove(child)
+                    dropped += 1
+        if rpr:
+            for r in p.iter(_W_R):
+                rPr = r.find(_W_RPR)
+                if rPr is None or rPr.find(qn('w:rStyle')) is not None:
+                    continue
+                for child in list(rPr):
+                    given = rpr.get(child.tag)
+                    if given is not None and _same_xml(child, given):
+                        rPr.remove(child)
+                        dropped += 1
+                if not len(rPr):
+                    r.remove(rPr)
+        return dropped
+
+    @staticmethod
+    def _plain_run(r):
+        # Runs holding only properties, text, breaks and tabs can be merged
+        return all(child.tag == _W_RPR or child.tag in _RUN_CONTENT for child in r)
+
+    def _merge_runs(self, r):
+        """Merge the runs after `r` with the same properties into it; returns how many"""
+        rPr = r.find(_W_RPR)
+        merged, plain = 0, None
+        following = r.getnext()
+        while following is not None and following.tag == _W_R:
+            # Differing properties, the common case, fail fastest, so they are checked first
+            other = following.find(_W_RPR)
+            if (rPr is None) != (other is None) or (rPr is not None and not _same_xml(rPr, other)):
+                break
+            if plain is None:
+                plain = self._plain_run(r)
+            if not plain or not self._plain_run(following):
+                break
+            r.extend([child for child in following if child.tag != _W_RPR])
+            r.getparent().remove(following)
+            merged += 1
+            following = r.getnext()
+        return merged
+
+    @staticmethod
+    def _join_text(r):
+        # Adjacent w:t in one run become a single w:t
+        previous = None
+        for child in list(r):
+            if child.tag == _W_T and previous is not None:
+                previous.text = (previous.text or '') + (child.text or '')
+                r.remove(child)
+                text = previous.text
+                if text != text.strip():
+                    previous.set(_XML_SPACE, 'preserve')
+                continue
+            previous = child if child.tag == _W_T else None
+
+    def _spacer_lines(self, p):
+        """Lines an empty spacer paragraph occupies, or None if `p` carries anything"""
+        lines = 1
+        for child in p:
+            if child.tag == _W_PPR:
+                if any(c.tag not in _SPACER_PPR for c in child):
+                    return None
+            elif child.tag != _W_R:
+                return None
+            else:
+                for c in child:
+                    if c.tag == _W_BR and c.get(qn('w:type')) in (None, 'textWrapping'):
+                        lines += 1
+                    elif c.tag != _W_T or c.text:
+                        return None
+        return lines
+
+    def _spacer_height(self, p, lines):
+        # The spacer's lines at its style's font size and line spacing, plus its own spacing
+        size = self._resolve(self._style_of(p))[1].get(qn('w:sz'))
+        if size is None:
+            size = self._default('rPr', qn('w:sz'))
+        font = int(size.get(qn('w:val'))) * 10 if size is not None else 200
+        spacing = self._spacing(p, 'line')
+        line = font * SPACER_LINE_FACTOR
+        if spacing is not None:
+            value = int(spacing.get(qn('w:line')))
+            line = line * value / 240 if spacing.get(qn('w:lineRule'), 'auto') == 'auto' else \
+                max(value, line) if spacing.get(qn('w:lineRule')) == 'atLeast' else value
+        return round(lines * line) + self._spacing_value(p, 'before') + self._spacing_value(p, 'after')
+
+    def _add_spacing(self, p, attr, height):
+        value = min(self._spacing_value(p, attr) + height, SPACING_MAX)
+        p.get_or_add_pPr().get_or_add_spacing().set(qn(f'w:{attr}'), str(value))
+
+    def _fold_into(self, p, attr, height, spacers):
+        """Fold spacers into `p`'s spacing if the XML gets smaller; returns whether it did"""
+        pPr = p.find(_W_PPR)
+        saved = copy.deepcopy(pPr) if pPr is not None else None
+        size = _xml_size(p)
+        self._add_spacing(p, attr, height)
+        if _xml_size(p) - size < sum(map(_xml_size, spacers)):
+            for spacer in spacers:
+                spacer.getparent().remove(spacer)
+            return True
+        if saved is None:
+            p.remove(p.find(_W_PPR))
+        else:
+            p.replace(p.find(_W_PPR), saved)
+        return False
+
+    def _fold_spacers(self, siblings):
+        folded = 0
+        spacers, height, previous = [], 0, None
+        for element in siblings + [None]:
+            lines = self._spacer_lines(element) if element is not None and element.tag == _W_P else None
+            if lines is not None:
+                spacers.append(element)
+                height += self._spacer_height(element, lines)
+                continue
+            if spacers:
+                following = element if element is not None and element.tag == _W_P else None
+                # Contextual spacing would swallow the spacing between two paragraphs of one style
+                together = following is not None and previous is not None and \
+                    self._style_of(following) == self._style_of(previous)
+                targets = [(p, attr) for p, attr in ((following, 'before'), (previous, 'after'))
+                           if p is not None and not (together and self._contextual(p))]
+                if any(self._fold_into(p, attr, height, spacers) for p, attr in targets):
+                    folded += len(spacers)
+                spacers, height = [], 0
+            previous = element if element is not None and element.tag == _W_P else None
+        return folded
+
+    def minimize(self, blocks):
+        """Minimize a run of sibling blocks (a body's children) in place
+
+        Candidates are found with XPath so blocks with nothing to change cost
+        little; the caller fills in the element and byte counts.
+        """
+        if not blocks:
+            return
+        parent = blocks[0].getparent()
+        stats = self.stats
+        default_ppr, default_rpr = self._resolve(self._default_style)
+        styled = './/w:p' if default_ppr or default_rpr else './/w:p[w:pPr/w:pStyle]'
+        for p in parent.xpath(styled):
+            stats['properties'] += self._drop_style_properties(p)
+
+        for r in parent.xpath('.//w:r[following-sibling::*[1][self::w:r]]'):
+            if r.getparent() is not None:
+                merged = self._merge_runs(r)
+                if merged:
+                    stats['runs'] += merged
+                    self._join_text(r)
+
+        tc = qn('w:tc')
+        containers = {p.getparent(): None for p in parent.xpath('.//w:p[not(.//w:t[. != ""])]')}
+        for container in containers:
+            if container is parent:
+                stats['spacers'] += self._fold_spacers(blocks)
+            elif container.tag == tc:
+                stats['spacers'] += self._fold_spacers([child for child in container if child.tag != qn('w:tcPr')])
+
+    def summary(self):
+        stats = self.stats
+        return (f"{stats['elements_before']:,} → {stats['elements_after']:,} elements, "
+                f"{stats['bytes_before'] / 1024:.1f} KB → {stats['bytes_after'] / 1024:.1f} KB "
+                f"({stats['runs']:,} runs merged, {stats['spacers']:,} spacer paragraphs folded, "
+                f"{stats['properties']:,} properties implied by styles dropped)")
+
+# ==================== STREAMING WRITER ====================
+
+STREAM_FLUSH_BLOCKS = 256
+_XMLNS_DECL = re.compile(r' xmlns:(\w+)="([^"]*)"')
+
+def zip_compression(compresslevel=None):
+    """Return (compression, compresslevel) for a zip level; 0 stores members uncompressed"""
+    if compresslevel == 0:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, compresslevel
+
+# Deterministic packages pin every timestamp to SOURCE_DATE_EPOCH when set
+# (the reproducible-builds convention), otherwise to the guide's version date
+DETERMINISTIC_DATE = datetime.datetime(2026, 2, 1)
+ZIP_EPOCH = datetime.datetime(1980, 1, 1)
+# Deterministic writes to a path are held in memory up to this size before spilling to disk
+DETERMINISTIC_SPOOL_BYTES = 32 * 1024 * 1024
+DIGEST_SUFFIX = '.sha256'
+
+def deterministic_date():
+    """The timestamp deterministic packages carry"""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if epoch:
+        return datetime.datetime.fromtimestamp(int(epoch), datetime.timezone.utc).replace(tzinfo=None)
+    return DETERMINISTIC_DATE
+
+class _HashingWriter:
+    """Write-only file wrapper that hashes everything written through it
+
+    With no seek() or tell(), zipfile writes members sequentially with data
+    descriptors instead of patching headers afterwards, so the hash covers
+    the final bytes exactly.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+def _read_raw_member(source, info):
+    """The stored bytes of a zip member, still compressed
+
+    Relies on zipfile internals; raises AttributeError if they have changed.
+    """
+    fp = source.fp
+    name_length, extra_length = zipfile._FH_FILENAME_LENGTH, zipfile._FH_EXTRA_FIELD_LENGTH
+    fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, fp.read(zipfile.sizeFileHeader))
+    fp.seek(header[name_length] + header[extra_length], os.SEEK_CUR)
+    return fp.read(info.compress_size)
+
+def _write_raw_member(zf, member, raw):
+    """Append a member whose data is already compressed, as ZipFile.writestr() would
+
+    `member` must carry the CRC, sizes and compress_type the raw bytes were
+    stored with. Relies on zipfile internals, all looked up before anything
+    is written, so an AttributeError from a changed zipfile leaves `zf`
+    untouched for the caller to fall back to writestr().
+    """
+    lock, writecheck, seekable = zf._lock, zf._writecheck, zf._seekable
+    descriptor_flag, descriptor_signature = zipfile._MASK_USE_DATA_DESCRIPTOR, zipfile._DD_SIGNATURE
+    with lock:
+        writecheck(member)
+        zf._didModify = True
+        zip64 = member.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        member.header_offset = zf.fp.tell()
+        if not seekable:
+            # Unseekable output gets a data descriptor after each member, as zipfile writes it
+            member.flag_bits |= descriptor_flag
+        zf.fp.write(member.FileHeader(zip64))
+        zf.fp.write(raw)
+        if not seekable:
+            zf.fp.write(struct.pack('<LLQQ' if zip64 else '<LLLL', descriptor_signature,
+                                    member.CRC, member.compress_size, member.file_size))
+        zf.filelist.append(member)
+        zf.NameToInfo[member.filename] = member
+        zf.start_dir = zf.fp.tell()
+
+def output_name(file):
+    """Name of an output path or stream for status messages"""
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file)
+    return getattr(file, 'name', '<stream>')
+
+class StreamingDocxWriter:
+    """Write a DOCX package whose word/document.xml is streamed as it is built
+
+    `file` is a path or any writable binary stream; it need not be seekable,
+    so the package can go straight to a socket or stdout. Content is built
+    into `doc` with the usual emitters (add_paragraph,
+    add_heading, add_bulk_table, add_hyperlink, the guide sections or
+    MarkdownRenderer). Each flush() serializes the finished body blocks into
+    the open zip member and removes them from the tree, so memory stays flat
+    however long the document gets. Styles, numbering, relationships and the
+    other parts are written from `doc` on close(), so the result is the same
+    package doc.save() would produce. Blocks after a table of contents anchor
+    are spooled to a temporary file until close(), when the entries generated
+    from the heading index are written ahead of them. A path is built in a
+    temporary file beside it and only replaced on close(), so a failed or
+    aborted build leaves the previous file as it was.
+
+    With deterministic=True, identical content gives a byte-identical
+    package: parts go in partname order, every member and the core
+    properties carry deterministic_date(), and `digest` is the sha256 of the
+    package, hashed as it is written. Relationship and numbering ids are
+    already allocated in document order. Output to a path is held in a spool
+    and only written out, next to a sha256sum-style DIGEST_SUFFIX file, when
+    it differs from the last build there; otherwise `skipped` is set and the
+    file is left untouched.
+
+    With `base`, the path of an earlier build (usually the output itself),
+    the package is patched: members whose bytes are unchanged since `base`
+    (same size and CRC-32) are copied from it raw, without decompressing or
+    recompressing them, and only changed parts are compressed again.
+    `copied` and `rewritten` count the two. A missing `base` just means a
+    full write.
+
+    With minimize=True, each batch of blocks goes through an XmlMinimizer
+    (merged runs, folded spacer paragraphs, no properties the styles already
+    give) before it is written; `minimizer.stats` has the before and after
+    counts.
+    """
+
+    def __init__(self, file, doc=None, compresslevel=None, deterministic=False, base=None, minimize=False):
+        self.doc = doc if doc is not None else new_guide_document()
+        self.blocks = 0
+        self.minimizer = XmlMinimizer(self.doc) if minimize else None
+        self.digest = None
+        self.skipped = False
+        self.base = base
+        self.copied = self.rewritten = 0
+        self._spill = None
+        self._target = self._hashing = self._replace = None
+        self._base = None
+        if base is not None:
+            try:
+                self._base = zipfile.ZipFile(base)
+            except FileNotFoundError:
+                pass
+        if deterministic:
+            date = deterministic_date()
+            self._date_time = max(date, ZIP_EPOCH).timetuple()[:6]
+            props = self.doc.core_properties
+            props.created = props.modified = date
+            props.last_modified_by = ''
+            props.revision = 1
+            if isinstance(file, (str, os.PathLike)):
+                import tempfile
+                self._target = file
+                file = tempfile.SpooledTemporaryFile(DETERMINISTIC_SPOOL_BYTES)
+            self._hashing = _HashingWriter(file)
+        else:
+            self._date_time = time.localtime()[:6]
+        if isinstance(file, (str, os.PathLike)):
+            # Build beside the output and swap it in on close, so a failed build leaves the
+            # previous file intact (and a base that is the output itself stays readable)
+            self._replace = file
+            file = f"{file}.{os.getpid()}.tmp"
+        self._file = file
+        self._compression, self._compresslevel = zip_compression(compresslevel)
+        self._zip = zipfile.ZipFile(self._hashing or file, 'w', self._compression,
+                                    compresslevel=self._compresslevel)
+        self._part = self.doc.part
+        self._sectPr = _body_anchor(self.doc)
+
+        root = self.doc.element
+        self._nsmap = dict(root.nsmap)
+        shell = etree.tostring(etree.Element(root.tag, attrib=dict(root.attrib), nsmap=root.nsmap),
+                               encoding='unicode')
+        self._stream = self._zip.open(self._member(self._part.partname.membername), 'w', force_zip64=True)
+        self._stream.write(b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n")
+        self._stream.write(f"{shell[:-2]}><w:body>".encode('utf-8'))
+
+    def _member(self, name):
+        # Members carry the writer's timestamp instead of zipfile's 1980 or "now"
+        member = zipfile.ZipInfo(name, self._date_time)
+        member.compress_type = self._compression
+        # As ZipFile sets it for members written by name; compress_level from Python 3.13
+        for attr in ('compress_level', '_compresslevel'):
+            try:
+                setattr(member, attr, self._compresslevel)
+                break
+            except AttributeError:
+                pass
+        member.external_attr = 0o600 << 16
+        return member
+
+    def _write(self, name, data):
+        # In patch mode, copy a member that is byte-identical in the base raw
+        if self._base is not None:
+            try:
+                info = self._base.getinfo(name)
+            except KeyError:
+                info = None
+            if info is not None and info.file_size == len(data) and info.compress_type == self._compression \
+                    and info.CRC == zlib.crc32(data):
+                member = self._member(name)
+                member.CRC, member.compress_size, member.file_size = info.CRC, info.compress_size, info.file_size
+                try:
+                    _write_raw_member(self._zip, member, _read_raw_member(self._base, info))
+                except AttributeError:
+                    # zipfile's internals changed; recompress the member instead
+                    pass
                 else:
-                    doc.add_paragraph(line.strip())
-
-    doc.add_heading("Cost", level=2)
-    p = doc.add_paragraph()
-    p.add_run("10 credits per strategy").bold = True
-    p.add_run(" (unchanged)")
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Example: ").italic = True
-    p.add_run("Generate 3 strategies = 30 credits")
-
-    add_page_break(doc)
-
-    # ==================== 7. AD GENERATOR ====================
-
-    doc.add_heading("7. Ad Generator (NEW FEATURE)", level=1)
-    doc.add_paragraph("Location: /ad-generator", style='Intense Quote')
-
-    # Highlight box
-    p = doc.add_paragraph()
-    p.add_run("✨ BRAND NEW FEATURE").bold = True
-    p.add_run(" — Create hundreds of ad variations in minutes by combining backgrounds with text.")
-
-    doc.add_heading("What is Ad Generator?", level=2)
-    p = doc.add_paragraph(
-        "A batch text overlay composition tool that lets you create M×N ad variations by combining:"
-    )
-    doc.add_paragraph("• M backgrounds (product images, lifestyle photos, brand assets)", style='List Bullet')
-    doc.add_paragraph("• N text variants (headlines, ad copy, CTAs)", style='List Bullet')
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Example: ").bold = True
-    p.add_run("5 backgrounds × 10 text variants = ")
-    p.add_run("50 ad previews ").bold = True
-    p.add_run("generated in ~20 seconds")
-
-    doc.add_heading("When to Use Ad Generator", level=2)
-
-    doc.add_paragraph("Best For:", style='Heading 3')
-    best_for = [
-        "Creating multiple ad creatives at scale",
-        "A/B testing different copy on the same visual",
-        "Brand awareness campaigns with consistent visuals",
-        "Social media content calendars"
-    ]
-    for item in best_for:
-        doc.add_paragraph(item, style='List Bullet')
-
-    doc.add_paragraph()
-    doc.add_paragraph("Not Ideal For:", style='Heading 3')
-    not_for = [
-        "Complex image editing (use Variations with Gemini instead)",
-        "Product photography transformation (use Asset-Based Variations)"
-    ]
-    for item in not_for:
-        doc.add_paragraph(item, style='List Bullet')
-
-    doc.add_heading("7-Step Workflow", level=2)
-
-    # Step 1
-    doc.add_heading("Step 1: Select Brand Guideline", level=3)
-    doc.add_paragraph("Links ads to your brand identity for consistent styling")
-    steps = [
-        "Click guideline dropdown",
-        "Select from existing brand guidelines",
-        "If none exist, create one in Brand Guidelines page first"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    # Step 2
-    doc.add_heading("Step 2: Select Background Images", level=3)
-    doc.add_paragraph("Choose product images or brand assets to use as backgrounds")
-    steps = [
-        "Asset grid shows all images linked to selected guideline",
-        "Click to select (multi-select enabled, up to 20)",
-        "Selected assets show checkmark overlay"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    # Step 3
-    doc.add_heading("Step 3: Enter Text Variants", level=3)
-    doc.add_paragraph("Write headlines, ad copy, or CTAs to test")
-    steps = [
-        "Start with one text input field",
-        "Type headline or ad copy (2-10 words works best)",
-        "Click '+ Add Variant' to add more fields (up to 20)",
-        "Click '×' to remove a variant"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Examples:").bold = True
-    examples = [
-        "\"Your Perfect Morning Starts Here ☕\"",
-        "\"Limited Time: 30% Off All Coffee\"",
-        "\"Voted #1 Coffee by Barista Magazine\"",
-        "\"Wake Up to Better Coffee\""
-    ]
-    for ex in examples:
-        doc.add_paragraph(ex, style='List Bullet')
-
-    # Step 4
-    doc.add_heading("Step 4: Styling Controls", level=3)
-
-    # Create styling options table
-    table = doc.add_table(rows=1, cols=2)
-    table.style = 'Light Grid Accent 1'
-
-    hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = 'Control'
-    hdr_cells[1].text = 'Options'
-
-    for cell in hdr_cells:
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-
-    styling = [
-        ('Font Family', 'Inter, Roboto, Playfair Display, Montserrat, Open Sans, Lato'),
-        ('Font Size', '24px - 96px (default: 48px)'),
-        ('Text Color', 'Color picker (hex input, default: #FFFFFF white)'),
-        ('Text Position', 'Center, Top, Bottom, Corners, Custom (8 presets)'),
-        ('Text Effects', 'Automatic drop shadow for readability'),
-    ]
-
-    for control, options in styling:
-        row_cells = table.add_row().cells
-        row_cells[0].text = control
-        row_cells[1].text = options
-
-    # Step 5
-    doc.add_heading("Step 5: Generate Previews", level=3)
-    steps = [
-        "Click 'Generate Previews' button",
-        "Shows count: 'Generate Previews (50)' for 5 backgrounds × 10 texts",
-        "Processing happens in batches of 5",
-        "Results appear in Preview Grid"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_paragraph()
-    p = doc.add_paragraph()
-    p.add_run("Time Estimate: ").bold = True
-    p.add_run("~20 seconds for 50 previews | ~40 seconds for 100 previews")
-
-    # Step 6
-    doc.add_heading("Step 6: Review & Approve", level=3)
-    doc.add_paragraph("Preview Grid shows all composited ads with:")
-    items = [
-        "Composited ad preview image",
-        "Text variant displayed",
-        "Background asset name",
-        "Approve/Reject buttons",
-        "Download button"
-    ]
+                    self.copied += 1
+                    return
+            self.rewritten += 1
+        self._zip.writestr(self._member(name), data)
+
+    def _serialize(self, element):
+        # Drop the namespace declarations the document root already makes
+        xml = etree.tostring(element, encoding='unicode')
+        end = xml.index('>')
+        head = _XMLNS_DECL.sub(
+            lambda m: '' if self._nsmap.get(m.group(1)) == m.group(2) else m.group(0), xml[:end])
+        return (head + xml[end:]).encode('utf-8')
+
+    def flush(self):
+        """Write every finished body block to the package and drop it from memory"""
+        body, sectPr = self.doc.element.body, self._sectPr
+        index = _heading_indexes.get(self._part)
+        toc = index.toc if index is not None and self._spill is None else None
+        with profile_span('stream-flush'):
+            minimizer = self.minimizer
+            if minimizer is not None and body[0] is not sectPr:
+                # Sizes are whole-body counts, less the sectPr-only body measured after the flush
+                elements, size = int(body.xpath('count(.//*)')), len(etree.tostring(body, encoding='utf-8'))
+                minimizer.minimize(list(itertools.takewhile(lambda el: el is not sectPr, body)))
+                minimized = int(body.xpath('count(.//*)'))
+            else:
+                minimizer = None
+            out = self._spill or self._stream
+            element = body[0]
+            while element is not sectPr:
+                following = element.getnext()
+                if element is toc:
+                    import tempfile
+                    out = self._spill = tempfile.TemporaryFile()
+                data = self._serialize(element)
+                out.write(data)
+                if minimizer is not None:
+                    minimizer.stats['bytes_after'] += len(data)
+                body.remove(element)
+                self.blocks += 1
+                element = following
+            if minimizer is not None:
+                stats, empty = minimizer.stats, int(body.xpath('count(.//*)'))
+                stats['elements_before'] += elements - empty
+                stats['elements_after'] += minimized - empty
+                stats['bytes_before'] += size - len(etree.tostring(body, encoding='utf-8'))
+
+    def flushing(self, items, batch=STREAM_FLUSH_BLOCKS):
+        """Yield from `items`, flushing the body once `batch` blocks are waiting"""
+        body = self.doc.element.body
+        for item in items:
+            if len(body) > batch:
+                self.flush()
+            yield item
+
+    def close(self):
+        """Finish word/document.xml and write the remaining package parts"""
+        self.flush()
+        with profile_span('save'):
+            if self._spill is not None:
+                import shutil
+                for p in toc_paragraphs(_heading_indexes[self._part]):
+                    self._stream.write(self._serialize(p))
+                self._spill.seek(0)
+                shutil.copyfileobj(self._spill, self._stream)
+                self._spill.close()
+            self._stream.write(self._serialize(self._sectPr) + b"</w:body></w:document>")
+            self._stream.close()
+            if self._base is not None:
+                self.rewritten += 1
+
+            package = self._part.package
+            parts = sorted(package.parts, key=lambda part: part.partname)
+            for part in parts:
+                part.before_marshal()
+            self._write(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob)
+            self._write(PACKAGE_URI.rels_uri.membername, package.rels.xml)
+            for part in parts:
+                if part is not self._part:
+                    self._write(part.partname.membername, part.blob)
+                if len(part.rels):
+                    self._write(part.partname.rels_uri.membername, part.rels.xml)
+            self._zip.close()
+            if self._base is not None:
+                self._base.close()
+            if self._replace is not None:
+                os.replace(self._file, self._replace)
+            if self._hashing is not None:
+                self.digest = self._hashing.sha256.hexdigest()
+            if self._target is not None:
+                self._publish()
+
+    def _publish(self):
+        # Move the spooled package to the target unless the last build there matches
+        import shutil
+        spool, target = self._file, self._target
+        digest_path = f"{target}{DIGEST_SUFFIX}"
+        try:
+            with open(digest_path, encoding='ascii') as f:
+                previous = f.read().split()[0]
+            unchanged = previous == self.digest and os.path.getsize(target) == spool.tell()
+        except (OSError, IndexError):
+            unchanged = False
+        if unchanged:
+            self.skipped = True
+        else:
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            spool.seek(0)
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(spool, f)
+            os.replace(tmp_path, target)
+            with open(digest_path, 'w', encoding='ascii') as f:
+                f.write(f"{self.digest}  {os.path.basename(target)}\n")
+        spool.close()
+
+    def abort(self):
+        """Close the package without finishing it and remove a partial output file"""
+        try:
+            self._stream.close()
+        finally:
+            if self._spill is not None:
+                self._spill.close()
+            if self._base is not None:
+                self._base.close()
+            try:
+                self._zip.close()
+            finally:
+                if isinstance(self._file, (str, os.PathLike)):
+                    os.remove(self._file)
+                elif self._target is not None:
+                    self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_package(doc, file, compresslevel=None, deterministic=False, base=None, minimize=False):
+    """Write a built document to a path or binary stream as a DOCX package
+
+    Unlike doc.save(), word/document.xml is serialized block by block into
+    the zip rather than into one in-memory blob first. The document's body is
+    consumed in the process. A path is only replaced once the package is
+    complete. Returns the closed StreamingDocxWriter.
+    """
+    writer = StreamingDocxWriter(file, doc, compresslevel, deterministic, base, minimize)
+    try:
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return writer
+
+def report_written(writer, output_path, what="Document created successfully"):
+    """Print where a package went, or that an unchanged deterministic build was skipped"""
+    if writer.skipped:
+        print(f"⏭️  Unchanged since the last build, left as is: {output_name(output_path)}")
+    else:
+        print(f"✅ {what}: {output_name(output_path)}")
+    if writer.minimizer is not None:
+        print(f"🗜️  Minimized word/document.xml: {writer.minimizer.summary()}")
+    if writer.copied or writer.rewritten:
+        print(f"🩹 Patched from {writer.base}: {writer.copied} parts copied as stored, "
+              f"{writer.rewritten} rewritten")
+    if writer.digest:
+        print(f"🔒 sha256 {writer.digest}")
+
+# ==================== MAIL MERGE ====================
+
+MERGE_CHUNK_SIZE = 64
+# Where --merge writes without -o; relative to the working directory
+MERGE_OUTPUT_DIR = "workspace_guides"
+_MERGE_FIELD = re.compile(r'«(\w+)»'.encode('utf-8'))
+
+class MergeTemplate:
+    """A guide rendered once, with its merge fields indexed for fast substitution
+
+    word/document.xml is kept as alternating literal byte segments and field
+    names, and every other package member sits pre-compressed in a base zip.
+    render() joins the segments with the escaped values and appends the one
+    document member to a copy of the base, so no copy touches the object model
+    or recompresses styles, theme and the rest of the package.
+    """
+
+    def __init__(self, docx_bytes, compresslevel=None):
+        self.compresslevel = compresslevel
+        compression, level = zip_compression(compresslevel)
+        base = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as source, zipfile.ZipFile(base, 'w') as zf:
+            for info in source.infolist():
+                if info.filename == 'word/document.xml':
+                    self.info = info
+                    document = source.read(info)
+                else:
+                    zf.writestr(info, source.read(info), compression, level)
+        self.base = base.getvalue()
+
+        # Even indexes are literal XML, odd indexes the field names between them
+        self.segments = _MERGE_FIELD.split(document)
+        self.fields = {field.decode('utf-8') for field in self.segments[1::2]}
+        unknown = self.fields.difference(MERGE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown merge fields in template: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def from_document(cls, doc, compresslevel=None):
+        """Index a built document (with merge_field() placeholders) as a template"""
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        return cls(buffer.getvalue(), compresslevel)
+
+    def render(self, values):
+        """Return the DOCX bytes for one set of field values"""
+        segments = self.segments[:]
+        for i in range(1, len(segments), 2):
+            segments[i] = xml_escape(str(values[segments[i].decode('utf-8')])).encode('utf-8')
+
+        buffer = io.BytesIO(self.base)
+        with zipfile.ZipFile(buffer, 'a') as zf:
+            zf.writestr(copy.copy(self.info), b''.join(segments), *zip_compression(self.compresslevel))
+        return buffer.getvalue()
+
+def build_merge_template(compresslevel=None):
+    """Render the mail-merge guide once and index its placeholders"""
+    doc = new_plan_document(guide_plan())
+    for name, add_section in merge_guide_sections():
+        add_section(doc)
+    add_toc_entries(doc)
+    return MergeTemplate.from_document(doc, compresslevel)
+
+def iter_workspaces(path):
+    """Yield one dict of merge values per workspace from a CSV or JSONL file"""
+    import csv
+    import json
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def _file_stem(text, seen, default):
+    """Filesystem-safe stem for `text`, numbered "-2", "-3", ... past every stem in `seen`
+
+    `seen` maps each stem handed out to the last number tried for it, so
+    "Acme", "Acme", "Acme 2" give acme, acme-2 and acme-2-2 rather than two
+    acme-2 files.
+    """
+    base = re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-') or default
+    stem, n = base, seen.get(base, 1)
+    while stem in seen:
+        n += 1
+        stem = f"{base}-{n}"
+    seen[base] = n
+    seen.setdefault(stem, 1)
+    return stem
+
+def _workspace_filenames(workspaces):
+    """Pair each workspace with a unique, filesystem-safe DOCX filename"""
+    seen = {}
+    for values in workspaces:
+        yield f"{_file_stem(values.get('workspace_name', ''), seen, 'workspace')}.docx", values
+
+_merge_template = None
+
+def _init_merge_worker(template):
+    global _merge_template
+    _merge_template = template
+
+def _merge_chunk(output_dir, chunk, template=None):
+    """Write one chunk of (filename, values) pairs; returns how many were written"""
+    template = template or _merge_template
+    for filename, values in chunk:
+        missing = template.fields.difference(values)
+        if missing:
+            raise ValueError(f"{filename}: missing merge fields {', '.join(sorted(missing))}")
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            f.write(template.render(values))
+    return len(chunk)
+
+def _chunks(items, size):
+    chunk = []
     for item in items:
-        doc.add_paragraph(item, style='List Bullet')
-
-    # Step 7
-    doc.add_heading("Step 7: Save Approved Ads", level=3)
-    steps = [
-        "Click 'Save Approved (X)' button",
-        "Only approved ads are saved to workspace",
-        "Server creates database records with metadata",
-        "Ads appear in Ads History section"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_heading("Tips for Best Results", level=2)
-
-    tips = [
-        ("Background Selection", [
-            "Use high-resolution images (1080×1080 minimum)",
-            "Ensure backgrounds have negative space for text",
-            "Avoid busy/cluttered backgrounds",
-            "Consistent aspect ratio (1:1 or 4:5 for social)"
-        ]),
-        ("Text Variants", [
-            "Start with 5-10 variants for A/B testing",
-            "Test different emotional tones",
-            "Vary length (short punchy vs longer descriptive)",
-            "Include numbers/stats ('Save 30%', 'Join 10K+')"
-        ]),
-        ("Styling", [
-            "High contrast (white on dark or dark on light)",
-            "Avoid mid-tones (gray on gray)",
-            "Match font to brand personality",
-            "Use larger font sizes for mobile (60px+)"
-        ]),
-    ]
-
-    for category, tip_list in tips:
-        doc.add_heading(category, level=3)
-        for tip in tip_list:
-            doc.add_paragraph(tip, style='List Bullet')
-
-    add_page_break(doc)
-
-    # ==================== GEMINI IMAGE EDITING ====================
-
-    doc.add_heading("Gemini Image Editing (NEW TECHNOLOGY)", level=1)
-
-    # Highlight box
-    p = doc.add_paragraph()
-    p.add_run("🚀 BREAKTHROUGH TECHNOLOGY").bold = True
-    p.add_run(" — Powered by Google's Gemini 2.5 Flash/Pro Image model")
-
-    doc.add_heading("What is Gemini Image Editing?", level=2)
-    p = doc.add_paragraph(
-        "Gemini replaces DALL-E for asset-based variations, offering superior accuracy and speed. "
-        "It uses advanced mask-based editing to transform product images while preserving the "
-        "product itself (including labels, text, and packaging) exactly."
-    )
-
-    doc.add_heading("How It Works", level=2)
-
-    steps = [
-        ("Generate Product Mask",
-         "AI creates a segmentation mask where WHITE = product, BLACK = background"),
-        ("Apply Transformations",
-         "AI edits ONLY the background (black areas) based on your creative options"),
-        ("Preserve Product Exactly",
-         "Product labels, text, and packaging remain pixel-perfect"),
-        ("Upload to Storage",
-         "Final image saved to Supabase Storage with public URL"),
-    ]
-
-    for i, (title, desc) in enumerate(steps, 1):
-        doc.add_heading(f"{i}. {title}", level=3)
-        doc.add_paragraph(desc)
-
-    doc.add_heading("Creative Options", level=2)
-
-    # Create options table
-    table = doc.add_table(rows=1, cols=2)
-    table.style = 'Medium Shading 1 Accent 1'
-
-    hdr_cells = table.rows[0].cells
-    hdr_cells[0].text = 'Option'
-    hdr_cells[1].text = 'Choices'
-
-    for cell in hdr_cells:
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-                run.font.color.rgb = RGBColor(255, 255, 255)
-
-    options = [
-        ('Product Angle', 'Front View, Side View, 3/4 View, Top-Down'),
-        ('Lighting Style', 'Studio, Natural, Golden Hour, Dramatic'),
-        ('Background Style', 'Solid White, Lifestyle, Outdoor, Gradient'),
-        ('Custom Instruction', 'Free-form text (e.g., "Place on wooden shelf")'),
-        ('Brand Colors', 'Pulled from Brand Guidelines (optional)'),
-    ]
-
-    for option, choices in options:
-        row_cells = table.add_row().cells
-        row_cells[0].text = option
-        row_cells[1].text = choices
-
-    doc.add_heading("Why Gemini Matters", level=2)
-
-    benefits = [
-        ("⚡ Faster", "2-4x faster than DALL-E for image editing"),
-        ("🎯 More Accurate", "Mask-based editing preserves product labels exactly"),
-        ("💰 Cost-Effective", "Gemini Flash is cheaper than DALL-E 3"),
-        ("🔧 Flexible", "Supports both Flash (fast) and Pro (quality) models"),
-    ]
-
-    for benefit, desc in benefits:
-        p = doc.add_paragraph(style='List Bullet')
-        p.add_run(f"{benefit}: ").bold = True
-        p.add_run(desc)
-
-    add_page_break(doc)
-
-    # ==================== DISCOVER IMPROVEMENTS ====================
-
-    doc.add_heading("Discover Page — New Features", level=1)
-
-    doc.add_heading("Save as Competitor (NEW)", level=2)
-
-    # Highlight
-    p = doc.add_paragraph()
-    p.add_run("✨ ONE-CLICK TRACKING").bold = True
-    p.add_run(" — Save competitor brands instantly without decomposition")
-
-    doc.add_paragraph()
-    doc.add_heading("What It Does:", level=3)
-    doc.add_paragraph(
-        "Saves ad metadata to your Competitors list in one click. No need to manually decompose first. "
-        "Automatically extracts: brand name, headline, platform, format."
-    )
-
-    doc.add_heading("How to Use:", level=3)
-    steps = [
-        "Find an ad from a competitor brand in Discover",
-        "Click 'Save as Competitor' button (user icon)",
-        "Ad metadata is saved to /competitors",
-        "You can now track all ads from this brand"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    doc.add_heading("Create Board from Discover (NEW)", level=2)
-
-    doc.add_heading("What It Does:", level=3)
-    doc.add_paragraph(
-        "Create a new swipe file board directly from search results. "
-        "Pre-populate with selected ads. Streamlines inspiration collection workflow."
-    )
-
-    doc.add_heading("How to Use:", level=3)
-    steps = [
-        "Search for ads (e.g., 'fitness apparel')",
-        "Select 5-10 ads using checkboxes",
-        "Click 'Create Board' button in toolbar",
-        "Enter board name (e.g., 'Fitness Ad Swipe')",
-        "Board is created with all selected ads saved"
-    ]
-    for step in steps:
-        doc.add_paragraph(step, style='List Number')
-
-    add_page_break(doc)
-
-    # ==================== BEST PRACTICES ====================
-
-    doc.add_heading("18. Best Practices", level=1)
-
-    doc.add_heading("Variation Generation", level=2)
-
-    doc.add_heading("Do's ✅", level=3)
-    dos = [
-        "Start with 2-3 strategies to conserve credits",
-        "Use high-quality source images (1080×1080 minimum)",
-        "Write specific product descriptions for better AI output",
-        "Test channel-specific copy (Facebook vs TikTok)",
-        "Link assets to brand guidelines for consistency"
-    ]
-    for item in dos:
-        doc.add_paragraph(item, style='List Bullet')
-
-    doc.add_heading("Don'ts ❌", level=3)
-    donts = [
-        "Don't generate all 6 strategies at once (expensive)",
-        "Don't use low-resolution competitor ad screenshots",
-        "Don't skip product description (AI needs context)",
-        "Don't use generic instructions ('make it better')"
-    ]
-    for item in donts:
-        doc.add_paragraph(item, style='List Bullet')
-
-    doc.add_heading("Ad Generator", level=2)
-
-    doc.add_heading("Do's ✅", level=3)
-    dos = [
-        "Test 5-10 text variants initially",
-        "Use high-contrast text colors",
-        "Preview on mobile viewport (most users)",
-        "Select backgrounds with negative space",
-        "Batch generate for efficiency"
-    ]
-    for item in dos:
-        doc.add_paragraph(item, style='List Bullet')
-
-    doc.add_heading("Don'ts ❌", level=3)
-    donts = [
-        "Don't use busy/cluttered backgrounds",
-        "Don't use mid-tone text colors (poor contrast)",
-        "Don't exceed 15 words per text variant",
-        "Don't forget to save approved ads (lose previews on refresh)"
-    ]
-    for item in donts:
-        doc.add_paragraph(item, style='List Bullet')
-
-    add_page_break(doc)
-
-    # ==================== TROUBLESHOOTING ====================
-
-    doc.add_heading("19. Troubleshooting", level=1)
-
-    issues = [
-        ("Ad Account Connection Expired",
-         "Cause: Meta OAuth token expires after 60 days",
-         ["Go to Settings → Ad Accounts",
-          "Click 'Refresh Token' on expired account",
-          "Re-authenticate with Facebook",
-          "Automations resume automatically"]),
-
-        ("Insufficient Credits",
-         "Cause: Credit balance too low for operation",
-         ["Check credit balance in top-right corner",
-          "Click 'Buy Credits' button",
-          "Purchase credit pack",
-          "Retry operation"]),
-
-        ("Variation Generation Failed",
-         "Possible Causes: Low-quality source image, Gemini API region restriction, invalid description",
-         ["Check source image resolution (1080px minimum)",
-          "Verify Gemini API key in environment variables",
-          "Add more detailed product description",
-          "Try different strategy"]),
-
-        ("Slack Message Not Delivered",
-         "Possible Causes: Bot not invited, channel renamed, integration disconnected",
-         ["Verify Slack integration in Settings → Integrations",
-          "Invite @Voltic bot to target channel (/invite @Voltic)",
-          "Test with 'Run Now' on automation",
-          "Check Slack workspace permissions"]),
-    ]
-
-    for title, cause, fixes in issues:
-        doc.add_heading(title, level=2)
-        p = doc.add_paragraph()
-        p.add_run("Cause: ").bold = True
-        p.add_run(cause)
-
-        doc.add_paragraph()
-        doc.add_paragraph("Fix:", style='Heading 3')
-        for fix in fixes:
-            doc.add_paragraph(fix, style='List Number')
-
-        doc.add_paragraph()
-
-    add_page_break(doc)
-
-    # ==================== FOOTER / CLOSING ====================
-
-    doc.add_heading("Support & Contact", level=1)
-
-    doc.add_paragraph()
-    support_info = [
-        ("Help Center", "your-domain/help"),
-        ("Email Support", "support@voltic.app"),
-        ("Live Chat", "Available Mon-Fri 9am-5pm EST"),
-        ("Feature Requests", "your-domain/feedback"),
-        ("Status Page", "status.voltic.app"),
-    ]
-
-    for label, info in support_info:
-        p = doc.add_paragraph(style='List Bullet')
-        p.add_run(f"{label}: ").bold = True
-        p.add_run(info)
-
-    doc.add_paragraph()
-    doc.add_paragraph()
-
-    # Final note
-    p = doc.add_paragraph()
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def mail_merge_guides(workspaces_path, output_dir, jobs=1, compresslevel=None):
+    """Write a personalized guide per workspace listed in a CSV or JSONL file"""
+    started = time.perf_counter()
+    template = build_merge_template(compresslevel)
+    os.makedirs(output_dir, exist_ok=True)
+    chunks = _chunks(_workspace_filenames(iter_workspaces(workspaces_path)), MERGE_CHUNK_SIZE)
+
+    written = 0
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs, initializer=_init_merge_worker, initargs=(template,)) as pool:
+            for count in pool.map(functools.partial(_merge_chunk, output_dir), chunks):
+                written += count
+    else:
+        for chunk in chunks:
+            written += _merge_chunk(output_dir, chunk, template)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Mail-merged {written} workspace guides into {output_dir}")
+    print(f"⚡ {elapsed:.2f}s total ({written / elapsed:.0f} documents/s)")
+    return written
+
+# ==================== CAMPAIGN ANALYSIS REPORT ====================
+
+CAMPAIGN_CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "campaign-analysis.csv")
+# Where --campaign-report (and --fan-out) write without -o; relative to the working directory
+CAMPAIGN_REPORT_PATH = "CAMPAIGN_ANALYSIS_REPORT.docx"
+CAMPAIGN_REPORTS_DIR = "account_reports"
+# Rows parsed per chunk; memory is bounded by this however long the export is
+CAMPAIGN_CHUNK_ROWS = 100_000
+# Text columns and their byte widths (longer values are truncated)
+CAMPAIGN_TEXT_COLUMNS = {'Name': 128, 'Status': 16, 'Objective': 32, 'Ad Account': 96}
+# Additive columns; ROAS and CTR are recomputed from these rather than averaged
+CAMPAIGN_SUM_COLUMNS = ('Spend', 'Revenue', 'Impressions', 'Clicks', 'Purchases')
+CAMPAIGN_TOP_N = 10
+# Structured dtype of a parsed chunk: text columns as bytes, additive columns as float64
+CAMPAIGN_COLUMNS = ([(name, f'S{width}') for name, width in CAMPAIGN_TEXT_COLUMNS.items()] +
+                    [(name, 'f8') for name in CAMPAIGN_SUM_COLUMNS])
+# CTR histogram: fixed-width percentage bins, the last one open-ended
+CAMPAIGN_CTR_BIN_WIDTH = 0.25
+CAMPAIGN_CTR_BINS = 40
+
+def _blank_as_zero(text):
+    return float(text) if text.strip() else 0.0
+
+def iter_campaign_chunks(path, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Yield a campaign export as structured NumPy arrays of at most `chunk_rows` rows
+
+    Only the text and additive columns are parsed, by numpy's C reader. The
+    file is decoded as Latin-1 so text fields land in fixed-width bytes
+    columns as their raw UTF-8 bytes; category names are decoded once they
+    have been aggregated. Blank additive cells count as 0; a chunk holding
+    one is re-parsed with a converter, so clean chunks keep the fast path.
+
+    The export must hold one record per line: quoted fields may contain
+    commas but not line breaks, since chunks are split on lines.
+    """
+    import csv
+    import numpy as np
+    with open(path, encoding='latin-1', newline='') as f:
+        header = [name.strip() for name in next(csv.reader([f.readline()]), [])]
+        missing = [name for name, _ in CAMPAIGN_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+        usecols = [header.index(name) for name, _ in CAMPAIGN_COLUMNS]
+        blanks = {header.index(name): _blank_as_zero for name in CAMPAIGN_SUM_COLUMNS}
+        options = dict(dtype=CAMPAIGN_COLUMNS, delimiter=',', quotechar='"', usecols=usecols, ndmin=1,
+                       encoding='latin-1')
+
+        line = 2
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            try:
+                chunk = np.loadtxt(lines, **options)
+            except ValueError:
+                try:
+                    chunk = np.loadtxt(lines, converters=blanks, **options)
+                except ValueError as e:
+                    raise ValueError(f"{path}: {e} (rows counted from line {line})") from None
+            yield chunk
+            line += len(lines)
+
+def _decode(value):
+    return value.decode('utf-8', 'replace')
+
+def _value_hashes(values):
+    """64-bit hash of each fixed-width bytes value, as (hashes, words)
+
+    The values are viewed as rows of uint64 words and hashed in one matrix
+    product with odd multipliers, so no Python code runs per row.
+    """
+    import numpy as np
+    raw = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), -1)
+    if raw.shape[1] % 8:
+        raw = np.pad(raw, ((0, 0), (0, -raw.shape[1] % 8)))
+    words = raw.view(np.uint64)
+    multipliers = np.arange(1, 2 * words.shape[1], 2, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return words @ multipliers, words
+
+def _category_codes(values, codes):
+    """Map a bytes column to row numbers in `codes` (value -> row), adding new values
+
+    np.unique groups the chunk by value hash, avoiding a sort of the
+    wide bytes values; only its distinct values go through the dict, in
+    first-seen order, and every row is then mapped through the inverse.
+    A hash collision is caught by comparing the values and falls back to
+    np.unique on the bytes themselves.
+    """
+    import numpy as np
+    hashes, words = _value_hashes(values)
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if not np.array_equal(words[first[inverse]], words):
+        _, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+    setdefault, keys = codes.setdefault, values[first].tolist()
+    lookup = np.empty(len(first), np.intp)
+    for i in np.argsort(first).tolist():
+        lookup[i] = setdefault(keys[i], len(codes))
+    return lookup[inverse]
+
+class CampaignBreakdown:
+    """Per-category campaign counts and CAMPAIGN_SUM_COLUMNS totals for one text column"""
+
+    def __init__(self, column):
+        import numpy as np
+        self.column = column
+        self.codes = {}  # raw bytes value -> row in sums
+        self.sums = np.zeros((0, len(CAMPAIGN_SUM_COLUMNS) + 1))
+
+    def add(self, chunk):
+        import numpy as np
+        codes = self.codes
+        rows = _category_codes(chunk[self.column], codes)
+        if len(codes) > len(self.sums):
+            self.sums = np.vstack([self.sums, np.zeros((len(codes) - len(self.sums), self.sums.shape[1]))])
+        self.sums[:, 0] += np.bincount(rows, minlength=len(codes))
+        for i, column in enumerate(CAMPAIGN_SUM_COLUMNS, 1):
+            self.sums[:, i] += np.bincount(rows, weights=chunk[column], minlength=len(codes))
+
+    def rows(self):
+        """(name, campaigns, spend, revenue, impressions, clicks, purchases), biggest spend first"""
+        names = [_decode(value) for value in self.codes]
+        order = sorted(range(len(names)), key=lambda i: (-self.sums[i, 1], names[i]))
+        return [(names[i], *self.sums[i].tolist()) for i in order]
+
+class CampaignStats:
+    """Totals, breakdowns and top campaigns aggregated chunk by chunk from an export"""
+
+    def __init__(self, top=CAMPAIGN_TOP_N):
+        self.top = top
+        self.campaigns = self.active = 0
+        self.totals = dict.fromkeys(CAMPAIGN_SUM_COLUMNS, 0.0)
+        self.by_objective = CampaignBreakdown('Objective')
+        self.by_account = CampaignBreakdown('Ad Account')
+        self._heap = []  # (revenue, -sequence, row) min-heap of the `top` best campaigns
+        self.ctr_counts = [0] * CAMPAIGN_CTR_BINS
+
+    def add(self, chunk):
+        """Fold one structured chunk from iter_campaign_chunks() into the stats"""
+        import numpy as np
+        self.campaigns += len(chunk)
+        self.active += int(np.count_nonzero(chunk['Status'] == b'active'))
+        for column in CAMPAIGN_SUM_COLUMNS:
+            self.totals[column] += float(chunk[column].sum())
+        self.by_objective.add(chunk)
+        self.by_account.add(chunk)
+
+        impressions = chunk['Impressions']
+        shown = impressions > 0
+        ctr = chunk['Clicks'][shown] / impressions[shown] * 100
+        bins = np.minimum((ctr / CAMPAIGN_CTR_BIN_WIDTH).astype(np.intp), CAMPAIGN_CTR_BINS - 1)
+        for i, count in enumerate(np.bincount(bins, minlength=CAMPAIGN_CTR_BINS).tolist()):
+            self.ctr_counts[i] += count
+
+        # Only a chunk's own top N can reach the overall top N
+        if self.top <= 0:
+            return
+        revenue = chunk['Revenue']
+        if len(chunk) > self.top:
+            threshold = np.partition(revenue, -self.top)[-self.top]
+            best = np.flatnonzero(revenue >= threshold)
+            best = best[np.argsort(-revenue[best], kind='stable')][:self.top]
+        else:
+            best = range(len(chunk))
+        first = self.campaigns - len(chunk)
+        for i in best:
+            # Ties go to the earlier row, which has the larger -sequence
+            key = (float(revenue[i]), -(first + int(i)))
+            if len(self._heap) < self.top:
+                heapq.heappush(self._heap, key + (self._campaign_row(chunk[i]),))
+            elif key > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, key + (self._campaign_row(chunk[i]),))
+
+    @staticmethod
+    def _campaign_row(record):
+        return (_decode(record['Name']), _decode(record['Objective']), _decode(record['Ad Account']),
+                float(record['Spend']), float(record['Revenue']))
+
+    def top_campaigns(self):
+        """The `top` campaigns by revenue, best first"""
+        return [row for revenue, sequence, row in sorted(self._heap, reverse=True)]
+
+def aggregate_campaigns(path, top=CAMPAIGN_TOP_N, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Stream a campaign export through CampaignStats in bounded memory"""
+    stats = CampaignStats(top)
+    for chunk in iter_campaign_chunks(path, chunk_rows):
+        stats.add(chunk)
+    return stats
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+def _breakdown_rows(breakdown):
+    for name, campaigns, spend, revenue, impressions, clicks, purchases in breakdown.rows():
+        yield (name, f"{campaigns:,.0f}", f"${spend:,.2f}", f"${revenue:,.2f}",
+               f"{_ratio(revenue, spend):.2f}x", f"{_ratio(clicks, impressions) * 100:.2f}%", f"{purchases:,.0f}")
+
+def add_campaign_report(doc, stats, source=None, title="Campaign Performance Report", charts=None):
+    """Add the campaign performance report for aggregated `stats`
+
+    `charts` maps campaign_chart_specs() names to rendered PNG bytes; each
+    one present is embedded below its section.
+    """
+    charts = charts or {}
+    totals = stats.totals
+    spend, revenue = totals['Spend'], totals['Revenue']
+    impressions, clicks, purchases = totals['Impressions'], totals['Clicks'], totals['Purchases']
+
+    add_heading(doc, title, level=0)
+    p = add_paragraph(doc)
+    if source:
+        add_run(p, f"Source: {os.path.basename(source)} | ", 'muted-note')
+    add_run(p, f"{stats.campaigns:,} campaigns, {stats.active:,} active", 'muted-note')
+
+    add_heading(doc, "Summary", level=1)
+    add_bulk_table(doc, ("Metric", "Value"), [
+        ("Total Spend", f"${spend:,.2f}"),
+        ("Total Revenue", f"${revenue:,.2f}"),
+        ("ROAS (spend-weighted)", f"{_ratio(revenue, spend):.2f}x"),
+        ("Impressions", f"{impressions:,.0f}"),
+        ("Clicks", f"{clicks:,.0f}"),
+        ("CTR (impression-weighted)", f"{_ratio(clicks, impressions) * 100:.2f}%"),
+        ("Purchases", f"{purchases:,.0f}"),
+        ("Cost per Purchase", f"${_ratio(spend, purchases):,.2f}"),
+    ])
+    for name in ('spend-revenue', 'ctr-distribution'):
+        if name in charts:
+            add_chart(doc, charts[name])
+
+    add_heading(doc, f"Top {len(stats.top_campaigns())} Campaigns by Revenue", level=1)
+    add_bulk_table(doc, ("Campaign", "Objective", "Ad Account", "Spend", "Revenue", "ROAS"), (
+        (name, objective, account, f"${spend:,.2f}", f"${revenue:,.2f}", f"{_ratio(revenue, spend):.2f}x")
+        for name, objective, account, spend, revenue in stats.top_campaigns()
+    ))
+
+    breakdown_header = ("Campaigns", "Spend", "Revenue", "ROAS", "CTR", "Purchases")
+    add_heading(doc, "By Objective", level=1)
+    add_bulk_table(doc, ("Objective",) + breakdown_header, _breakdown_rows(stats.by_objective))
+    if 'roas-objective' in charts:
+        add_chart(doc, charts['roas-objective'])
+    if len(stats.by_account.codes) > 1:
+        add_heading(doc, "By Ad Account", level=1)
+        add_bulk_table(doc, ("Ad Account",) + breakdown_header, _breakdown_rows(stats.by_account))
+
+def create_campaign_report(csv_path=CAMPAIGN_CSV_PATH, output_path=CAMPAIGN_REPORT_PATH, top=CAMPAIGN_TOP_N,
+                           charts=False, jobs=1, compresslevel=None, deterministic=False, patch=None,
+                           minimize=False):
+    """Aggregate a campaign export and write it as a formatted DOCX report
+
+    `output_path` may be a path or a writable binary stream.
+    """
+    started = time.perf_counter()
+    stats = aggregate_campaigns(csv_path, top)
+    aggregated = time.perf_counter()
+    rendered = render_charts(campaign_chart_specs(stats), jobs=jobs) if charts else None
+
+    doc = new_guide_document()
+    doc.core_properties.title = "Campaign Performance Report"
+    add_campaign_report(doc, stats, csv_path, charts=rendered)
+    writer = write_package(doc, output_path, compresslevel, deterministic, patch, minimize)
+    report_written(writer, output_path, "Report created successfully")
+    print(f"📈 Aggregated {stats.campaigns:,} rows in {aggregated - started:.2f}s "
+          f"({len(stats.by_objective.codes)} objectives, {len(stats.by_account.codes)} ad accounts)")
+
+def partition_campaigns(path, spill_dir, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Split an export by Ad Account in one pass, spilling partitions to columnar files
+
+    Each chunk is grouped with a stable argsort on its account codes, and
+    every account's slice of every column is appended to
+    spill_dir/<n>/<column>.col as raw fixed-width values. Returns
+    {account name: partition directory} in first-seen order.
+    """
+    import numpy as np
+    codes, directories = {}, []
+    for chunk in iter_campaign_chunks(path, chunk_rows):
+        rows = _category_codes(chunk['Ad Account'], codes)
+        while len(directories) < len(codes):
+            directories.append(os.path.join(spill_dir, str(len(directories))))
+            os.mkdir(directories[-1])
+
+        order = np.argsort(rows, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(codes)))))
+        present = np.flatnonzero(bounds[1:] > bounds[:-1])
+        for column, _ in CAMPAIGN_COLUMNS:
+            values = chunk[column][order]
+            for code in present:
+                with open(os.path.join(directories[code], f"{column}.col"), 'ab') as f:
+                    values[bounds[code]:bounds[code + 1]].tofile(f)
+    return {_decode(account): directories[code] for account, code in codes.items()}
+
+def iter_partition_chunks(directory, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Yield a spilled partition back as structured chunks like iter_campaign_chunks()"""
+    import numpy as np
+    files = [open(os.path.join(directory, f"{column}.col"), 'rb') for column, _ in CAMPAIGN_COLUMNS]
+    try:
+        while True:
+            columns = [np.fromfile(f, dtype, count=chunk_rows) for f, (_, dtype) in zip(files, CAMPAIGN_COLUMNS)]
+            if not len(columns[0]):
+                return
+            chunk = np.empty(len(columns[0]), dtype=CAMPAIGN_COLUMNS)
+            for (column, _), values in zip(CAMPAIGN_COLUMNS, columns):
+                chunk[column] = values
+            yield chunk
+    finally:
+        for f in files:
+            f.close()
+
+def render_account_report(task):
+    """Aggregate one spilled account partition and write its report; runs in workers"""
+    directory, account, output_path, top, source, charts, compresslevel, deterministic, minimize = task
+    stats = CampaignStats(top)
+    for chunk in iter_partition_chunks(directory):
+        stats.add(chunk)
+    rendered = render_charts(campaign_chart_specs(stats)) if charts else None
+    doc = new_guide_document()
+    doc.core_properties.title = f"{account} Campaign Performance Report"
+    add_campaign_report(doc, stats, source, title=f"{account}: Campaign Performance", charts=rendered)
+    write_package(doc, output_path, compresslevel, deterministic, minimize=minimize)
+    return stats.campaigns
+
+def fan_out_campaign_reports(csv_path=CAMPAIGN_CSV_PATH, output_dir=CAMPAIGN_REPORTS_DIR, jobs=1,
+                             top=CAMPAIGN_TOP_N, charts=False, compresslevel=None, deterministic=False,
+                             minimize=False):
+    """Write one campaign report per ad account from a single scan of the export"""
+    import tempfile
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='voltic-accounts-') as spill_dir:
+        partitions = partition_campaigns(csv_path, spill_dir)
+        partitioned = time.perf_counter()
+
+        seen = {}
+        tasks = [(directory, account, os.path.join(output_dir, f"{_file_stem(account, seen, 'account')}.docx"),
+                  top, csv_path, charts, compresslevel, deterministic, minimize)
+                 for account, directory in partitions.items()]
+        if jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(jobs) as pool:
+                rows = sum(pool.map(render_account_report, tasks))
+        else:
+            rows = sum(map(render_account_report, tasks))
+
+    print(f"✅ {len(tasks)} ad account reports created in {output_dir}")
+    print(f"📈 Partitioned {rows:,} rows in {partitioned - started:.2f}s, "
+          f"rendered in {time.perf_counter() - partitioned:.2f}s")
+    return len(tasks)
+
+# ==================== CHARTS ====================
+
+# Rendered chart PNGs, keyed by a hash of chart spec and renderer version
+CHART_CACHE_DIR = os.path.join(TEMPLATE_CACHE_DIR, "charts") if TEMPLATE_CACHE_DIR else None
+CHART_RENDER_VERSION = 1
+CHART_SIZE = (6.5, 3.4)  # inches
+CHART_DPI = 150
+CHART_WIDTH = Inches(6)
+CHART_COLOR = '#%02X%02X%02X' % GUIDE_STYLES['Heading 1'][1]
+CHART_MAX_POINTS = 30
+CHARTS_NEED_MATPLOTLIB = "--charts needs matplotlib: pip install matplotlib"
+
+def campaign_chart_specs(stats):
+    """Chart specs for a campaign report: {name: spec}, with plain-list data only"""
+    accounts = stats.by_account.rows()[:CHART_MAX_POINTS]
+    objectives = stats.by_objective.rows()
+    specs = {
+        'ctr-distribution': {
+            'kind': 'hist', 'title': "CTR Distribution",
+            'edges': [i * CAMPAIGN_CTR_BIN_WIDTH for i in range(CAMPAIGN_CTR_BINS + 1)],
+            'counts': list(stats.ctr_counts),
+            'xlabel': "CTR (%)", 'ylabel': "Campaigns",
+        },
+        'roas-objective': {
+            'kind': 'bar', 'title': "ROAS by Objective",
+            'labels': [name for name, *_ in objectives],
+            'values': [_ratio(revenue, spend) for name, count, spend, revenue, *_ in objectives],
+            'xlabel': "ROAS (revenue / spend)",
+        },
+    }
+    if len(accounts) > 1:
+        specs['spend-revenue'] = {
+            'kind': 'scatter', 'title': "Spend vs Revenue by Ad Account",
+            'x': [spend for name, count, spend, *_ in accounts],
+            'y': [revenue for name, count, spend, revenue, *_ in accounts],
+            'labels': [name for name, *_ in accounts],
+            'xlabel': "Spend ($)", 'ylabel': "Revenue ($)",
+        }
+    return specs
+
+@functools.lru_cache(maxsize=None)
+def _matplotlib_version():
+    import matplotlib
+    return matplotlib.__version__
+
+def chart_key(spec):
+    """Content hash of a chart: its spec plus everything that changes how it is drawn"""
+    import json
+    h = hashlib.sha256(f"{CHART_RENDER_VERSION}|{_matplotlib_version()}|{CHART_SIZE}|{CHART_DPI}|"
+                       f"{CHART_COLOR}".encode())
+    h.update(json.dumps(spec, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+def render_chart_png(spec):
+    """Draw one chart spec headlessly (Agg canvas, no pyplot) and return PNG bytes"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=CHART_SIZE, dpi=CHART_DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    kind = spec['kind']
+    if kind == 'scatter':
+        ax.scatter(spec['x'], spec['y'], color=CHART_COLOR)
+        for x, y, label in zip(spec['x'], spec['y'], spec.get('labels', ())):
+            ax.annotate(label, (x, y), xytext=(4, 4), textcoords='offset points', fontsize=7)
+    elif kind == 'bar':
+        ax.barh(spec['labels'], spec['values'], color=CHART_COLOR)
+        ax.invert_yaxis()
+    elif kind == 'hist':
+        ax.stairs(spec['counts'], spec['edges'], fill=True, color=CHART_COLOR)
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec.get('xlabel', ''))
+    ax.set_ylabel(spec.get('ylabel', ''))
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    # No Software tag, so the same chart always produces the same bytes
+    fig.savefig(buffer, format='png', metadata={'Software': None})
+    return buffer.getvalue()
+
+def render_charts(specs, cache_dir=CHART_CACHE_DIR, jobs=1):
+    """Return {name: PNG bytes} for `specs`, drawing only charts missing from the cache
+
+    Charts are content-addressed by chart_key(), so identical specs are drawn
+    once per batch and never again while the cache holds them. Misses render
+    on a process pool when jobs > 1. Raises ImportError, with an install
+    hint, when matplotlib is missing.
+    """
+    try:
+        _matplotlib_version()
+    except ImportError as e:
+        raise ImportError(f"{CHARTS_NEED_MATPLOTLIB} ({e})") from e
+    keys = {name: chart_key(spec) for name, spec in specs.items()}
+    pngs, missing = {}, {}
+    for name, key in keys.items():
+        if key in pngs or key in missing:
+            continue
+        if cache_dir is not None:
+            try:
+                with open(os.path.join(cache_dir, f"{key}.png"), 'rb') as f:
+                    pngs[key] = f.read()
+                continue
+            except OSError:
+                pass
+        missing[key] = specs[name]
+
+    if jobs > 1 and len(missing) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(jobs, len(missing))) as pool:
+            drawn = dict(zip(missing, pool.map(render_chart_png, missing.values())))
+    else:
+        drawn = {key: render_chart_png(spec) for key, spec in missing.items()}
+
+    if cache_dir is not None and drawn:
+        make_cache_dir(cache_dir)
+        for key, png in drawn.items():
+            path = os.path.join(cache_dir, f"{key}.png")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+    pngs.update(drawn)
+    return {name: pngs[key] for name, key in keys.items()}
+
+def add_chart(doc, png, width=CHART_WIDTH):
+    """Add a centered chart picture; repeated PNGs share one image part"""
+    p = add_paragraph(doc)
     p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    p.add_run("─────────────────────").font.color.rgb = RGBColor(200, 200, 200)
-
-    doc.add_paragraph()
-
-    final = doc.add_paragraph()
-    final.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    final_run = final.add_run("For the most up-to-date documentation, visit your Voltic instance help center.")
-    final_run.font.italic = True
-    final_run.font.size = Pt(10)
-    final_run.font.color.rgb = RGBColor(100, 100, 100)
-
-    doc.add_paragraph()
-
-    version = doc.add_paragraph()
-    version.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    version_run = version.add_run("Version 1.0 | February 2026 | © Voltic Platform")
-    version_run.font.size = Pt(9)
-    version_run.font.color.rgb = RGBColor(150, 150, 150)
-
-    # Save document
-    output_path = "/Users/varuntyagi/Downloads/Claude Research/RayTracker/VOLTIC_USER_GUIDE_FORMATTED.docx"
-    doc.save(output_path)
-    print(f"✅ Document created successfully: {output_path}")
-    print(f"📄 Total sections: 20+")
-    print(f"📊 Includes: Tables, styled headings, bullet points, numbered lists")
-    print(f"🎨 Professional formatting with colors and emphasis")
+    # python-docx matches image parts by SHA-1, so the same chart bytes relate to the same part
+    p.add_run().add_picture(io.BytesIO(png), width=width)
+    return p
+
+# ==================== IMAGE INGESTION ====================
+
+# Prepared (downscaled/recompressed) images, keyed by source hash and parameters
+IMAGE_CACHE_DIR = os.path.join(TEMPLATE_CACHE_DIR, "images") if TEMPLATE_CACHE_DIR else None
+IMAGE_PROCESS_VERSION = 1
+IMAGE_WIDTH = Inches(6)  # widest an image is printed
+IMAGE_DPI = 150
+IMAGE_JPEG_QUALITY = 85
+# Formats Word renders natively; anything else (WebP, BMP, TIFF, ...) is always re-encoded
+IMAGE_NATIVE_FORMATS = ('PNG', 'JPEG', 'GIF')
+
+def prepare_image(data, max_width_px, dpi=IMAGE_DPI, quality=IMAGE_JPEG_QUALITY):
+    """Downscale an image to `max_width_px` and recompress it for embedding
+
+    Policy: images with transparency or at most 256 colours (screenshots,
+    UI captures, diagrams) become optimized PNGs; photographic content
+    (JPEG sources, or PNG/WebP with many colours) becomes JPEG. The source
+    bytes are kept when they are already native, no wider than needed and
+    smaller than the re-encoded result.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        source_format = source.format
+        image = ImageOps.exif_transpose(source)
+        resized = image.width > max_width_px
+        if resized:
+            height = max(1, round(image.height * max_width_px / image.width))
+            image = image.resize((max_width_px, height), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        buffer = io.BytesIO()
+        if has_alpha or (source_format != 'JPEG' and image.getcolors(256) is not None):
+            if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            image.save(buffer, 'PNG', optimize=True, dpi=(dpi, dpi))
+        else:
+            image.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True,
+                                      dpi=(dpi, dpi))
+
+    prepared = buffer.getvalue()
+    if source_format in IMAGE_NATIVE_FORMATS and not resized and len(data) <= len(prepared):
+        return data
+    return prepared
+
+class ImageIngestor:
+    """Prepared images for one document, deduplicated by source content hash
+
+    Paths resolve against `base_dir`. Each distinct source is prepared once
+    (downscaled to the printed width at `dpi`, recompressed by
+    prepare_image()'s policy) and kept in an on-disk cache keyed by source
+    hash and parameters. prefetch() prepares a batch on a thread pool;
+    Pillow releases the GIL while decoding, resampling and encoding. get()
+    is thread-safe: each source has one future, so concurrent requests for
+    an image wait for a single preparation.
+    """
+
+    def __init__(self, base_dir='.', cache_dir=IMAGE_CACHE_DIR, width=IMAGE_WIDTH, dpi=IMAGE_DPI, jobs=1):
+        self.base_dir = base_dir
+        self.cache_dir = cache_dir
+        self.width = width
+        self.dpi = dpi
+        self.jobs = jobs
+        self.max_width_px = round(width.inches * dpi)
+        self.prepared = {}  # source hash -> prepared bytes
+        self._hashes = {}   # resolved path -> source hash
+        self._futures = {}  # source hash -> future of its prepared bytes
+        self._lock = threading.Lock()
+        self.source_bytes = 0
+
+    def _cache_path(self, digest):
+        import PIL
+        params = f"{IMAGE_PROCESS_VERSION}|{PIL.__version__}|{self.max_width_px}|{self.dpi}|{IMAGE_JPEG_QUALITY}"
+        key = hashlib.sha256(f"{digest}|{params}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.img")
+
+    def get(self, src):
+        """Prepared bytes for `src`, a path relative to base_dir"""
+        path = os.path.join(self.base_dir, src)
+        with self._lock:
+            future = self._futures.get(self._hashes.get(path))
+        if future is not None:
+            return future.result()
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._hashes[path] = digest
+            future = self._futures.get(digest)
+            owner = future is None
+            if owner:
+                from concurrent.futures import Future
+                future = self._futures[digest] = Future()
+                self.source_bytes += len(data)
+        if owner:
+            try:
+                prepared = self._prepare(digest, data)
+            except BaseException as e:
+                # Waiters see the error; a later get() tries again
+                with self._lock:
+                    del self._futures[digest]
+                    self.source_bytes -= len(data)
+                future.set_exception(e)
+                raise
+            with self._lock:
+                self.prepared[digest] = prepared
+            future.set_result(prepared)
+        return future.result()
+
+    def _prepare(self, digest, data):
+        # Prepared bytes from the on-disk cache, or prepare_image() and store them there
+        cache_path = self._cache_path(digest) if self.cache_dir else None
+        try:
+            with open(cache_path, 'rb') as f:
+                prepared = f.read()
+        except (OSError, TypeError):
+            prepared = prepare_image(data, self.max_width_px, self.dpi)
+            if cache_path:
+                make_cache_dir(self.cache_dir)
+                tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(prepared)
+                os.replace(tmp_path, cache_path)
+        return prepared
+
+    def prefetch(self, srcs):
+        """Prepare a batch of images concurrently ahead of rendering"""
+        srcs = list(dict.fromkeys(srcs))
+        if self.jobs > 1 and len(srcs) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(self.jobs) as pool:
+                list(pool.map(self.get, srcs))
+        else:
+            for src in srcs:
+                self.get(src)
+
+    def display_width(self, data):
+        """Printed width: the image's pixel width at the target DPI, capped at `width`"""
+        from docx.image.image import Image as DocxImage
+        return min(self.width, Emu(round(DocxImage.from_blob(data).px_width / self.dpi * Inches(1))))
+
+    def summary(self):
+        prepared = sum(len(data) for data in self.prepared.values())
+        return (f"{len(self._hashes)} referenced, {len(self.prepared)} unique, "
+                f"{self.source_bytes / 1024:.0f} KB -> {prepared / 1024:.0f} KB")
+
+def add_image(doc, images, src, alt=''):
+    """Add a centered image from `images` (an ImageIngestor); identical images share one part"""
+    data = images.get(src)
+    p = add_paragraph(doc)
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    shape = p.add_run().add_picture(io.BytesIO(data), width=images.display_width(data))
+    if alt:
+        shape._inline.docPr.set('descr', alt)
+    return p
+
+# ==================== WATCH MODE ====================
+
+WATCH_INTERVAL = 0.1   # seconds between polls of the watched files
+WATCH_DEBOUNCE = 0.25  # quiet period after the last save before rebuilding
+# Rendered sections persist here too, so a restart after editing this script stays incremental
+WATCH_CACHE_DIR = os.path.join(TEMPLATE_CACHE_DIR, "sections") if TEMPLATE_CACHE_DIR else None
+
+class MemorySectionCache:
+    """In-memory front for SectionCache, holding the fragments of the current build
+
+    Fragments not used since the last prune() are dropped, so memory tracks
+    the document rather than every revision of it.
+    """
+
+    def __init__(self, backing=None):
+        self.backing = backing
+        self.fragments = {}
+        self._used = set()
+
+    def get(self, key):
+        fragment = self.fragments.get(key)
+        if fragment is None and self.backing is not None:
+            fragment = self.backing.get(key)
+            if fragment is not None:
+                self.fragments[key] = fragment
+        if fragment is not None:
+            self._used.add(key)
+        return fragment
+
+    def put(self, key, fragment):
+        self.fragments[key] = fragment
+        self._used.add(key)
+        if self.backing is not None:
+            self.backing.put(key, fragment)
+
+    def prune(self):
+        self.fragments = {key: self.fragments[key] for key in self._used if key in self.fragments}
+        self._used = set()
+
+def _watch_signature(paths):
+    # Editors that save by rename leave a path missing for a moment
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((st.st_mtime_ns, st.st_size))
+    return signature
+
+def source_sections(kind, source, doc):
+    """Return (sections, numbering) for building a 'guide', 'markdown' or 'spec' source into `doc`
+
+    `sections` yields build_sections() tuples; `numbering` is the list
+    numbering they share, or None for build_sections() to create it.
+    """
+    if kind == 'markdown':
+        with open(source, encoding='utf-8') as f:
+            lines = f.readlines()
+        renderer = MarkdownRenderer(doc, images=ImageIngestor(os.path.dirname(os.path.abspath(source))))
+        return iter_markdown_guide_sections(lines, renderer), renderer.numbering
+    plan = load_render_plan(source) if kind == 'spec' else guide_plan()
+    heading_index(doc.part).descriptions = dict(plan.toc_descriptions)
+    return iter_plan_sections(plan), None
+
+def rebuild(kind, source, output_path, cache, compresslevel=None, deterministic=False, minimize=False):
+    """Build the guide from a 'guide', 'markdown' or 'spec' source into `output_path`
+
+    Unchanged sections are spliced from `cache` and unchanged package parts
+    are copied from the previous output as stored. Returns (rendered, reused,
+    writer).
+    """
+    doc = new_guide_document()
+    sections, numbering = source_sections(kind, source, doc)
+    rendered, reused = build_sections(doc, sections, cache, numbering)
+    if kind != 'markdown':
+        add_toc_entries(doc)
+    writer = write_package(doc, output_path, compresslevel, deterministic, output_path, minimize)
+    return rendered, reused, writer
+
+def watch(kind, source=None, output_path=DEFAULT_OUTPUT_PATH, cache_dir=None, compresslevel=None,
+          deterministic=False, minimize=False, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+    """Rebuild `output_path` each time the source is saved, until interrupted
+
+    The watched files are polled (portable, and cheap at this interval);
+    once a change has been quiet for `debounce` seconds, rebuild() runs with
+    the section fragments of the previous build kept in memory, so only the
+    touched sections render again. Editing this script instead restarts the
+    process, which picks up the new emitters and reuses the unchanged
+    sections from the on-disk cache.
+    """
+    script = os.path.abspath(__file__)
+    paths = [script] + ([source] if source else [])
+    cache_dir = cache_dir or WATCH_CACHE_DIR
+    cache = MemorySectionCache(SectionCache(cache_dir) if cache_dir else None)
+
+    def build():
+        started = time.perf_counter()
+        try:
+            rendered, reused, writer = rebuild(kind, source, output_path, cache, compresslevel, deterministic,
+                                               minimize)
+        except Exception as e:
+            print(f"❌ Build failed: {type(e).__name__}: {e}")
+            return
+        cache.prune()
+        state = "unchanged" if writer.skipped else f"{writer.copied} parts copied as stored"
+        print(f"🔄 {time.strftime('%H:%M:%S')} {output_name(output_path)}: {rendered} sections re-rendered, "
+              f"{reused} reused, {state} ({(time.perf_counter() - started) * 1000:.0f}ms)")
+
+    build()
+    print(f"👀 Watching {', '.join([os.path.basename(script)] + paths[1:])} (Ctrl+C to stop)")
+    seen = _watch_signature(paths)
+    try:
+        while True:
+            time.sleep(interval)
+            current = _watch_signature(paths)
+            if current == seen:
+                continue
+            # Debounce bursts of saves: wait until nothing has changed for a while
+            quiet_since = time.monotonic()
+            while time.monotonic() - quiet_since < debounce:
+                time.sleep(interval)
+                latest = _watch_signature(paths)
+                if latest != current:
+                    current, quiet_since = latest, time.monotonic()
+            if None in current:
+                continue
+            if current[0] != seen[0]:
+                print(f"🔁 {os.path.basename(script)} changed, restarting")
+                sys.stdout.flush()
+                os.execv(sys.executable, [sys.executable, script] + sys.argv[1:])
+            seen = current
+            build()
+    except KeyboardInterrupt:
+        print("👋 Stopped watching")
+
+# ==================== VOLUME SPLITTING ====================
+
+# Budget suffix -> (measure, multiplier): paragraphs, table rows or body XML bytes
+VOLUME_BUDGET_UNITS = {
+    'p': ('paragraphs', 1),
+    'r': ('rows', 1),
+    'b': ('bytes', 1),
+    'kb': ('bytes', 1024),
+    'mb': ('bytes', 1024 * 1024),
+}
+_VOLUME_BUDGET = re.compile(r'^\s*(\d+)\s*([a-z]+)\s*$')
+
+def parse_volume_budget(text):
+    """'2000p', '50000r' or '4MB' -> (measure, limit)"""
+    m = _VOLUME_BUDGET.match(text.lower())
+    if m is None or m.group(2) not in VOLUME_BUDGET_UNITS:
+        raise ValueError(f"Volume budget {text!r}: use a count with p (paragraphs), r (table rows), "
+                         "or B/KB/MB (bytes), e.g. 2000p")
+    measure, multiplier = VOLUME_BUDGET_UNITS[m.group(2)]
+    return measure, int(m.group(1)) * multiplier
+
+def volume_path(output_path, number):
+    """guide.docx -> guide-vol1.docx"""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}-vol{number}{ext or '.docx'}"
+
+def section_outline(task, fragment):
+    """Return (headings, weights) of a section, from its fragment or failing that its source
+
+    Sections with images have no fragment, so their weights are estimated
+    from the Markdown: one paragraph per block and the source length in
+    bytes.
+    """
+    if fragment is not None:
+        xml = fragment['xml']
+        weights = {
+            'paragraphs': xml.count('<w:p>') + xml.count('<w:p '),
+            'rows': xml.count('<w:tr>') + xml.count('<w:tr '),
+            'bytes': len(xml.encode('utf-8')),
+        }
+        return [tuple(heading) for heading in fragment['headings']], weights
+    kind, payload = task
+    if kind != 'markdown':
+        raise ValueError(f"Cannot measure a {kind} section for volume splitting")
+    headings, weights = [], {'paragraphs': 0, 'rows': 0, 'bytes': len(''.join(payload).encode('utf-8'))}
+    for block in iter_markdown_blocks(payload):
+        if block[0] == 'heading':
+            text = ''.join(span[0] for span in parse_inline(block[2]))
+            headings.append((MD_HEADING_LEVELS.get(block[1], 3), text))
+        if block[0] == 'table':
+            weights['rows'] += len(block[2]) + 1
+        else:
+            weights['paragraphs'] += 1
+    return headings, weights
+
+def plan_volumes(weights, limit):
+    """Pack consecutive section weights into volumes of at most `limit`
+
+    A section over the limit on its own still gets a volume of its own.
+    """
+    volumes, size = [[]], 0
+    for i, weight in enumerate(weights):
+        if volumes[-1] and size + weight > limit:
+            volumes.append([])
+            size = 0
+        volumes[-1].append(i)
+        size += weight
+    return volumes
+
+def link_volumes(doc, owners, number, names):
+    """Turn links to bookmarks in other volumes into hyperlinks to "<volume>#<bookmark>"
+
+    `owners` maps bookmark names to the volume number holding them and
+    `names` lists the volume file names. Returns how many links changed.
+    """
+    part = doc.part
+    anchor_attr = qn('w:anchor')
+    count = 0
+    for hyperlink in doc.element.body.iter(qn('w:hyperlink')):
+        bookmark = hyperlink.get(anchor_attr)
+        owner = owners.get(bookmark)
+        if owner is None or owner == number:
+            continue
+        del hyperlink.attrib[anchor_attr]
+        hyperlink.set(qn('r:id'), relate_hyperlink(part, f"{names[owner - 1]}#{bookmark}"))
+        count += 1
+    return count
+
+def render_volume(job):
+    """Build and write one volume from split_volumes(); returns (path, cross-volume links)
+
+    `job` is picklable, so volumes render on worker processes. The headings
+    of earlier volumes are replayed into the heading index first, so every
+    bookmark gets the name the whole guide would give it, and those of later
+    volumes after, so a table of contents here lists the whole guide.
+    """
+    (path, number, names, items, before, after, owners, descriptions, images_dir,
+     compresslevel, deterministic, minimize) = job
+    doc = new_guide_document()
+    index = heading_index(doc.part)
+    index.descriptions = descriptions
+    for level, text in before:
+        index.add(level, text)
+    numbering = ListNumbering(doc)
+    images = ImageIngestor(images_dir)
+
+    if owners.get(TOC_BOOKMARK, number) != number:
+        p = add_paragraph(doc)
+        add_run(p, f"Volume {number} of {len(names)} · ", 'toc-description')
+        add_internal_link(p, TOC_BOOKMARK, "Table of Contents")
+    for kind, payload in items:
+        if kind == 'fragment':
+            _splice_fragment(doc, payload, numbering)
+        elif kind == 'plan':
+            emit_plan(doc, payload)
+        else:
+            MarkdownRenderer(doc, numbering, images).render(iter_markdown_blocks(payload))
+
+    for level, text in after:
+        index.add(level, text)
+    add_toc_entries(doc)
+    links = link_volumes(doc, owners, number, names)
+    write_package(doc, path, compresslevel, deterministic, minimize=minimize)
+    return path, links
+
+def split_volumes(kind, source, output_path, budget, cache_dir=None, jobs=1, compresslevel=None,
+                  deterministic=False, minimize=False):
+    """Build a 'guide', 'markdown' or 'spec' source as volumes of at most `budget` each
+
+    `budget` is a parse_volume_budget() string. Top-level sections are
+    rendered to fragments (on `jobs` processes, reusing `cache_dir`) and
+    measured, then packed in order into volume_path() files, which are
+    written concurrently. The first volume's table of contents covers every
+    volume, later volumes link back to it, and links between volumes become
+    relative hyperlinks to the volume file and bookmark.
+    """
+    started = time.perf_counter()
+    measure, limit = parse_volume_budget(budget)
+    doc = new_guide_document()
+    sections = list(source_sections(kind, source, doc)[0])
+    descriptions = heading_index(doc.part).descriptions
+    images_dir = os.path.dirname(os.path.abspath(source)) if kind == 'markdown' else '.'
+    cache = SectionCache(cache_dir) if cache_dir else None
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    pool = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        fragments = [cache.get(key) if cache is not None else None for name, key, render, task in sections]
+        missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+        rendered = (pool.map if pool else map)(render_section_fragment, [sections[i][3] for i in missing])
+        for i, fragment in zip(missing, rendered):
+            fragments[i] = fragment
+            if cache is not None and fragment is not None:
+                cache.put(sections[i][1], fragment)
+
+        outlines = [section_outline(section[3], fragment) for section, fragment in zip(sections, fragments)]
+        volumes = plan_volumes([weights[measure] for headings, weights in outlines], limit)
+        names = [os.path.basename(volume_path(output_path, n)) for n in range(1, len(volumes) + 1)]
+
+        # Replay every heading in order, as one document would name them, noting each one's volume
+        master = HeadingIndex()
+        owners, headings = {}, []
+        for number, members in enumerate(volumes, 1):
+            volume_headings = []
+            for i in members:
+                fragment = fragments[i]
+                if fragment is not None and f'w:name="{TOC_BOOKMARK}"' in fragment['xml']:
+                    owners[TOC_BOOKMARK] = number
+                for level, text in outlines[i][0]:
+                    owners[master.add(level, text)[4]] = number
+                    volume_headings.append((level, text))
+            headings.append(volume_headings)
+
+        volume_jobs = []
+        for number, members in enumerate(volumes, 1):
+            items = [('fragment', fragments[i]) if fragments[i] is not None else sections[i][3] for i in members]
+            volume_jobs.append((volume_path(output_path, number), number, names, items,
+                          [h for volume_headings in headings[:number - 1] for h in volume_headings],
+                          [h for volume_headings in headings[number:] for h in volume_headings],
+                          owners, descriptions, images_dir, compresslevel, deterministic, minimize))
+        results = list((pool.map if pool else map)(render_volume, volume_jobs))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    print(f"📚 Split into {len(volumes)} volumes of at most {limit} {measure} "
+          f"({time.perf_counter() - started:.2f}s)")
+    for (path, links), members in zip(results, volumes):
+        size = sum(outlines[i][1][measure] for i in members)
+        print(f"   📘 {path}: {len(members)} sections, {size} {measure}, {links} cross-volume links")
+    return [path for path, links in results]
+
+# ==================== RENDER SERVER ====================
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_QUEUE_LIMIT = 32
+SERVER_TIMEOUT = 60.0
+SERVER_READ_TIMEOUT = 10.0
+SERVER_MAX_BODY = 8 * 1024 * 1024
+SERVER_WRITE_CHUNK = 64 * 1024
+# Markdown image paths in requests resolve here and may not leave it
+SERVER_ASSETS_DIR = os.path.dirname(GUIDE_MARKDOWN_PATH)
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+@functools.lru_cache(maxsize=None)
+def _server_merge_template(compresslevel):
+    return build_merge_template(compresslevel)
+
+@functools.lru_cache(maxsize=None)
+def _server_guide(compresslevel):
+    doc = new_plan_document(guide_plan())
+    for name, add_section in guide_sections():
+        add_section(doc)
+    add_toc_entries(doc)
+    buffer = io.BytesIO()
+    write_package(doc, buffer, compresslevel)
+    return buffer.getvalue()
+
+def _init_render_worker():
+    """Load the styled base template and the mail-merge template once per worker"""
+    import signal
+    # Ctrl-C reaches the whole process group; the server shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    new_guide_document()
+    _server_merge_template(None)
+
+def render_payload(kind, payload, compresslevel=None):
+    """Render one server request to DOCX bytes; runs in worker processes
+
+    `kind` is 'guide' (the built-in guide, rendered once per level and
+    reused), 'workspace' (a mail-merged guide for a dict of MERGE_FIELDS) or
+    'markdown' (Markdown source text).
+    """
+    if kind == 'guide':
+        return _server_guide(compresslevel)
+    if kind == 'workspace':
+        return _server_merge_template(compresslevel).render(payload)
+    doc = new_guide_document()
+    render_markdown(doc, payload.splitlines(keepends=True), ImageIngestor(SERVER_ASSETS_DIR))
+    buffer = io.BytesIO()
+    write_package(doc, buffer, compresslevel)
+    return buffer.getvalue()
+
+def parse_render_request(content_type, body, query=''):
+    """Return (kind, payload, compresslevel) for a POST /render body
+
+    text/markdown bodies are Markdown guides. application/json bodies are
+    {"markdown": "..."}, {"workspace": {field: value, ...}} or {} for the
+    built-in guide, each with an optional "compress_level" (0-9). The level
+    may also come from a ?compress_level= query parameter. Raises ValueError
+    for anything malformed.
+    """
+    import json
+    from urllib.parse import parse_qs
+    compresslevel = parse_qs(query).get('compress_level', [None])[-1]
+    if compresslevel is not None:
+        if not (compresslevel.isascii() and compresslevel.isdigit()):
+            raise ValueError("compress_level must be an integer")
+        compresslevel = int(compresslevel)
+    media = content_type.split(';')[0].strip().lower()
+    if media in ('text/markdown', 'text/plain'):
+        kind, payload = 'markdown', body.decode('utf-8')
+    elif media == 'application/json':
+        spec = json.loads(body)
+        if not isinstance(spec, dict):
+            raise ValueError("JSON body must be an object")
+        if 'compress_level' in spec:
+            compresslevel = spec['compress_level']
+            # bool is an int subclass, and 3.7 or "5" would be coerced silently
+            if not isinstance(compresslevel, int) or isinstance(compresslevel, bool):
+                raise ValueError("compress_level must be an integer")
+        if 'markdown' in spec:
+            kind, payload = 'markdown', spec['markdown']
+            if not isinstance(payload, str):
+                raise ValueError("\"markdown\" must be a string")
+        elif 'workspace' in spec:
+            kind, payload = 'workspace', spec['workspace']
+            missing = set(MERGE_FIELDS).difference(payload) if isinstance(payload, dict) else MERGE_FIELDS
+            if missing:
+                raise ValueError(f"\"workspace\" is missing merge fields {', '.join(sorted(missing))}")
+        else:
+            kind, payload = 'guide', None
+    else:
+        raise ValueError(f"Unsupported content type: {media or '(none)'}")
+
+    if compresslevel is not None:
+        if not 0 <= compresslevel <= 9:
+            raise ValueError("compress_level must be between 0 and 9")
+    if kind == 'markdown':
+        for m in map(_MD_IMAGE.match, map(str.strip, payload.splitlines())):
+            if m and '://' not in m.group('src'):
+                src = os.path.normpath(m.group('src'))
+                if os.path.isabs(src) or src.split(os.sep)[0] == os.pardir:
+                    raise ValueError(f"Image path outside the assets directory: {m.group('src')}")
+    return kind, payload, compresslevel
+
+class RenderServer:
+    """Local HTTP render service: an asyncio front end over a warm process pool
+
+    POST /render answers with the DOCX for a parse_render_request() body.
+    Worker processes keep the styled base template and the mail-merge
+    template loaded between requests. At most `jobs` renders run at once and
+    `queue` more wait for a worker; past that, requests are turned away with
+    503 and Retry-After, so a burst can't pile up unbounded work. A render
+    that takes longer than `timeout` seconds gets 504 (the worker finishes it
+    and its slot frees up then). GET /healthz reports the pool and queue.
+    Connections are kept alive between requests.
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, jobs=1, queue=SERVER_QUEUE_LIMIT,
+                 timeout=SERVER_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.jobs = max(jobs, 1)
+        self.queue = queue
+        self.timeout = timeout
+        self.pending = 0  # renders running or waiting for a worker
+        self.counts = {'rendered': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0}
+        self._pool = None
+        self._server = None
+
+    def _new_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(self.jobs, initializer=_init_render_worker)
+
+    async def start(self):
+        """Start the workers and begin listening; sets `port` when it was 0"""
+        import asyncio
+        self._pool = self._new_pool()
+        loop = asyncio.get_running_loop()
+        # Workers start (and load their templates) now rather than on the first requests
+        await asyncio.gather(*(loop.run_in_executor(self._pool, os.getpid) for _ in range(self.jobs)))
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    def health(self):
+        running = min(self.pending, self.jobs)
+        return {'status': 'ok', 'workers': self.jobs, 'running': running,
+                'queued': self.pending - running, 'queue_limit': self.queue, **self.counts}
+
+    async def _read_request(self, reader):
+        # Returns (method, path, query, headers, body), None once the client is
+        # done, or an (status, message) error for a request that can't be read
+        import asyncio
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), SERVER_READ_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            return 431, "Request headers too large"
+        try:
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            for line in filter(None, header_lines):
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return 400, "Malformed request"
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            return 411, "Send a Content-Length"
+        if length > SERVER_MAX_BODY:
+            return 413, f"Request bodies are limited to {SERVER_MAX_BODY} bytes"
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), SERVER_READ_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        path, _, query = target.partition('?')
+        return method, path, query, headers, body
+
+    async def _render(self, content_type, body, query):
+        import asyncio
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            kind, payload, compresslevel = parse_render_request(content_type, body, query)
+        except (ValueError, UnicodeDecodeError) as e:
+            return 400, str(e)
+        if self.pending >= self.jobs + self.queue:
+            self.counts['rejected'] += 1
+            return 503, "Render queue is full; retry shortly"
+
+        self.pending += 1
+        pool = self._pool
+        future = asyncio.get_running_loop().run_in_executor(pool, render_payload, kind, payload, compresslevel)
+        # The slot frees when the worker is done, even if the client gave up
+        future.add_done_callback(self._render_done)
+        try:
+            return 200, await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.counts['timed_out'] += 1
+            return 504, f"Render took longer than {self.timeout:g}s"
+        except BrokenProcessPool:
+            self.counts['failed'] += 1
+            # Renders that were queued on the same pool fail too; only the first restarts it
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+            return 500, "Render worker died; the pool was restarted"
+        except (ValueError, KeyError, OSError) as e:
+            # Details (which can name server paths) go to the server's log, not the client
+            self.counts['failed'] += 1
+            print(f"❌ {kind} render failed: {type(e).__name__}: {e}", file=sys.stderr)
+            return 422, f"The {kind} could not be rendered ({type(e).__name__}); check its content and images"
+        except Exception as e:
+            self.counts['failed'] += 1
+            import traceback
+            traceback.print_exception(e, file=sys.stderr)
+            return 500, "Internal render error"
+
+    def _render_done(self, future):
+        self.pending -= 1
+        if not future.cancelled() and future.exception() is None:
+            self.counts['rendered'] += 1
+
+    async def _respond(self, writer, status, body, content_type, keep_alive, extra=()):
+        import asyncio
+        from http import HTTPStatus
+        if isinstance(body, str):
+            body = f"{body}\n".encode('utf-8')
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                *extra]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        # Written in chunks so a slow client holds back this response, not the loop
+        view = memoryview(body)
+        for start in range(0, len(view), SERVER_WRITE_CHUNK):
+            writer.write(view[start:start + SERVER_WRITE_CHUNK])
+            await asyncio.wait_for(writer.drain(), self.timeout)
+
+    async def _handle(self, reader, writer):
+        import json
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                if len(request) == 2:
+                    await self._respond(writer, *request, 'text/plain; charset=utf-8', False)
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                extra = ()
+                if path == '/healthz' and method == 'GET':
+                    status, content_type = 200, 'application/json'
+                    response = json.dumps(self.health())
+                elif path == '/render' and method == 'POST':
+                    status, response = await self._render(headers.get('content-type', ''), body, query)
+                    if status == 200:
+                        content_type = DOCX_CONTENT_TYPE
+                        extra = ('Content-Disposition: attachment; filename="VOLTIC_USER_GUIDE.docx"',)
+                    else:
+                        content_type = 'text/plain; charset=utf-8'
+                        if status == 503:
+                            extra = ('Retry-After: 1',)
+                elif path in ('/healthz', '/render'):
+                    status, content_type, response = 405, 'text/plain; charset=utf-8', "Method not allowed"
+                    extra = (f"Allow: {'GET' if path == '/healthz' else 'POST'}",)
+                else:
+                    status, content_type, response = 404, 'text/plain; charset=utf-8', "Not found"
+                await self._respond(writer, status, response, content_type, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (ConnectionError, TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, jobs=1, queue=SERVER_QUEUE_LIMIT, timeout=SERVER_TIMEOUT):
+    """Run a RenderServer until interrupted"""
+    import asyncio
+    server = RenderServer(host, port, jobs, queue, timeout)
+
+    async def run():
+        import signal
+        await server.start()
+        print(f"🌐 Render server listening on http://{host}:{server.port} "
+              f"({server.jobs} workers, queue {queue}, timeout {timeout:g}s)")
+        # SIGTERM (e.g. from a process manager) stops the server like Ctrl-C
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        with contextlib.suppress(asyncio.CancelledError):
+            await server.serve_forever()
+        print("👋 Render server stopped")
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(run())
+
+# ==================== PROFILING ====================
+
+# Emitters timed individually when profiling; sections and saves are spans too
+PROFILED_EMITTERS = ('add_heading', 'add_paragraph', 'add_run', 'add_bulk_table',
+                     'add_hyperlink', 'add_hyperlinks', 'add_page_break')
+PROFILE_ENV = 'VOLTIC_PROFILE'
+
+_profiler = None
+_NO_SPAN = contextlib.nullcontext()
+
+def profile_span(name, doc=None):
+    """Time a block when profiling is enabled; a shared no-op context otherwise
+
+    With `doc`, the span's element count is the number of body blocks the
+    block added.
+    """
+    if _profiler is None:
+        return _NO_SPAN
+    return _profiler.span(name, doc)
+
+def _element_count(result):
+    """Number of XML elements in an emitter's return value"""
+    if isinstance(result, (list, tuple)):
+        return sum(_element_count(item) for item in result)
+    element = getattr(result, '_element', result)
+    return sum(1 for _ in element.iter()) if isinstance(element, etree._Element) else 0
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'doc', 'elements', 'started', 'allocated', 'blocks')
+
+    def __init__(self, profiler, name, doc=None):
+        self.profiler = profiler
+        self.name = name
+        self.doc = doc
+        self.elements = 0
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        if self.doc is not None:
+            self.blocks = len(self.doc.element.body)
+        self.allocated = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.started
+        allocated = tracemalloc.get_traced_memory()[0] - self.allocated
+        if self.doc is not None:
+            self.elements = len(self.doc.element.body) - self.blocks
+        self.profiler.record(wall, self.elements, allocated)
+
+class Profiler:
+    """Wall time, element counts and tracemalloc allocation deltas for nested spans
+
+    Stats are kept per call path (e.g. build > section:7. Ad Generator >
+    add_bulk_table), which is what the folded flamegraph dump needs; the
+    text report sums them per span name.
+    """
+
+    def __init__(self):
+        self.stack = ['build']
+        self.paths = {}  # call path -> [calls, wall, child wall, elements, allocated]
+        self.started = time.perf_counter()
+        self.total = self.peak = None
+
+    def finish(self):
+        """Freeze the total wall time and peak traced memory"""
+        self.total = time.perf_counter() - self.started
+        self.peak = tracemalloc.get_traced_memory()[1]
+
+    def span(self, name, doc=None):
+        return _Span(self, name, doc)
+
+    def record(self, wall, elements, allocated):
+        path = tuple(self.stack)
+        self.stack.pop()
+        stats = self.paths.setdefault(path, [0, 0.0, 0.0, 0, 0])
+        stats[0] += 1
+        stats[1] += wall
+        stats[3] += elements
+        stats[4] += allocated
+        parent = self.paths.setdefault(path[:-1], [0, 0.0, 0.0, 0, 0])
+        parent[2] += wall
+
+    def _profiled(self, name, emitter):
+        @functools.wraps(emitter)
+        def profiled(*args, **kwargs):
+            with self.span(name) as span:
+                result = emitter(*args, **kwargs)
+                span.elements = _element_count(result)
+            return result
+        return profiled
+
+    def report(self):
+        """Sorted text report: per-span totals, slowest first"""
+        by_name = {}
+        for path, (calls, wall, child, elements, allocated) in self.paths.items():
+            if len(path) < 2:
+                continue
+            stats = by_name.setdefault(path[-1], [0, 0.0, 0.0, 0, 0])
+            # Recursive spans (add_hyperlinks -> add_hyperlink) count once in the total
+            if path[-1] not in path[:-1]:
+                stats[1] += wall
+            stats[0] += calls
+            stats[2] += wall - child
+            stats[3] += elements
+            stats[4] += allocated
+
+        lines = [f"Profile: {self.total * 1000:.1f} ms total, {self.peak / 1024 / 1024:.1f} MB peak traced memory",
+                 f"{'span':<40}{'calls':>8}{'total ms':>11}{'self ms':>10}{'elements':>10}{'alloc KB':>11}"]
+        for name, (calls, wall, own, elements, allocated) in sorted(
+                by_name.items(), key=lambda item: item[1][1], reverse=True):
+            lines.append(f"{name[:39]:<40}{calls:>8}{wall * 1000:>11.1f}{own * 1000:>10.1f}"
+                         f"{elements:>10}{allocated / 1024:>11.1f}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        """JSON-ready per-path stats, with self time for flamegraphs"""
+        return {
+            'total_ms': self.total * 1000,
+            'peak_traced_bytes': self.peak,
+            'spans': [
+                {'stack': list(path), 'calls': calls, 'total_ms': wall * 1000,
+                 'self_ms': (wall - child) * 1000, 'elements': elements, 'alloc_bytes': allocated}
+                for path, (calls, wall, child, elements, allocated) in self.paths.items()
+                if len(path) > 1
+            ],
+        }
+
+    def folded(self):
+        """Folded stacks ('a;b;c <self µs>' per line) for flamegraph.pl or speedscope"""
+        return ''.join(f"{';'.join(span['stack'])} {round(span['self_ms'] * 1000)}\n"
+                       for span in self.dump()['spans'])
+
+def enable_profiling():
+    """Start tracemalloc and route the emitters through timing wrappers"""
+    global _profiler
+    if _profiler is None:
+        tracemalloc.start()
+        _profiler = Profiler()
+        module = globals()
+        for name in PROFILED_EMITTERS:
+            module[name] = _profiler._profiled(name, module[name])
+    return _profiler
+
+def write_profile(prefix):
+    """Write PREFIX.txt, PREFIX.json and PREFIX.folded from the active profiler"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    module = globals()
+    for name in PROFILED_EMITTERS:
+        module[name] = module[name].__wrapped__
+    profiler.finish()
+    tracemalloc.stop()
+
+    report = profiler.report()
+    with open(f"{prefix}.txt", 'w', encoding='utf-8') as f:
+        f.write(report)
+    with open(f"{prefix}.json", 'w', encoding='utf-8') as f:
+        import json
+        json.dump(profiler.dump(), f, indent=2)
+    with open(f"{prefix}.folded", 'w', encoding='utf-8') as f:
+        f.write(profiler.folded())
+    print(report, end='')
+    print(f"🔬 Profile written: {prefix}.txt, {prefix}.json, {prefix}.folded")
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Create the formatted Voltic User Guide DOCX")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT_PATH,
+                        help="where to write the DOCX file ('-' for stdout)")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help="cache rendered sections here and only re-render the ones that changed")
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help="render sections on N worker processes (default: 1)")
+    parser.add_argument('--stream', action='store_true',
+                        help="stream word/document.xml into the package as it is built (flat memory)")
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help="zip deflate level; 0 stores parts uncompressed, fastest to write "
+                             "(default: zlib's default)")
+    parser.add_argument('--deterministic', action='store_true',
+                        help="byte-identical output for identical content (pinned timestamps, fixed part "
+                             "order; SOURCE_DATE_EPOCH sets the date) and skip rewriting an unchanged file")
+    parser.add_argument('--patch', nargs='?', const='', metavar='BASE',
+                        help="copy parts unchanged since an earlier build (default: the -o file) as stored "
+                             "and recompress only the changed ones")
+    parser.add_argument('--minimize', action='store_true',
+                        help="merge runs with equal formatting, fold empty spacer paragraphs into paragraph "
+                             "spacing where that is smaller and drop properties the styles already give, "
+                             "reporting the before/after sizes")
+    parser.add_argument('--markdown', metavar='PATH', nargs='?', const=GUIDE_MARKDOWN_PATH,
+                        help="compile a Markdown guide instead of the built-in content "
+                             "(default: voltic/VOLTIC_USER_GUIDE.md)")
+    parser.add_argument('--spec', metavar='PATH', nargs='?', const=GUIDE_SPEC_PATH,
+                        help="render a JSON/YAML document spec, compiled once into a cached render plan "
+                             "(default: voltic/user_guide_spec.json)")
+    parser.add_argument('--formats', metavar='LIST',
+                        help="comma-separated formats from " + ", ".join(OUTPUT_FORMATS) + " rendered from "
+                             "one pass over the spec (--spec or the built-in guide's); HTML and Markdown "
+                             "are written next to -o")
+    parser.add_argument('--watch', action='store_true',
+                        help="rebuild -o whenever the Markdown guide, spec or this script is saved, "
+                             "re-rendering only the changed sections")
+    parser.add_argument('--split', metavar='BUDGET',
+                        help="write the guide as -o volumes (guide-vol1.docx, ...) split at top-level sections, "
+                             "each at most BUDGET paragraphs (2000p), table rows (5000r) or XML bytes (4MB), "
+                             "rendered on -j workers with one table of contents and cross-volume links")
+    parser.add_argument('--merge', metavar='WORKSPACES',
+                        help="mail-merge one guide per workspace in this CSV/JSONL file "
+                             "(fields: " + ", ".join(MERGE_FIELDS) + "); -o is then the output directory "
+                             f"(default: ./{MERGE_OUTPUT_DIR})")
+    parser.add_argument('--serve', metavar='[HOST:]PORT', nargs='?', const=f"{SERVER_HOST}:{SERVER_PORT}",
+                        help="run the HTTP render server with -j workers "
+                             f"(POST /render, GET /healthz; default: {SERVER_HOST}:{SERVER_PORT})")
+    parser.add_argument('--queue', type=int, default=SERVER_QUEUE_LIMIT, metavar='N',
+                        help=f"with --serve, renders allowed to wait for a worker (default: {SERVER_QUEUE_LIMIT})")
+    parser.add_argument('--timeout', type=float, default=SERVER_TIMEOUT, metavar='SECONDS',
+                        help=f"with --serve, per-request render timeout (default: {SERVER_TIMEOUT:g})")
+    parser.add_argument('--profile', metavar='PREFIX', nargs='?', const='',
+                        help="time and trace allocations per section and emitter, writing PREFIX.txt, "
+                             f"PREFIX.json and PREFIX.folded (default: next to the output; or set {PROFILE_ENV})")
+    parser.add_argument('--campaign-report', metavar='CSV', nargs='?', const=CAMPAIGN_CSV_PATH,
+                        help="write a campaign performance report from a campaign-analysis export, one "
+                             "record per line (default: campaign-analysis.csv next to this script), to -o "
+                             f"(default: ./{CAMPAIGN_REPORT_PATH})")
+    parser.add_argument('--fan-out', action='store_true',
+                        help="with --campaign-report, write one report per ad account into -o, a directory "
+                             f"(default: ./{CAMPAIGN_REPORTS_DIR})")
+    parser.add_argument('--charts', action='store_true',
+                        help="with --campaign-report, embed matplotlib charts (cached by content hash)")
+    parser.add_argument('--top', type=int, default=CAMPAIGN_TOP_N, metavar='N',
+                        help=f"campaigns listed in the report's top-N table (default: {CAMPAIGN_TOP_N})")
+    args = parser.parse_args(argv)
+    to_stdout = args.output == '-'
+    if to_stdout and (args.merge or args.fan_out or args.formats):
+        parser.error("-o - writes a single document; --merge, --fan-out and --formats need a path")
+    if args.watch and (to_stdout or args.merge or args.formats or args.campaign_report or args.serve
+                       or args.split):
+        parser.error("--watch rebuilds one guide document (built-in, --markdown or --spec) at an -o path")
+    if args.split and (to_stdout or args.stream or args.merge or args.formats or args.campaign_report):
+        parser.error("--split writes volume files next to an -o path and cannot stream")
+    if args.split:
+        try:
+            parse_volume_budget(args.split)
+        except ValueError as e:
+            parser.error(str(e))
+    if to_stdout and args.patch == '':
+        parser.error("--patch needs a BASE package with -o -")
+    patch = args.patch or (args.output if args.patch == '' else None)
+    if args.charts:
+        import importlib.util
+        if importlib.util.find_spec('matplotlib') is None:
+            parser.error(CHARTS_NEED_MATPLOTLIB)
+    formats = args.formats.split(',') if args.formats else None
+    if formats and set(formats).difference(OUTPUT_FORMATS):
+        parser.error(f"--formats: choose from {', '.join(OUTPUT_FORMATS)}")
+
+    if args.serve:
+        host, _, port = args.serve.rpartition(':')
+        serve(host or SERVER_HOST, int(port), args.jobs, args.queue, args.timeout)
+        return
+    # The built-in guide is its spec, so --watch and --split follow edits to it too
+    kind, source = ('markdown', args.markdown) if args.markdown else ('spec', args.spec or GUIDE_SPEC_PATH)
+    if args.watch:
+        watch(kind, source, args.output, args.cache_dir, args.compress_level, args.deterministic, args.minimize)
+        return
+
+    profile = args.profile if args.profile is not None else os.environ.get(PROFILE_ENV)
+    if profile in ('0', ''):
+        profile = None if args.profile is None else ''
+    if profile is not None:
+        enable_profiling()
+
+    # With -o - the package goes to stdout, so status messages move to stderr
+    output = sys.stdout.buffer if to_stdout else args.output
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        if args.campaign_report:
+            try:
+                if args.fan_out:
+                    output_dir = args.output if args.output != DEFAULT_OUTPUT_PATH else CAMPAIGN_REPORTS_DIR
+                    fan_out_campaign_reports(args.campaign_report, output_dir, args.jobs, args.top, args.charts,
+                                             args.compress_level, args.deterministic, args.minimize)
+                else:
+                    output_path = output if args.output != DEFAULT_OUTPUT_PATH else CAMPAIGN_REPORT_PATH
+                    create_campaign_report(args.campaign_report, output_path, args.top, args.charts, args.jobs,
+                                           args.compress_level, args.deterministic, patch, args.minimize)
+            except ValueError as e:
+                # A malformed export: say which file and line rather than dumping a traceback
+                parser.error(f"--campaign-report: {e}")
+        elif args.merge:
+            output_dir = args.output if args.output != DEFAULT_OUTPUT_PATH else MERGE_OUTPUT_DIR
+            mail_merge_guides(args.merge, output_dir, args.jobs, args.compress_level)
+        elif args.split:
+            split_volumes(kind, source, args.output, args.split, args.cache_dir, args.jobs,
+                          args.compress_level, args.deterministic, args.minimize)
+        elif formats:
+            render_spec_formats(args.spec or GUIDE_SPEC_PATH, output, formats, args.compress_level,
+                                args.deterministic, patch, args.minimize)
+        elif args.spec:
+            render_spec(args.spec, output, args.cache_dir, args.jobs, args.stream, args.compress_level,
+                        args.deterministic, patch, args.minimize)
+        elif args.markdown:
+            convert_markdown_guide(args.markdown, output, args.cache_dir, args.jobs, args.stream,
+                                   args.compress_level, args.deterministic, patch, args.minimize)
+        else:
+            create_voltic_user_guide(output, args.cache_dir, args.jobs, args.stream, args.compress_level,
+                                     args.deterministic, patch, args.minimize)
+        if to_stdout:
+            output.flush()
+
+        if profile is not None:
+            prefix = os.path.splitext(args.output)[0] if not to_stdout else "VOLTIC_USER_GUIDE"
+            write_profile(profile if profile not in ('', '1') else f"{prefix}.profile")
 
 if __name__ == "__main__":
-    create_voltic_user_guide()
+    main()
@@ -0,0 +1,877 @@
+"""
+Regression tests for the Voltic User Guide DOCX generator: every build path
+must give the same package, plus regressions for fixed bugs.
+Run with: python -m pytest -q
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import json
+import os
+import zipfile
+
+# Keep the base template and plan caches out of the user's cache directory
+os.environ['VOLTIC_TEMPLATE_CACHE'] = ''
+
+import pytest
+
+import create_formatted_docx as guide
+
+SMALL_SPEC = {
+    'toc_descriptions': {'Alpha': "The first section"},
+    'sections': [
+        {'name': "Contents", 'blocks': [{'heading': "Contents"}, {'toc': True}, {'page_break': True}]},
+        {'name': "Alpha", 'blocks': [
+            {'heading': "Alpha"},
+            {'paragraph': ["Plain, ", {'text': "bold", 'format': 'label-bold'}, " and ",
+                           {'text': "a link", 'link': "https://example.com/a"}]},
+            {'paragraph': "Centered", 'align': 'center'},
+            {'table': {'header': ["Key", "Value"], 'rows': [["a", "1"], ["b", "2"]]}},
+        ]},
+        {'name': "Beta", 'blocks': [
+            {'heading': "Beta"},
+            {'paragraph': "First bullet", 'style': 'List Bullet'},
+            {'paragraph': "Second bullet", 'style': 'List Bullet'},
+        ]},
+    ],
+}
+
+SMALL_MARKDOWN = """\
+# Small Guide
+
+Intro with **bold**, *italic* and `code`, see [Beta](#beta).
+
+---
+
+# Alpha
+
+- one
+- two
+  - nested
+
+1. first
+2. second
+
+| Key | Value |
+|-----|-------|
+| a   | 1     |
+
+# Beta
+
+> A quote
+
+```
+code block
+```
+"""
+
+def build(render, *args, **kwargs):
+    """Run a builder into a BytesIO and return the package bytes"""
+    buffer = io.BytesIO()
+    render(*args, output_path=buffer, deterministic=True, **kwargs)
+    return buffer.getvalue()
+
+def document_xml(package):
+    with zipfile.ZipFile(io.BytesIO(package)) as zf:
+        return zf.read('word/document.xml').decode('utf-8')
+
+def reopen(doc):
+    """Write a built document with write_package() and load it back with python-docx"""
+    import docx
+    buffer = io.BytesIO()
+    guide.write_package(doc, buffer)
+    return docx.Document(io.BytesIO(buffer.getvalue()))
+
+def body_text(package):
+    """Text of the non-empty paragraphs, one per line"""
+    import docx
+    return '\n'.join(p.text for p in docx.Document(io.BytesIO(package)).paragraphs if p.text.strip())
+
+@pytest.fixture(scope='module')
+def guide_bytes():
+    return build(guide.create_voltic_user_guide)
+
+@pytest.fixture
+def spec_path(tmp_path):
+    path = tmp_path / 'spec.json'
+    path.write_text(json.dumps(SMALL_SPEC), encoding='utf-8')
+    return str(path)
+
+@pytest.fixture
+def markdown_path(tmp_path):
+    path = tmp_path / 'guide.md'
+    path.write_text(SMALL_MARKDOWN, encoding='utf-8')
+    return str(path)
+
+# ==================== BYTE IDENTITY ACROSS BUILD PATHS ====================
+
+@pytest.mark.parametrize('options', [
+    {'jobs': 2},
+    {'stream': True},
+    {'stream': True, 'jobs': 2},
+], ids=['parallel', 'stream', 'stream-parallel'])
+def test_guide_build_paths_identical(guide_bytes, options):
+    assert build(guide.create_voltic_user_guide, **options) == guide_bytes
+
+def test_guide_cache_cold_and_warm_identical(guide_bytes, tmp_path):
+    cache_dir = str(tmp_path / 'sections')
+    assert build(guide.create_voltic_user_guide, cache_dir=cache_dir) == guide_bytes
+    assert os.listdir(cache_dir)
+    assert build(guide.create_voltic_user_guide, cache_dir=cache_dir) == guide_bytes
+    assert build(guide.create_voltic_user_guide, cache_dir=cache_dir, jobs=2, stream=True) == guide_bytes
+
+def test_guide_spec_render_identical(guide_bytes):
+    assert build(guide.render_spec, guide.GUIDE_SPEC_PATH) == guide_bytes
+
+def test_guide_content_comes_from_spec(guide_bytes):
+    with open(guide.GUIDE_SPEC_PATH, encoding='utf-8') as f:
+        spec = json.load(f)
+    text = body_text(guide_bytes)
+    for section in spec['sections']:
+        for block in section['blocks']:
+            if 'heading' in block:
+                assert block['heading'] in text
+    for description in spec['toc_descriptions'].values():
+        assert description in text
+
+@pytest.mark.parametrize('options', [
+    {'jobs': 2},
+    {'stream': True},
+    {'cache': True},
+    {'cache': True, 'jobs': 2, 'stream': True},
+], ids=['parallel', 'stream', 'cache', 'cache-stream-parallel'])
+def test_spec_build_paths_identical(spec_path, tmp_path, options):
+    serial = build(guide.render_spec, spec_path)
+    if options.pop('cache', False):
+        options['cache_dir'] = str(tmp_path / 'sections')
+        assert build(guide.render_spec, spec_path, **options) == serial
+    assert build(guide.render_spec, spec_path, **options) == serial
+
+def test_spec_multi_format_docx_identical(spec_path, tmp_path):
+    output = str(tmp_path / 'out.docx')
+    guide.render_spec_formats(spec_path, output, ('docx', 'html', 'md'), deterministic=True)
+    with open(output, 'rb') as f:
+        assert f.read() == build(guide.render_spec, spec_path)
+    with open(tmp_path / 'out.md', encoding='utf-8') as f:
+        assert "# Alpha" in f.read()
+
+@pytest.mark.parametrize('options', [
+    {'jobs': 2},
+    {'stream': True},
+    {'cache': True},
+], ids=['parallel', 'stream', 'cache'])
+def test_markdown_build_paths_identical(markdown_path, tmp_path, options):
+    serial = build(guide.convert_markdown_guide, markdown_path)
+    if options.pop('cache', False):
+        options['cache_dir'] = str(tmp_path / 'sections')
+        assert build(guide.convert_markdown_guide, markdown_path, **options) == serial
+    assert build(guide.convert_markdown_guide, markdown_path, **options) == serial
+
+# ==================== DETERMINISTIC, PATCH & MINIMIZE ====================
+
+def test_deterministic_rebuild_is_skipped(tmp_path, spec_path):
+    output = str(tmp_path / 'guide.docx')
+    guide.render_spec(spec_path, output, deterministic=True)
+    first = os.stat(output).st_mtime_ns
+    assert os.path.exists(output + guide.DIGEST_SUFFIX)
+    guide.render_spec(spec_path, output, deterministic=True)
+    assert os.stat(output).st_mtime_ns == first
+
+def test_patch_build_identical(guide_bytes, tmp_path):
+    base = tmp_path / 'base.docx'
+    base.write_bytes(guide_bytes)
+    assert build(guide.create_voltic_user_guide, patch=str(base)) == guide_bytes
+
+@pytest.mark.parametrize('internal', ['_FH_FILENAME_LENGTH', '_DD_SIGNATURE'])
+def test_patch_build_recompresses_without_zipfile_internals(tmp_path, monkeypatch, internal):
+    def document():
+        doc = guide.new_guide_document()
+        guide.add_paragraph(doc, "Patched")
+        return doc
+
+    base = tmp_path / 'base.docx'
+    guide.write_package(document(), str(base))
+    # Seekable output, so zipfile itself needs neither name while writing
+    monkeypatch.delattr(zipfile, internal)
+    buffer = io.BytesIO()
+    writer = guide.write_package(document(), buffer, base=str(base))
+    monkeypatch.undo()
+    assert writer.copied == 0 and writer.rewritten > 0
+    with zipfile.ZipFile(buffer) as patched, zipfile.ZipFile(base) as original:
+        assert patched.namelist() == original.namelist()
+        assert all(patched.read(name) == original.read(name) for name in original.namelist())
+
+def test_failed_build_keeps_the_previous_output(tmp_path, monkeypatch):
+    output = tmp_path / 'guide.docx'
+    output.write_bytes(b"previous build")
+
+    def fail(self, name, data):
+        raise RuntimeError("build failed")
+
+    monkeypatch.setattr(guide.StreamingDocxWriter, '_write', fail)
+    doc = guide.new_guide_document()
+    guide.add_paragraph(doc, "Unfinished")
+    with pytest.raises(RuntimeError):
+        guide.write_package(doc, str(output))
+    assert output.read_bytes() == b"previous build"
+    assert os.listdir(tmp_path) == ['guide.docx']
+
+def test_minimize_keeps_text(guide_bytes):
+    assert body_text(build(guide.create_voltic_user_guide, minimize=True)) == body_text(guide_bytes)
+
+# ==================== SPEC VALIDATION ====================
+
+@pytest.mark.parametrize('spec', [
+    {'sections': [{'name': "x", 'blocks': [{'heading': ""}]}]},
+    {'sections': [{'name': "x", 'blocks': [{'paragraph': "x", 'style': 'No Such Style'}]}]},
+    {'sections': [{'name': "x", 'blocks': [{'paragraph': [{'text': "x", 'format': 'nope'}]}]}]},
+    {'sections': [{'name': "x", 'blocks': [{'table': {'header': ["a"], 'rows': [["1", "2"]]}}]}]},
+    {'sections': [{'name': "x", 'blocks': [{'heading': "a", 'paragraph': "b"}]}]},
+    {'sections': [], 'extra': 1},
+])
+def test_compile_spec_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        guide.compile_spec(spec)
+
+# ==================== BULK TABLES ====================
+
+def test_bulk_table_rows_header_and_text():
+    doc = guide.new_guide_document()
+    n = guide.BULK_TABLE_CHUNK_ROWS * 2 + 2  # spans two chunk boundaries
+    rows = ((f"Row {i}", " padded ", "a & b < c") if i % 2 else (f"Row {i}", None) for i in range(n))
+    guide.add_bulk_table(doc, ("Name", "Note", "Escaped"), rows)
+
+    (table,) = reopen(doc).tables
+    assert len(table.rows) == n + 1 and len(table.columns) == 3
+    assert table.style.name == 'Light Grid Accent 1'
+    # Only the header repeats on every page
+    assert [row._tr.trPr is not None and row._tr.trPr.find(guide.qn('w:tblHeader')) is not None
+            for row in table.rows] == [True] + [False] * n
+    assert [cell.text for cell in table.rows[0].cells] == ["Name", "Note", "Escaped"]
+    # Short rows and None values give empty cells; spaces and markup characters survive
+    assert [cell.text for cell in table.rows[1].cells] == ["Row 0", "", ""]
+    assert [cell.text for cell in table.rows[2].cells] == ["Row 1", " padded ", "a & b < c"]
+    assert [cell.text for cell in table.rows[-1].cells] == [f"Row {n - 1}", " padded ", "a & b < c"]
+
+def test_bulk_table_write_cell_fills_body_cells():
+    doc = guide.new_guide_document()
+
+    def write_cell(p, value):
+        guide.add_run(guide.Paragraph(p, None), f"<{value}>", 'label-bold')
+
+    table = guide.add_bulk_table(doc, ("Key", "Value"), [("a", 1), ("b", 2)], write_cell=write_cell)
+    assert [[cell.text for cell in row.cells] for row in table.rows] == [
+        ["Key", "Value"], ["<a>", "<1>"], ["<b>", "<2>"]]
+    assert table.rows[1].cells[0].paragraphs[0].runs[0].bold
+
+# ==================== HYPERLINK RELATIONSHIPS ====================
+
+def test_hyperlinks_share_one_relationship_per_url():
+    doc = guide.new_guide_document()
+    # A relationship python-docx made before the index existed is reused, not duplicated
+    existing = doc.part.relate_to("https://e.com/0", guide.RT.HYPERLINK, is_external=True)
+    urls = [f"https://e.com/{i % 3}" for i in range(12)]
+    for url in urls[:6]:
+        guide.add_hyperlink(guide.add_paragraph(doc), url, url)
+    guide.add_hyperlinks(guide.add_paragraph(doc), [(url, url) for url in urls[6:]], " | ")
+
+    reopened = reopen(doc)
+    rels = {r_id: rel.target_ref for r_id, rel in reopened.part.rels.items() if rel.reltype == guide.RT.HYPERLINK}
+    assert sorted(rels.values()) == ["https://e.com/0", "https://e.com/1", "https://e.com/2"]
+    assert {url: r_id for r_id, url in rels.items()}["https://e.com/0"] == existing
+    # Every link resolves to its own URL, and new rIds never replace the template's relationships
+    hyperlinks = reopened.element.body.iter(guide.qn('w:hyperlink'))
+    assert [rels[h.get(guide.qn('r:id'))] for h in hyperlinks] == urls
+    assert len(reopened.part.rels) == len(guide.new_guide_document().part.rels) + 3
+
+# ==================== PROFILING ====================
+
+PROFILE_SPEC = {'sections': [
+    {'name': "Alpha", 'blocks': [{'heading': "Alpha"}, {'paragraph': "x"},
+                                 {'table': {'header': ["a"], 'rows': [["1"], ["2"]]}}]},
+    {'name': "Beta", 'blocks': [{'heading': "Beta"}, {'paragraph': "y"}]},
+]}
+
+def test_profiling_off_adds_no_wrappers_or_tracing(tmp_path):
+    import tracemalloc
+    spec = tmp_path / 'spec.json'
+    spec.write_text(json.dumps(PROFILE_SPEC), encoding='utf-8')
+    build(guide.render_spec, str(spec))
+    assert guide._profiler is None
+    assert guide.profile_span('section:x') is guide._NO_SPAN
+    assert not any(hasattr(getattr(guide, name), '__wrapped__') for name in guide.PROFILED_EMITTERS)
+    assert not tracemalloc.is_tracing()
+
+def test_profiler_spans_and_dumps(tmp_path):
+    import tracemalloc
+    spec = tmp_path / 'spec.json'
+    spec.write_text(json.dumps(PROFILE_SPEC), encoding='utf-8')
+    guide.enable_profiling()
+    try:
+        build(guide.render_spec, str(spec))
+    finally:
+        guide.write_profile(str(tmp_path / 'profile'))
+
+    spans = {tuple(span['stack']): span for span in json.loads((tmp_path / 'profile.json').read_text())['spans']}
+    # Sections count the body blocks they added; emitters the elements they returned
+    assert spans[('build', 'section:Alpha')]['elements'] == 3
+    assert spans[('build', 'section:Beta')]['elements'] == 2
+    table = spans[('build', 'section:Alpha', 'add_bulk_table')]
+    assert table['calls'] == 1 and table['elements'] > 0 and table['alloc_bytes'] > 0
+    assert spans[('build', 'section:Beta', 'add_heading')]['calls'] == 1
+    section = spans[('build', 'section:Alpha')]
+    assert 0 <= section['self_ms'] <= section['total_ms']
+    assert ('build', 'save') in spans
+
+    report = (tmp_path / 'profile.txt').read_text()
+    assert report.startswith("Profile: ") and "section:Alpha" in report and "add_bulk_table" in report
+    folded = (tmp_path / 'profile.folded').read_text().splitlines()
+    assert "build;section:Alpha;add_bulk_table" in {line.rsplit(' ', 1)[0] for line in folded}
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in folded)
+    # write_profile() puts everything back
+    assert guide._profiler is None and not tracemalloc.is_tracing()
+    assert not any(hasattr(getattr(guide, name), '__wrapped__') for name in guide.PROFILED_EMITTERS)
+
+# ==================== HEADING BOOKMARKS & TABLE OF CONTENTS ====================
+
+def test_toc_entries_and_links_resolve_to_heading_bookmarks(guide_bytes):
+    from lxml import etree
+    body = etree.fromstring(document_xml(guide_bytes).encode('utf-8')).find(guide.qn('w:body'))
+    W = lambda tag: guide.qn(f'w:{tag}')
+    starts = body.findall('.//' + W('bookmarkStart'))
+    names = {start.get(W('name')): start for start in starts}
+    ids = [start.get(W('id')) for start in starts]
+    assert len(names) == len(starts) and len(set(ids)) == len(ids)
+    assert sorted(ids) == sorted(end.get(W('id')) for end in body.iter(W('bookmarkEnd')))
+
+    anchored = [h for h in body.iter(W('hyperlink')) if h.get(W('anchor')) is not None]
+    assert anchored and all(h.get(W('anchor')) in names for h in anchored)
+
+    # The entries sit before the TOC anchor paragraph and list every Heading 1 after it, in order
+    toc = names[guide.TOC_BOOKMARK].getparent()
+    paragraphs = list(body.iter(W('p')))
+    entries = [h for h in anchored if paragraphs.index(h.getparent()) < paragraphs.index(toc)]
+    headings = [p for p in paragraphs[paragraphs.index(toc):]
+                if p.find(f"{W('pPr')}/{W('pStyle')}[@{W('val')}='Heading1']") is not None]
+    assert len(entries) == len(headings) > 5
+    for entry, heading in zip(entries, headings):
+        bookmark = heading.find(W('bookmarkStart'))
+        assert entry.get(W('anchor')) == bookmark.get(W('name'))
+        assert ''.join(entry.itertext()) == ''.join(heading.itertext())
+
+def test_heading_index_slugs_and_bookmark_names():
+    index = guide.HeadingIndex()
+    # Links to headings not emitted yet get the name the heading will have
+    assert index.anchor('support--contact') == '_support__contact'
+    assert index.add(1, "Support & Contact")[2:] == ('support--contact', 1, '_support__contact')
+    assert index.add(2, "Support & Contact")[2:] == ('support--contact-1', 2, '_support__contact_1')
+    long = "A heading far longer than the forty characters Word keeps"
+    first, second = index.add(1, long), index.add(1, long + "!")
+    # Names that would collide once truncated get the bookmark id as a suffix
+    assert len(first[4]) == len(second[4]) == guide.BOOKMARK_NAME_MAX
+    assert first[4] != second[4] and second[4].endswith(f"_{second[3]}")
+    assert index.by_slug['support--contact-1'][1] == "Support & Contact"
+
+# ==================== WATCH MODE ====================
+
+def test_watch_rebuilds_only_the_changed_section(spec_path, tmp_path, monkeypatch, capsys):
+    output = str(tmp_path / 'watched.docx')
+    edited = json.loads(json.dumps(SMALL_SPEC))
+    edited['sections'][1]['blocks'][2]['paragraph'] = "Centered, and edited"
+    sleeps = []
+
+    def sleep(seconds):
+        # First poll: save an edit to one section; second poll: stop watching
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            with open(spec_path, 'w', encoding='utf-8') as f:
+                json.dump(edited, f)
+        elif len(sleeps) == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(guide.time, 'sleep', sleep)
+    guide.watch('spec', spec_path, output, deterministic=True, interval=0, debounce=0)
+
+    builds = [line for line in capsys.readouterr().out.splitlines() if line.startswith("🔄")]
+    assert len(builds) == 2
+    assert "3 sections re-rendered, 0 reused" in builds[0]
+    assert "1 sections re-rendered, 2 reused" in builds[1]
+    with open(output, 'rb') as f:
+        assert f.read() == build(guide.render_spec, spec_path)
+    assert "Centered, and edited" in document_xml(build(guide.render_spec, spec_path))
+
+# ==================== VOLUME SPLITTING ====================
+
+def test_plan_volumes_packs_sections_in_order():
+    assert guide.plan_volumes([3, 9, 3], 12) == [[0, 1], [2]]
+    # A section over the budget still gets a volume of its own
+    assert guide.plan_volumes([3, 30, 3], 10) == [[0], [1], [2]]
+    assert guide.parse_volume_budget('4MB') == ('bytes', 4 * 1024 * 1024)
+    with pytest.raises(ValueError):
+        guide.parse_volume_budget('12 pages')
+
+def _volume_links(path):
+    """(relationship targets with a #bookmark, bookmark names) of a volume"""
+    import re
+    with zipfile.ZipFile(path) as zf:
+        xml = zf.read('word/document.xml').decode('utf-8')
+        rels = zf.read('word/_rels/document.xml.rels').decode('utf-8')
+    return sorted(re.findall(r'Target="([^"]*#[^"]*)"', rels)), re.findall(r'w:name="(_[^"]+)"', xml)
+
+def test_split_volumes_boundaries_and_cross_volume_links(spec_path, tmp_path):
+    output = str(tmp_path / 'g.docx')
+    paths = guide.split_volumes('spec', spec_path, output, '12p', deterministic=True)
+    assert [os.path.basename(path) for path in paths] == ['g-vol1.docx', 'g-vol2.docx']
+    # Contents (3 paragraphs) and Alpha (9, counting table cells) fill the first volume
+    assert _volume_links(paths[0]) == (['g-vol2.docx#_beta'], ['_contents', '_TocEntries', '_alpha'])
+    # Later volumes link back to the table of contents in the first
+    assert _volume_links(paths[1]) == (['g-vol1.docx#_TocEntries'], ['_beta'])
+
+    whole = body_text(build(guide.render_spec, spec_path))
+    with open(paths[0], 'rb') as first, open(paths[1], 'rb') as second:
+        volumes = body_text(first.read()) + '\n' + body_text(second.read())
+    assert volumes.replace("Volume 2 of 2 · Table of Contents\n", "") == whole
+
+def test_split_volumes_rewrites_markdown_links_across_volumes(markdown_path, tmp_path):
+    paths = guide.split_volumes('markdown', markdown_path, str(tmp_path / 'g.docx'), '6p', jobs=2)
+    assert len(paths) == 3
+    # "see [Beta](#beta)" in the first volume now points into the third
+    assert _volume_links(paths[0]) == (['g-vol3.docx#_beta'], ['_small_guide'])
+    assert _volume_links(paths[2]) == ([], ['_beta'])
+
+# ==================== CAMPAIGN REPORT ====================
+
+# Blank numeric cells count as 0; the quoted header and value commas must not shift columns
+CAMPAIGN_CSV = '''\
+Name,Status,Objective,"Notes, internal",Ad Account,Spend,Revenue,Impressions,Clicks,Purchases
+A,active,SALES,"x, y",Acct 1,100,300,1000,20,3
+B,paused,SALES,,Acct 2,50,,500,5,
+C,active,TRAFFIC,z,Acct 1,200,200,,,1
+"D, the best",active,TRAFFIC,,Acct 2,10,400,2000,100,4
+E,active,SALES,,Acct 1,0,0,0,0,0
+F,active,LEADS,,Acct 3,20,300,0,0,0
+'''
+
+@pytest.fixture
+def campaign_csv(tmp_path):
+    path = tmp_path / 'campaigns.csv'
+    path.write_text(CAMPAIGN_CSV, encoding='utf-8')
+    return str(path)
+
+@pytest.mark.parametrize('chunk_rows', [1, 2, 4, 100])
+def test_campaign_aggregation_across_chunk_boundaries(campaign_csv, chunk_rows):
+    stats = guide.aggregate_campaigns(campaign_csv, top=3, chunk_rows=chunk_rows)
+    assert (stats.campaigns, stats.active) == (6, 5)
+    assert stats.totals == {'Spend': 380, 'Revenue': 1200, 'Impressions': 3500, 'Clicks': 125, 'Purchases': 8}
+    # Ties go to the earlier row: A before F
+    assert [row[0] for row in stats.top_campaigns()] == ["D, the best", "A", "F"]
+    # (name, campaigns, spend, revenue, impressions, clicks, purchases), biggest spend first
+    assert stats.by_objective.rows() == [("TRAFFIC", 2, 210, 600, 2000, 100, 5), ("SALES", 3, 150, 300, 1500, 25, 3),
+                                         ("LEADS", 1, 20, 300, 0, 0, 0)]
+    assert [row[:4] for row in stats.by_account.rows()] == [("Acct 1", 3, 300, 500), ("Acct 2", 2, 60, 400),
+                                                            ("Acct 3", 1, 20, 300)]
+    assert sum(stats.ctr_counts) == 3
+
+def test_campaign_report_weighted_ratios(campaign_csv):
+    import docx
+    report = docx.Document(io.BytesIO(build(guide.create_campaign_report, campaign_csv, top=2)))
+    summary = {row.cells[0].text: row.cells[1].text for row in report.tables[0].rows}
+    assert summary["Total Spend"] == "$380.00"
+    assert summary["ROAS (spend-weighted)"] == "3.16x"  # 1200 / 380, not the mean of per-row ROAS
+    assert summary["CTR (impression-weighted)"] == "3.57%"  # 125 / 3500
+    assert [row.cells[0].text for row in report.tables[1].rows[1:]] == ["D, the best", "A"]
+    objectives = [[cell.text for cell in row.cells] for row in report.tables[2].rows[1:]]
+    assert objectives[0] == ["TRAFFIC", "2", "$210.00", "$600.00", "2.86x", "5.00%", "5"]
+
+def test_campaign_partitions_match_accounts(campaign_csv, tmp_path):
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    partitions = guide.partition_campaigns(campaign_csv, str(spill_dir), chunk_rows=2)
+    assert list(partitions) == ["Acct 1", "Acct 2", "Acct 3"]
+    names = {account: [name for chunk in guide.iter_partition_chunks(directory, chunk_rows=2)
+                       for name in chunk['Name'].tolist()] for account, directory in partitions.items()}
+    assert names == {"Acct 1": [b"A", b"C", b"E"], "Acct 2": [b"B", b"D, the best"], "Acct 3": [b"F"]}
+
+def test_campaign_malformed_value_names_the_file(campaign_csv, tmp_path):
+    path = tmp_path / 'bad.csv'
+    path.write_text(CAMPAIGN_CSV.replace("0,0,0,0,0", "0,zero,0,0,0"), encoding='utf-8')
+    with pytest.raises(ValueError, match="bad.csv.*'zero'"):
+        guide.aggregate_campaigns(str(path), chunk_rows=2)
+
+def test_default_outputs_are_relative_to_working_directory(campaign_csv, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    guide.main(['--campaign-report', campaign_csv])
+    guide.main(['--campaign-report', campaign_csv, '--fan-out'])
+    workspaces = tmp_path / 'workspaces.csv'
+    workspaces.write_text("workspace_name,ad_account_count,credit_balance,plan\nAcme,1,$10,Pro\n", encoding='utf-8')
+    guide.main(['--merge', str(workspaces)])
+    assert (tmp_path / guide.CAMPAIGN_REPORT_PATH).is_file()
+    assert sorted(os.listdir(tmp_path / guide.CAMPAIGN_REPORTS_DIR)) == ['acct-1.docx', 'acct-2.docx', 'acct-3.docx']
+    assert os.listdir(tmp_path / guide.MERGE_OUTPUT_DIR) == ['acme.docx']
+
+def test_fan_out_honors_deterministic_and_compress_level(campaign_csv, tmp_path):
+    output_dir = tmp_path / 'reports'
+    argv = ['--campaign-report', campaign_csv, '--fan-out', '-o', str(output_dir),
+            '--deterministic', '--compress-level', '0']
+    guide.main(argv)
+    reports = sorted(output_dir.glob('*.docx'))
+    assert [p.name for p in reports] == ['acct-1.docx', 'acct-2.docx', 'acct-3.docx']
+    for report in reports:
+        assert (output_dir / (report.name + guide.DIGEST_SUFFIX)).is_file()
+        with zipfile.ZipFile(report) as zf:
+            assert {info.compress_type for info in zf.infolist()} == {zipfile.ZIP_STORED}
+    written = [report.stat().st_mtime_ns for report in reports]
+    guide.main(argv)
+    assert [report.stat().st_mtime_ns for report in reports] == written
+
+# ==================== CHARTS ====================
+
+@pytest.fixture
+def fake_charts(monkeypatch):
+    """Stand in for matplotlib: chart specs 'draw' as their title, and every draw is recorded"""
+    drawn = []
+
+    def render_chart_png(spec):
+        drawn.append(spec['title'])
+        return spec['title'].encode('utf-8')
+
+    monkeypatch.setattr(guide, '_matplotlib_version', lambda: 'test')
+    monkeypatch.setattr(guide, 'render_chart_png', render_chart_png)
+    return drawn
+
+def test_charts_are_cached_by_content(fake_charts, tmp_path):
+    specs = {'a': {'kind': 'bar', 'title': "A"}, 'same-as-a': {'kind': 'bar', 'title': "A"},
+             'b': {'kind': 'bar', 'title': "B"}}
+    assert guide.render_charts(specs, cache_dir=str(tmp_path)) == {'a': b"A", 'same-as-a': b"A", 'b': b"B"}
+    assert guide.render_charts(specs, cache_dir=str(tmp_path)) == {'a': b"A", 'same-as-a': b"A", 'b': b"B"}
+    assert fake_charts == ["A", "B"]
+    # No cache: drawn every time, and nothing is written
+    guide.render_charts(specs, cache_dir=None)
+    assert fake_charts == ["A", "B", "A", "B"]
+
+def test_chart_errors_are_not_swallowed(fake_charts, monkeypatch):
+    def broken(spec):
+        raise TypeError("bad plotting call")
+
+    monkeypatch.setattr(guide, 'render_chart_png', broken)
+    with pytest.raises(TypeError, match="bad plotting call"):
+        guide.render_charts({'a': {'kind': 'bar', 'title': "A"}}, cache_dir=None)
+
+def test_charts_without_matplotlib_explain_the_install(campaign_csv, tmp_path, monkeypatch, capsys):
+    import sys
+    monkeypatch.setitem(sys.modules, 'matplotlib', None)
+    guide._matplotlib_version.cache_clear()
+    try:
+        with pytest.raises(ImportError, match="pip install matplotlib"):
+            guide.render_charts({'a': {'kind': 'bar', 'title': "A"}}, cache_dir=None)
+        with pytest.raises(SystemExit):
+            guide.main(['--campaign-report', campaign_csv, '--charts', '-o', str(tmp_path / 'report.docx')])
+    finally:
+        guide._matplotlib_version.cache_clear()
+    assert guide.CHARTS_NEED_MATPLOTLIB in capsys.readouterr().err
+    assert not (tmp_path / 'report.docx').exists()
+
+# ==================== MAIL MERGE & FAN-OUT FILE NAMES ====================
+
+def test_file_stems_never_collide():
+    seen = {}
+    stems = [guide._file_stem(name, seen, 'workspace') for name in ("Acme", "Acme", "Acme 2", "acme-2", "", "")]
+    assert stems == ['acme', 'acme-2', 'acme-2-2', 'acme-2-3', 'workspace', 'workspace-2']
+
+def test_mail_merge_writes_one_file_per_workspace(tmp_path):
+    workspaces = tmp_path / 'workspaces.csv'
+    workspaces.write_text("workspace_name,ad_account_count,credit_balance,plan\n"
+                          "Acme,1,$10,Pro\nAcme,2,$20,Pro\nAcme 2,3,$30,Agency\n", encoding='utf-8')
+    output_dir = tmp_path / 'guides'
+    assert guide.mail_merge_guides(str(workspaces), str(output_dir)) == 3
+    assert sorted(os.listdir(output_dir)) == ['acme-2-2.docx', 'acme-2.docx', 'acme.docx']
+    assert "Agency" in document_xml((output_dir / 'acme-2-2.docx').read_bytes())
+
+# ==================== XML MINIMIZATION ====================
+
+def test_minimize_never_grows_document_xml(guide_bytes, markdown_path):
+    assert len(document_xml(build(guide.create_voltic_user_guide, minimize=True))) <= len(document_xml(guide_bytes))
+    plain = build(guide.convert_markdown_guide, markdown_path)
+    assert len(document_xml(build(guide.convert_markdown_guide, markdown_path, minimize=True))) <= \
+        len(document_xml(plain))
+
+def test_minimize_folds_spacers_only_when_smaller():
+    doc = guide.new_guide_document()
+    guide.add_paragraph(doc, "Before")
+    guide.add_paragraph(doc)
+    guide.add_paragraph(doc, "After")
+    guide.add_paragraph(doc, "\n" * 8)
+    guide.add_paragraph(doc, "Last")
+    body = doc.element.body
+    blocks = [element for element in body if element.tag != guide.qn('w:sectPr')]
+    minimizer = guide.XmlMinimizer(doc)
+    minimizer.minimize(blocks)
+    # The bare <w:p/> stays; the eight-line spacer becomes spacing before "Last"
+    assert minimizer.stats['spacers'] == 1
+    texts = [p.text for p in doc.paragraphs]
+    assert texts == ["Before", "", "After", "Last"]
+    assert doc.paragraphs[3]._p.pPr.spacing is not None
+
+# ==================== MARKDOWN INLINE MARKUP ====================
+
+def test_link_url_keeps_balanced_parentheses():
+    assert guide.parse_inline("[x](https://e.com/a_(b).)") == [("x", '', "https://e.com/a_(b).")]
+    assert guide.parse_inline("see [w](https://en.wikipedia.org/wiki/Foo_(bar)).") == [
+        ("see ", '', None), ("w", '', "https://en.wikipedia.org/wiki/Foo_(bar)"), (".", '', None)]
+
+def test_link_text_is_parsed_for_markup():
+    assert guide.parse_inline("[l **x**](u)") == [("l ", '', "u"), ("x", 'b', "u")]
+
+def test_link_with_markup_renders_as_one_hyperlink():
+    doc = guide.new_guide_document()
+    guide.render_markdown(doc, ["[l **x**](https://e.com/a_(b))\n"])
+    hyperlinks = doc.element.body.findall('.//' + guide.qn('w:hyperlink'))
+    assert len(hyperlinks) == 1
+    runs = hyperlinks[0].findall(guide.qn('w:r'))
+    assert [r.text for r in runs] == ["l ", "x"]
+    assert runs[1].find(guide.qn('w:rPr')).find(guide.qn('w:b')) is not None
+    assert doc.part.rels[hyperlinks[0].get(guide.qn('r:id'))].target_ref == "https://e.com/a_(b)"
+    assert "**" not in doc.paragraphs[0].text
+
+# ==================== RENDER SERVER ====================
+
+class _FailingPool(concurrent.futures.Executor):
+    """Executor whose every task fails with `error`, recording shutdown() calls"""
+
+    def __init__(self, error):
+        self.error = error
+        self.shutdowns = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        future.set_exception(self.error)
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shutdowns.append((wait, cancel_futures))
+
+def _render_with(pool, body=b'{}'):
+    server = guide.RenderServer()
+    server._pool = pool
+    replacements = []
+    server._new_pool = lambda: replacements.append(_FailingPool(None)) or replacements[-1]
+    status, message = asyncio.run(server._render('application/json', body, ''))
+    return server, replacements, status, message
+
+def test_server_shuts_down_broken_pool_before_replacing_it():
+    from concurrent.futures.process import BrokenProcessPool
+    broken = _FailingPool(BrokenProcessPool("worker died"))
+    server, replacements, status, message = _render_with(broken)
+    assert status == 500
+    assert broken.shutdowns == [(False, True)]
+    assert server._pool is replacements[0]
+
+def test_server_error_response_hides_server_paths(capsys):
+    path = os.path.join(os.path.dirname(os.path.abspath(guide.__file__)), 'voltic', 'missing.png')
+    server, replacements, status, message = _render_with(
+        _FailingPool(FileNotFoundError(2, "No such file or directory", path)))
+    assert status == 422
+    assert path not in message and os.sep + 'voltic' not in message
+    assert path in capsys.readouterr().err
+    assert not replacements
+
+@pytest.mark.parametrize('level', [3.7, True, "5", None])
+def test_render_request_rejects_non_integer_compress_level(level):
+    body = json.dumps({'markdown': '# Title', 'compress_level': level}).encode()
+    with pytest.raises(ValueError, match="integer"):
+        guide.parse_render_request('application/json', body)
+
+def test_render_request_reads_compress_level_from_the_query():
+    assert guide.parse_render_request('text/markdown', b'# Title', 'compress_level=3')[2] == 3
+    for query in ('compress_level=3.7', 'compress_level=true', 'compress_level=-1'):
+        with pytest.raises(ValueError):
+            guide.parse_render_request('text/markdown', b'# Title', query)
+
+def test_server_renders_over_localhost():
+    import http.client
+
+    def post(port, body, query=''):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            connection.request('POST', '/render' + query, body, {'Content-Type': 'text/markdown'})
+            response = connection.getresponse()
+            return response.status, response.getheader('Content-Type'), response.read()
+        finally:
+            connection.close()
+
+    async def exchange():
+        server = guide.RenderServer(host='127.0.0.1', port=0, jobs=1)
+        await server.start()
+        try:
+            loop = asyncio.get_running_loop()
+            ok = await loop.run_in_executor(None, post, server.port, b'# Title\n\nBody text.\n')
+            bad = await loop.run_in_executor(None, post, server.port, b'# Title\n', '?compress_level=3.7')
+        finally:
+            await server.close()
+        return server.port, ok, bad
+
+    port, ok, bad = asyncio.run(exchange())
+    assert port != 0
+    status, content_type, body = ok
+    assert status == 200 and 'wordprocessingml' in content_type
+    with zipfile.ZipFile(io.BytesIO(body)) as z:
+        assert 'Body text.' in z.read('word/document.xml').decode()
+    assert bad[0] == 400 and b'integer' in bad[2]
+
+# ==================== IMAGE INGESTION ====================
+
+def test_image_ingestor_prepares_each_source_once_across_threads(tmp_path, monkeypatch):
+    import threading
+    import time
+    calls = []
+    lock = threading.Lock()
+
+    def slow_prepare(data, max_width_px, dpi=guide.IMAGE_DPI, quality=guide.IMAGE_JPEG_QUALITY):
+        with lock:
+            calls.append(data)
+        time.sleep(0.05)
+        return b'prepared:' + data
+
+    monkeypatch.setattr(guide, 'prepare_image', slow_prepare)
+    for name, data in (('a.png', b'A' * 100), ('copy-of-a.png', b'A' * 100), ('b.png', b'B' * 50)):
+        (tmp_path / name).write_bytes(data)
+    images = guide.ImageIngestor(str(tmp_path), cache_dir=None, jobs=8)
+    images.prefetch(['a.png', 'copy-of-a.png', 'b.png'] * 4 + ['a.png'])
+    # prefetch() dedupes paths, so hammer get() directly as well
+    threads = [threading.Thread(target=images.get, args=(src,)) for src in ['a.png', 'copy-of-a.png'] * 8]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == [b'A' * 100, b'B' * 50]
+    assert images.source_bytes == 150
+    assert images.get('copy-of-a.png') == b'prepared:' + b'A' * 100
+    assert len(images.prepared) == 2
+
+def test_image_ingestor_downscales_with_pillow(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    wide = Image.new('RGB', (2400, 300))
+    wide.putdata([(x % 256, (x * 7) % 256, (x * 13) % 256) for x in range(2400 * 300)])
+    wide.save(tmp_path / 'photo.png')
+    Image.new('RGB', (200, 100), (0, 112, 192)).save(tmp_path / 'flat.png')
+    (tmp_path / 'flat-copy.png').write_bytes((tmp_path / 'flat.png').read_bytes())
+
+    images = guide.ImageIngestor(str(tmp_path), cache_dir=str(tmp_path / 'cache'), jobs=4)
+    images.prefetch(['photo.png', 'flat.png', 'flat-copy.png'])
+    with Image.open(io.BytesIO(images.get('photo.png'))) as prepared:
+        assert prepared.width == images.max_width_px
+    # Few colours: stays a PNG, and never grows past the source
+    flat = images.get('flat.png')
+    assert flat.startswith(b'\x89PNG') and len(flat) <= (tmp_path / 'flat.png').stat().st_size
+    assert len(images.prepared) == 2
+    assert len(os.listdir(tmp_path / 'cache')) == 2
+
+    doc = guide.new_guide_document()
+    guide.render_markdown(doc, ["![Photo](photo.png)\n", "\n", "![Flat](flat-copy.png)\n"], images)
+    assert len(doc.inline_shapes) == 2
+    assert doc.inline_shapes[0].width == guide.IMAGE_WIDTH
+
+# ==================== BASE TEMPLATE CACHE ====================
+
+@pytest.fixture
+def template_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(guide, 'TEMPLATE_CACHE_DIR', str(cache_dir))
+    guide._base_template.cache_clear()
+    yield cache_dir
+    guide._base_template.cache_clear()
+
+def test_template_cache_is_private_data_only_and_identical(template_cache, guide_bytes):
+    cold = build(guide.create_voltic_user_guide)
+    cache_files = list(template_cache.iterdir())
+    assert [f.suffix for f in cache_files] == ['.template']
+    assert template_cache.stat().st_mode & 0o777 == 0o700
+    assert b'pickle' not in cache_files[0].read_bytes()
+    guide._base_template.cache_clear()
+    warm = build(guide.create_voltic_user_guide)
+    assert cold == warm == guide_bytes
+
+def test_template_cache_ignores_tampered_files(template_cache, guide_bytes):
+    import pickle
+    build(guide.create_voltic_user_guide)
+    (path,) = template_cache.iterdir()
+    good = path.read_bytes()
+    header, _, data = good.partition(b'\n')
+
+    class Exploit:
+        def __reduce__(self):
+            return (os.mkdir, (str(template_cache / 'pwned'),))
+
+    for tampered in (pickle.dumps(Exploit()), b'garbage', b'{"parts": 1}\n',
+                     header + b'\n' + data[:-1], b'\n'.join([header, data, b'extra'])):
+        path.write_bytes(tampered)
+        guide._base_template.cache_clear()
+        assert build(guide.create_voltic_user_guide) == guide_bytes
+        assert path.read_bytes() == good
+    assert not (template_cache / 'pwned').exists()
+
+@pytest.mark.parametrize('create', [
+    lambda d: guide.SectionCache(d),
+    lambda d: guide.make_cache_dir(d),
+], ids=['sections', 'helper'])
+def test_every_cache_makes_the_cache_root_private(template_cache, create):
+    template_cache.mkdir(mode=0o755)
+    template_cache.chmod(0o755)
+    create(str(template_cache / 'sub'))
+    assert template_cache.stat().st_mode & 0o777 == 0o700
+    assert (template_cache / 'sub').stat().st_mode & 0o777 == 0o700
+
+def test_plan_cache_is_json_and_validated_on_load(template_cache, spec_path):
+    cache_dir = str(template_cache / 'plans')
+    compiled = guide.compile_spec(SMALL_SPEC)
+    cold = guide.load_render_plan(spec_path, cache_dir)
+    assert template_cache.stat().st_mode & 0o777 == 0o700
+    (path,) = (template_cache / 'plans').iterdir()
+    assert path.suffix == '.json'
+    good = path.read_text(encoding='utf-8')
+    warm = guide.load_render_plan(spec_path, cache_dir)
+    assert (cold.sections, cold.toc_descriptions) == (warm.sections, warm.toc_descriptions) == compiled
+
+    sections, descriptions = json.loads(good)
+    for tampered in ([[["x", [[guide.OP_PARAGRAPH, "No Such Style", None, []]]]], descriptions],
+                     [[["x", [[99]]]], descriptions],
+                     [[["x", [[guide.OP_HEADING, "", 1]]]], descriptions],
+                     [sections, {"a": 1}], "garbage"):
+        path.write_text(json.dumps(tampered), encoding='utf-8')
+        plan = guide.load_render_plan(spec_path, cache_dir)
+        assert (plan.sections, plan.toc_descriptions) == compiled
+        assert path.read_text(encoding='utf-8') == good
+
+# ==================== BENCHMARK SAVE PATH ====================
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'stream': True},
+    {'deterministic': True, 'patch': True},
+    {'stream': True, 'deterministic': True, 'compress_level': 0},
+], ids=['package', 'stream', 'patch', 'stream-deterministic-stored'])
+def test_benchmark_writes_through_package_writer(options, monkeypatch):
+    import bench_formatted_docx as bench
+    writes = []
+    write_package = guide.write_package
+    monkeypatch.setattr(guide, 'write_package', lambda *args: writes.append(args) or write_package(*args))
+    result = bench.run_case('runs', 20, {**bench.DEFAULT_OPTIONS, **options})
+    assert result['size'] > 0
+    assert bool(writes) != bool(options.get('stream'))
+
+@pytest.mark.parametrize('name, scale', [('runs', 1000), ('guide', 1)])
+def test_benchmark_stream_flushes_as_it_builds(name, scale, monkeypatch):
+    import bench_formatted_docx as bench
+    peaks = []
+    flush = guide.StreamingDocxWriter.flush
+
+    def counting_flush(writer):
+        peaks.append(len(writer.doc.element.body))
+        flush(writer)
+
+    monkeypatch.setattr(guide.StreamingDocxWriter, 'flush', counting_flush)
+    bench.run_case(name, scale, {**bench.DEFAULT_OPTIONS, 'stream': True})
+    # Flushed during the build, not only on close, so the body never holds the whole document
+    assert len(peaks) > 2
+    assert max(peaks) <= guide.STREAM_FLUSH_BLOCKS + 2